@@ -0,0 +1,95 @@
+"""
+无界面的在线批处理守护进程，不依赖PyQt，可在无显示器的Linux服务器上运行：
+
+    python -m analysis_daemon --watch /data/产线1 --watch /data/产线2
+    python -m analysis_daemon --resume        # 监控 .env 中配置的文件夹，继续最近一次的检查点
+
+检查点、结果库和连续异常记录与界面中的在线批处理相同，界面可直接用于查看结果。
+收到 SIGTERM / SIGINT 后停止接收新图片，等待进行中的任务结束、压缩检查点后退出。
+"""
+from utils.batch_engine import BatchEngine, BatchEngineListener
+from utils.watch_sources import WatchSource, load_watch_sources, checkpoint_session
+import os
+import sys
+import signal
+import logging
+import argparse
+import datetime
+
+logger = logging.getLogger("analysis_daemon")
+
+CHECKPOINT_DIR = "temp/batch_processing_checkpoint"
+
+class DaemonListener(BatchEngineListener):
+    """守护进程没有界面，批次进度定期写入日志，其余事件引擎已记录"""
+    def __init__(self, report_every: int = 100):
+        self.report_every = max(1, report_every)
+
+    def on_batch_progress(self, current, total):
+        if current and (current % self.report_every == 0 or current == total):
+            logger.info(f"当前批处理进度 {current}/{total}")
+
+def latest_checkpoint() -> str:
+    """最近一次批处理的检查点（按会话时间戳），没有时返回 None"""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return None
+    sessions = sorted({checkpoint_session(f) for f in os.listdir(CHECKPOINT_DIR) if f.endswith('.json')})
+    return os.path.join(CHECKPOINT_DIR, sessions[-1]) if sessions else None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="analysis_daemon", description="无界面的在线批处理异常检测")
+    parser.add_argument('--watch', action='append', metavar='DIR',
+                        help="监控文件夹，可重复指定；未指定时使用 ONLINE_PROCESSING_AD_DIRS / ONLINE_PROCESSING_AD_DIR")
+    checkpoint_group = parser.add_mutually_exclusive_group()
+    checkpoint_group.add_argument('--checkpoint', metavar='FILE', help="使用指定的检查点文件（<时间戳>.json）")
+    checkpoint_group.add_argument('--resume', action='store_true', help="继续最近一次的检查点")
+    parser.add_argument('--log-file', metavar='FILE', help="日志同时写入该文件")
+    parser.add_argument('--log-level', default='INFO', help="日志级别，默认 INFO")
+    return parser.parse_args(argv)
+
+def setup_logging(log_level: str, log_file: str = None):
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    logging.basicConfig(level=getattr(logging, log_level.upper(), logging.INFO), handlers=handlers,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup_logging(args.log_level, args.log_file)
+
+    sources = [WatchSource(directory) for directory in args.watch] if args.watch else load_watch_sources()
+    if not sources:
+        logger.error("未指定监控文件夹：使用 --watch 或在 .env 中配置 ONLINE_PROCESSING_AD_DIR")
+        return 2
+    for source in sources:
+        if not os.path.exists(source.directory):
+            logger.warning(f"监控文件夹不存在，出现后自动开始处理: {source.directory}")
+
+    checkpoint_file = args.checkpoint
+    if args.resume:
+        checkpoint_file = latest_checkpoint()
+        if checkpoint_file is None:
+            logger.info("没有可继续的检查点，创建新检查点")
+    if checkpoint_file is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        checkpoint_file = os.path.join(CHECKPOINT_DIR, f"{timestamp}.json")
+    logger.info(f"使用检查点: {checkpoint_file}")
+
+    engine = BatchEngine(sources, checkpoint_file, enable_preview=False, listener=DaemonListener())
+
+    def handle_signal(signum, frame):
+        if engine.is_running:
+            logger.info(f"收到信号 {signal.Signals(signum).name}，正在停止（等待进行中的任务结束）...")
+        engine.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGBREAK'):
+        signal.signal(signal.SIGBREAK, handle_signal)
+
+    engine.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
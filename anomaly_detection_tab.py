@@ -9,7 +9,15 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QObject
 from PyQt5.QtGui import QPixmap, QFont
 from utils.ssh_client_anomaly_detection import SSHClient, SSHBatchDownload
+from utils.bulk_download import BulkDownloader, DownloadTask
+from utils.remote_state_index import get_remote_state_index
+from utils.checkpoint_journal import read_checkpoint
+from utils.job_scheduler import get_job_scheduler, INTERACTIVE, PREVIEW, BULK
+from utils.watch_sources import load_watch_sources, checkpoint_session
+from utils.batch_engine import BatchEngine, record_result
+from utils.anomaly_rules import parse_record_time
 import queue
+import threading
 from dotenv import load_dotenv
 import tempfile
 import shutil
@@ -21,91 +29,78 @@ from pathlib import Path
 # 设置日志
 logger = logging.getLogger(__name__)
 
-class AsyncImageDownloadThread(QThread):
-    """异步图片下载线程"""
-    download_finished = pyqtSignal(str, str, str)  # process_id, prediction_path, heatmap_path
+class PreviewDownloadPool(QObject):
+    """
+    预览图下载线程池：固定数量的工作线程复用连接池中的连接并行下载热力图和预测图。
+    界面只显示最新一张预览，因此排队中已被更新请求取代的旧请求会被丢弃，
+    晚于更新请求完成的旧下载也不再通知界面。
+    """
+    download_finished = pyqtSignal(str)  # process_id
     download_failed = pyqtSignal(str)  # process_id
     
-    def __init__(self, process_id):
-        super().__init__()
-        self.process_id = process_id
-        
-    def run(self):
-        try:
-            logger.info(f"开始异步下载热力图和预测图: {self.process_id}")
-            
-            # 使用SSHBatchDownload创建独立SSH连接
-            ssh_download = SSHBatchDownload()
-            
-            # 调用handle_download_heatmap_predition方法下载
-            prediction_path, heatmap_path = ssh_download.handle_download_heatmap_predition(self.process_id)
-            
-            logger.info(f"异步下载完成: {self.process_id}")
-            logger.info(f"预测图路径: {prediction_path}")
-            logger.info(f"热力图路径: {heatmap_path}")
-            
-            self.download_finished.emit(self.process_id, prediction_path, heatmap_path)
-            
-        except Exception as e:
-            error_msg = f"异步下载失败 {self.process_id}: {str(e)}"
-            logger.error(error_msg)
-            self.download_failed.emit(self.process_id)
-
-class DownloadQueueManager(QObject):
-    """下载队列管理器，确保一次只下载一张图片"""
-    request_download = pyqtSignal(str)  # process_id
-    
-    def __init__(self):
+    def __init__(self, workers: int = 2, keep_latest: int = 1):
         super().__init__()
         self.download_queue = queue.Queue()
-        self.current_download_thread = None
-        self.is_downloading = False
+        self.lock = threading.Lock()
+        self.generation = 0  # 最新请求的序号
+        self.shown_generation = 0  # 已通知界面的最新序号
+        self.keep_latest = max(1, keep_latest)  # 排队中保留的最新请求数
+        self.is_running = True
+        self.workers = []
+        for index in range(max(1, workers)):
+            worker = threading.Thread(target=self.download_worker, name=f"preview-download-{index}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"预览图下载线程池已启动，工作线程数: {len(self.workers)}")
         
     def add_to_queue(self, process_id):
-        """添加下载任务到队列"""
-        logger.info(f"添加下载任务到队列: {process_id}")
-        self.download_queue.put(process_id)
-        self.process_next_download()
-        
-    def process_next_download(self):
-        """处理下一个下载任务"""
-        if self.is_downloading:
-            logger.info("当前有下载任务进行中，等待完成")
-            return
+        """添加下载任务"""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        logger.info(f"添加预览下载任务: {process_id}")
+        self.download_queue.put((generation, process_id))
+        
+    def download_worker(self):
+        """工作线程：取出任务，跳过已过期的请求后下载"""
+        ssh_download = SSHBatchDownload()
+        while self.is_running:
+            item = self.download_queue.get()
+            if item is None:
+                break
+            generation, process_id = item
+            with self.lock:
+                stale = generation <= self.generation - self.keep_latest
+            if stale:
+                logger.info(f"预览请求已被更新的图片取代，跳过下载: {process_id}")
+                continue
             
-        if self.download_queue.empty():
-            logger.info("下载队列为空")
-            return
+            try:
+                logger.info(f"开始异步下载热力图和预测图: {process_id}")
+                # 预览下载排在单图检测和在线批处理之后
+                with get_job_scheduler().slot(PREVIEW, cancelled=lambda: not self.is_running):
+                    prediction_path, heatmap_path = ssh_download.handle_download_heatmap_predition(process_id)
+                logger.info(f"异步下载完成: {process_id}")
+                logger.info(f"预测图路径: {prediction_path}")
+                logger.info(f"热力图路径: {heatmap_path}")
+            except Exception as e:
+                logger.error(f"异步下载失败 {process_id}: {str(e)}")
+                self.download_failed.emit(process_id)
+                continue
             
-        process_id = self.download_queue.get()
-        logger.info(f"开始处理下载任务: {process_id}")
-        
-        self.is_downloading = True
-        self.current_download_thread = AsyncImageDownloadThread(process_id)
-        self.current_download_thread.download_finished.connect(self.on_download_finished)
-        self.current_download_thread.download_failed.connect(self.on_download_failed)
-        self.current_download_thread.start()
-        
-    def on_download_finished(self, process_id, prediction_path, heatmap_path):
-        """下载完成回调"""
-        logger.info(f"下载任务完成: {process_id}")
-        self.is_downloading = False
-        self.current_download_thread = None
-        
-        # 发射信号通知主界面更新显示
-        self.request_download.emit(process_id)
-        
-        # 处理下一个下载任务
-        self.process_next_download()
-        
-    def on_download_failed(self, process_id):
-        """下载失败回调"""
-        logger.error(f"下载任务失败: {process_id}")
-        self.is_downloading = False
-        self.current_download_thread = None
-        
-        # 处理下一个下载任务
-        self.process_next_download()
+            # 只通知比已显示的预览更新的结果，避免旧图覆盖新图
+            with self.lock:
+                if generation <= self.shown_generation:
+                    logger.info(f"已有更新的预览，不再显示: {process_id}")
+                    continue
+                self.shown_generation = generation
+            self.download_finished.emit(process_id)
+    
+    def shutdown(self):
+        """停止所有工作线程（不等待进行中的下载）"""
+        self.is_running = False
+        for _ in self.workers:
+            self.download_queue.put(None)
 
 class ImageProcessingThread(QThread):
     """图片处理线程"""
@@ -125,7 +120,13 @@ class ImageProcessingThread(QThread):
             self.progress.emit("正在处理图片...")
             
             # 调用SSH客户端处理图片
-            local_result_pre_image, local_result_heat_map, local_result_json = ssh_client.process_images(self.image_path)
+            start_time = time.time()
+            # 单图检测优先级最高，不必排在批处理积压之后
+            with get_job_scheduler().slot(INTERACTIVE):
+                local_result_pre_image, local_result_heat_map, local_result_json = ssh_client.process_images(self.image_path)
+            record_result(self.image_path, ssh_client,
+                          (local_result_pre_image, local_result_heat_map, local_result_json),
+                          'single', {'total': time.time() - start_time})
             
             self.finished.emit(local_result_pre_image, local_result_heat_map, local_result_json)
             
@@ -194,7 +195,6 @@ class CheckpointSelectionDialog(QDialog):
     def load_checkpoint_info(self):
         """加载检查点文件信息"""
         for checkpoint_file in self.checkpoint_files:
-            file_path = os.path.join(self.checkpoint_dir, checkpoint_file)
             try:
                 # 解析文件名中的时间戳
                 timestamp_str = checkpoint_file.replace('.json', '')
@@ -204,20 +204,23 @@ class CheckpointSelectionDialog(QDialog):
                 except:
                     create_time_str = "未知时间"
                 
-                # 读取检查点文件信息
+                # 读取检查点文件信息（多个监控文件夹时合计该批处理下各文件夹的检查点）
                 processed_count = 0
                 last_update = "未知"
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        checkpoint_data = json.load(f)
-                        processed_count = len(checkpoint_data.get('processed_images', []))
-                        last_update_str = checkpoint_data.get('last_update', '')
-                        if last_update_str:
-                            try:
-                                last_update_dt = datetime.datetime.fromisoformat(last_update_str)
-                                last_update = last_update_dt.strftime("%Y-%m-%d %H:%M:%S")
-                            except:
-                                last_update = "未知"
+                last_update_str = ''
+                session_files = [f for f in os.listdir(self.checkpoint_dir)
+                                 if f.endswith('.json') and checkpoint_session(f) == checkpoint_file]
+                for session_file in session_files:
+                    checkpoint_data = read_checkpoint(os.path.join(self.checkpoint_dir, session_file))
+                    processed_count += len(checkpoint_data.get('processed_images', []))
+                    last_update_str = max(last_update_str, checkpoint_data.get('last_update', '') or '')
+                if session_files:
+                    if last_update_str:
+                        try:
+                            last_update_dt = datetime.datetime.fromisoformat(last_update_str)
+                            last_update = last_update_dt.strftime("%Y-%m-%d %H:%M:%S")
+                        except:
+                            last_update = "未知"
                 
                 # 创建列表项
                 item_text = f"{checkpoint_file}\n创建时间: {create_time_str} | 已处理: {processed_count} 张图片 | 最后更新: {last_update}"
@@ -334,10 +337,11 @@ class BatchDownloadSelectionDialog(QDialog):
                 file_path = os.path.join(checkpoint_dir, checkpoint_file)
                 self.add_file_to_list(self.checkpoint_list, file_path, checkpoint_file, "检查点")
         
-        # 加载连续异常文件
+        # 加载连续异常文件（按文件名中的时间从新到旧）
         anomaly_dir = "temp/consecutive_anomalies"
         if os.path.exists(anomaly_dir):
             anomaly_files = [f for f in os.listdir(anomaly_dir) if f.endswith('.json')]
+            anomaly_files.sort(key=lambda f: parse_record_time(f) or datetime.datetime.min, reverse=True)
             for anomaly_file in anomaly_files:
                 file_path = os.path.join(anomaly_dir, anomaly_file)
                 self.add_file_to_list(self.anomaly_list, file_path, anomaly_file, "连续异常")
@@ -345,23 +349,22 @@ class BatchDownloadSelectionDialog(QDialog):
     def add_file_to_list(self, list_widget, file_path, filename, file_type):
         """添加文件到列表"""
         try:
-            # 解析文件名中的时间戳
-            timestamp_str = filename.replace('.json', '')
-            try:
-                create_time = datetime.datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                create_time_str = create_time.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                create_time_str = "未知时间"
+            # 解析文件名中的时间戳（<时间戳>.json、<时间戳>__<文件夹名>.json、<时间戳>_<微秒>_<文件夹名>_<规则名>.json）
+            create_time = parse_record_time(filename)
+            create_time_str = create_time.strftime("%Y-%m-%d %H:%M:%S") if create_time else "未知时间"
             
             # 读取文件信息
             processed_count = 0
+            description = ''
             if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    file_data = json.load(f)
-                    processed_count = len(file_data.get('processed_images', []))
+                file_data = read_checkpoint(file_path)
+                processed_count = len(file_data.get('processed_images', []))
+                # 连续异常记录中保存了触发规则的说明
+                if file_data.get('description'):
+                    description = f" | 规则: {file_data['description']}"
             
             # 创建列表项
-            item_text = f"{filename}\n创建时间: {create_time_str} | 类型: {file_type} | 图片数量: {processed_count}"
+            item_text = f"{filename}\n创建时间: {create_time_str} | 类型: {file_type} | 图片数量: {processed_count}{description}"
             item = QListWidgetItem(item_text)
             item.setData(Qt.UserRole, file_path)
             list_widget.addItem(item)
@@ -400,288 +403,55 @@ class BatchProcessingThread(QThread):
     batch_finished = pyqtSignal()         # 批处理完成信号
     image_processed = pyqtSignal(str, str, str)  # 单张图片处理完成信号
     batch_progress = pyqtSignal(int, int) # 批处理进度信号（当前进度，总数量）
-    consecutive_anomaly_detected = pyqtSignal(list)  # 连续异常检测信号，传递异常图片列表
+    consecutive_anomaly_detected = pyqtSignal(str, list)  # 连续异常检测信号，传递触发规则说明和异常图片列表
     request_async_download = pyqtSignal(str)  # 请求异步下载信号
     update_preview = pyqtSignal(str)      # 更新图片预览信号，传递图片路径
     
-    def __init__(self, processing_dir, checkpoint_file=None, enable_preview=False):
+    def __init__(self, sources, checkpoint_file=None, enable_preview=False):
+        """
+        Args:
+            sources: 监控文件夹列表（WatchSource），也可以是单个文件夹路径
+            checkpoint_file: 本次批处理的检查点（多个文件夹时各文件夹的检查点由它派生）
+            enable_preview: 是否启用预览
+        """
         super().__init__()
-        self.processing_dir = processing_dir
-        self.checkpoint_file = checkpoint_file
-        self.enable_preview = enable_preview  # 是否启用预览
-        self.processed_images = {}  # 改为字典，存储图片路径和对应的处理信息
-        self.is_running = True
-        self.polling_interval = 5  # 轮询间隔5秒
-        self.current_batch_images = []  # 当前批次的图片列表
-        self.current_batch_processed = 0  # 当前批次已处理的图片数量
-        
-        # 连续异常检测相关变量
-        self.consecutive_anomalies_count = 0  # 连续异常计数器
-        self.anomaly_images_list = []  # 异常图片记录列表
-        self.anomalies_dir = "temp/consecutive_anomalies"  # 异常记录保存目录
+        # 监控、流水线、检查点和连续异常检测都在不依赖Qt的引擎中，本线程只把引擎事件转为信号
+        self.engine = BatchEngine(sources, checkpoint_file, enable_preview, listener=self)
         
     def run(self):
-        try:
-            logger.info(f"批处理启动，监控文件夹: {self.processing_dir}")
-            
-            # 加载检查点
-            if self.checkpoint_file and os.path.exists(self.checkpoint_file):
-                self.load_checkpoint()
-            
-            while self.is_running:
-                # 扫描图片
-                image_files = self.scan_images()
-                
-                if image_files:
-                    # 过滤掉已处理的图片
-                    new_images = [img for img in image_files if img not in self.processed_images]
-                    
-                    if new_images:
-                        logger.info(f"扫描到 {len(new_images)} 张新图片待处理")
-                        # 设置当前批次
-                        self.current_batch_images = new_images
-                        self.current_batch_processed = 0
-                        
-                        # 发送批次开始信号
-                        self.batch_progress.emit(0, len(new_images))
-                        
-                        # 处理图片
-                        for image_path in new_images:
-                            if not self.is_running:
-                                logger.info("批处理被中断，停止处理图片")
-                                break
-                                
-                            self.process_image(image_path)
-                            self.current_batch_processed += 1
-                            
-                            # 发送进度更新信号
-                            self.batch_progress.emit(self.current_batch_processed, len(new_images))
-                    else:
-                        logger.info("无新图片待处理")
-                            
-                # 等待下一次轮询，使用更短的间隔并检查停止标志
-                for _ in range(self.polling_interval * 10):  # 将5秒拆分为50个0.1秒
-                    if not self.is_running:
-                        break
-                    time.sleep(0.1)
-                
-            logger.info("批处理已停止")
-            self.batch_finished.emit()
-            
-        except Exception as e:
-            error_msg = f"批处理线程异常: {str(e)}"
-            logger.error(error_msg)
-            self.error.emit(error_msg)
+        self.engine.run()
     
-    def scan_images(self):
-        """扫描指定目录中的图片文件"""
-        try:
-            if not os.path.exists(self.processing_dir):
-                logger.warning(f"监控文件夹不存在: {self.processing_dir}")
-                return []
-                
-            valid_extensions = ['.png', '.jpg', '.jpeg']
-            image_files = []
-            
-            for filename in os.listdir(self.processing_dir):
-                file_path = os.path.join(self.processing_dir, filename)
-                if os.path.isfile(file_path):
-                    _, ext = os.path.splitext(filename.lower())
-                    if ext in valid_extensions:
-                        image_files.append(file_path)
-            
-            # 按创建时间排序（旧的在前，新的在后）
-            image_files.sort(key=lambda x: os.path.getctime(x))
-            
-            return image_files
-            
-        except Exception as e:
-            logger.error(f"扫描图片失败: {str(e)}")
-            return []
+    def stop(self):
+        """停止批处理"""
+        self.engine.stop()
     
-    def process_image(self, image_path):
-        """处理单张图片"""
-        try:
-            logger.info(f"开始处理图片: {os.path.basename(image_path)}")
-            self.progress.emit(f"正在处理图片: {os.path.basename(image_path)}")
-            
-            # 更新图片预览
-            self.update_preview.emit(image_path)
-            
-            # 使用现有的图片处理逻辑
-            ssh_client = SSHClient(batch_process=True)
-            local_result_pre_image, local_result_heat_map, local_result_json = ssh_client.process_images(image_path)
-            
-            # 记录已处理的图片和对应的process_id
-            self.processed_images[image_path] = {
-                'file_path': image_path,
-                'process_id': ssh_client.process_id,
-                'processed_time': datetime.datetime.now().isoformat()
-            }
-            
-            # 更新检查点
-            if self.checkpoint_file:
-                self.update_checkpoint()
-            
-            logger.info(f"图片处理完成: {os.path.basename(image_path)} (process_id: {ssh_client.process_id})")
-            self.progress.emit(f"图片处理完成: {os.path.basename(image_path)}")
-            
-            # 检查是否为异常图片并更新连续异常计数
-            self.check_anomaly_and_update_count(image_path, ssh_client.process_id, local_result_json)
-            
-            # 如果启用预览，请求异步下载热力图和预测图
-            if self.enable_preview:
-                logger.info(f"启用预览模式，请求异步下载: {ssh_client.process_id}")
-                self.request_async_download.emit(ssh_client.process_id)
-            
-            # 发送处理完成信号
-            self.image_processed.emit(local_result_pre_image, local_result_heat_map, local_result_json)
-            
-        except Exception as e:
-            error_msg = f"图片处理失败: {os.path.basename(image_path)} - {str(e)}"
-            logger.error(error_msg)
-            self.error.emit(error_msg)
-            # 批处理状态下不弹出错误提示，继续处理下一张
+    def on_progress(self, message):
+        self.progress.emit(message)
     
-    def load_checkpoint(self):
-        """加载检查点文件"""
-        try:
-            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
-                checkpoint_data = json.load(f)
-                processed_images_data = checkpoint_data.get('processed_images', [])
-                
-                # 兼容新旧格式的checkpoint文件
-                if processed_images_data and isinstance(processed_images_data[0], dict):
-                    # 新格式：包含process_id和处理信息的字典列表
-                    self.processed_images = {}
-                    for item in processed_images_data:
-                        file_path = item.get('file_path')
-                        if file_path:
-                            self.processed_images[file_path] = item
-                else:
-                    # 旧格式：只有文件路径的列表
-                    self.processed_images = {}
-                    for file_path in processed_images_data:
-                        self.processed_images[file_path] = {
-                            'file_path': file_path,
-                            'process_id': 'unknown',  # 旧格式没有process_id
-                            'processed_time': 'unknown'
-                        }
-                
-            logger.info(f"加载检查点，已处理 {len(self.processed_images)} 张图片")
-        except Exception as e:
-            logger.error(f"加载检查点失败: {str(e)}")
+    def on_error(self, message):
+        self.error.emit(message)
     
-    def update_checkpoint(self):
-        """更新检查点文件"""
-        try:
-            checkpoint_dir = os.path.dirname(self.checkpoint_file)
-            if not os.path.exists(checkpoint_dir):
-                os.makedirs(checkpoint_dir)
-                
-            # 将字典值转换为列表，只保留处理信息
-            processed_images_list = list(self.processed_images.values())
-            
-            checkpoint_data = {
-                'processed_images': processed_images_list,
-                'last_update': datetime.datetime.now().isoformat()
-            }
-            
-            with open(self.checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint_data, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            logger.error(f"更新检查点失败: {str(e)}")
+    def on_finished(self):
+        self.batch_finished.emit()
     
-    def stop(self):
-        """停止批处理"""
-        self.is_running = False
+    def on_image_processed(self, prediction_path, heatmap_path, json_path):
+        self.image_processed.emit(prediction_path, heatmap_path, json_path)
     
-    def check_anomaly_and_update_count(self, image_path, process_id, json_path):
-        """检查是否为异常图片并更新连续异常计数"""
-        try:
-            if os.path.exists(json_path):
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                
-                anomaly_level = json_data.get('anomaly_level', '')
-                
-                # 判断是否为异常图片（根据现有的异常级别判断逻辑）
-                if anomaly_level in ['中等异常可能性', '很可能异常']:
-                    # 异常图片，增加计数并记录
-                    self.consecutive_anomalies_count += 1
-                    
-                    # 记录异常图片信息
-                    anomaly_info = {
-                        'file_path': image_path,
-                        'process_id': process_id,
-                        'processed_time': datetime.datetime.now().isoformat()
-                    }
-                    self.anomaly_images_list.append(anomaly_info)
-                    
-                    logger.info(f"检测到异常图片: {os.path.basename(image_path)} (异常级别: {anomaly_level})")
-                    logger.info(f"连续异常计数: {self.consecutive_anomalies_count}")
-                    
-                    # 检查是否达到15次连续异常
-                    if self.consecutive_anomalies_count >= 15:
-                        self.handle_consecutive_anomalies()
-                else:
-                    # 正常图片，重置计数器
-                    if self.consecutive_anomalies_count > 0:
-                        logger.info(f"检测到正常图片，重置连续异常计数 (原计数: {self.consecutive_anomalies_count})")
-                    self.consecutive_anomalies_count = 0
-                    self.anomaly_images_list = []  # 清空异常记录列表
-                    
-        except Exception as e:
-            logger.error(f"检查异常图片失败: {str(e)}")
+    def on_batch_progress(self, current, total):
+        self.batch_progress.emit(current, total)
     
-    def handle_consecutive_anomalies(self):
-        """处理连续15次异常的情况"""
-        try:
-            logger.warning(f"检测到连续 {self.consecutive_anomalies_count} 次异常，触发警告")
-            
-            # 发送信号通知主界面
-            self.consecutive_anomaly_detected.emit(self.anomaly_images_list)
-            
-            # 保存异常记录到文件
-            self.save_anomaly_record()
-            
-            # 重置计数器
-            self.consecutive_anomalies_count = 0
-            self.anomaly_images_list = []
-            
-        except Exception as e:
-            logger.error(f"处理连续异常失败: {str(e)}")
+    def on_consecutive_anomaly(self, description, anomaly_images_list):
+        self.consecutive_anomaly_detected.emit(description, anomaly_images_list)
     
-    def save_anomaly_record(self):
-        """保存异常记录到文件"""
-        try:
-            # 确保目录存在
-            if not os.path.exists(self.anomalies_dir):
-                os.makedirs(self.anomalies_dir)
-            
-            # 创建时间戳文件名
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            checkpoint_file = os.path.join(self.anomalies_dir, f"{timestamp}.json")
-            
-            # 准备保存的数据
-            anomaly_data = {
-                "processed_images": self.anomaly_images_list,
-                "last_update": datetime.datetime.now().isoformat()
-            }
-            
-            # 保存到文件
-            with open(checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump(anomaly_data, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"连续异常记录已保存: {checkpoint_file}")
-            
-        except Exception as e:
-            logger.error(f"保存异常记录失败: {str(e)}")
+    def on_request_download(self, process_id):
+        self.request_async_download.emit(process_id)
+    
+    def on_preview(self, image_path):
+        self.update_preview.emit(image_path)
     
     def terminate(self):
         """强制终止批处理线程"""
-        self.is_running = False
+        self.engine.stop()
         if self.isRunning():
             super().terminate()
             logger.info("强制终止批处理线程")
@@ -691,13 +461,16 @@ class BatchDownloadThread(QThread):
     progress = pyqtSignal(str)            # 进度信号
     error = pyqtSignal(str)               # 错误信号
     download_finished = pyqtSignal()      # 下载完成信号
-    download_progress = pyqtSignal(int, int)  # 下载进度信号（当前进度，总数量）
+    download_progress = pyqtSignal(int, int, float, float)  # 下载进度信号（已完成文件数，文件总数，字节/秒，预计剩余秒数，未知时为-1）
     
     def __init__(self, selected_files):
         super().__init__()
         self.selected_files = selected_files
         self.is_running = True
         self.process_ids = []
+        self.downloader = None
+        load_dotenv()
+        self.workers = int(os.getenv('BULK_DOWNLOAD_WORKERS', 4))  # 并行下载线程数
         
     def run(self):
         try:
@@ -713,36 +486,22 @@ class BatchDownloadThread(QThread):
             logger.info(f"提取到 {len(self.process_ids)} 个处理ID")
             self.progress.emit(f"开始批量下载，共 {len(self.process_ids)} 个处理结果")
             
-            # 创建SSHBatchDownload实例
-            ssh_download = SSHBatchDownload()
-            
-            # 连接服务器
-            ssh_download.connect()
-            
-            # 批量下载结果文件
-            total_files = len(self.process_ids)
-            for i, process_id in enumerate(self.process_ids):
-                if not self.is_running:
-                    logger.info("批量下载被中断")
-                    break
-                
-                try:
-                    # 下载单个处理结果
-                    self.download_single_result(ssh_download, process_id)
-                    
-                    # 更新进度
-                    current_progress = i + 1
-                    self.download_progress.emit(current_progress, total_files)
-                    self.progress.emit(f"下载进度: {current_progress}/{total_files} - {process_id}")
-                    
-                except Exception as e:
-                    error_msg = f"下载失败 {process_id}: {str(e)}"
-                    logger.error(error_msg)
-                    self.error.emit(error_msg)
-                    continue
-            
-            # 关闭连接
-            ssh_download.close()
+            # 多个工作线程经连接池并行下载，未完成的文件以 .part 保存，下次从断点继续
+            tasks, state_index = self.build_download_tasks()
+            self.downloader = BulkDownloader(
+                SSHBatchDownload,
+                workers=self.workers,
+                progress_callback=self.report_progress,
+                state_index=state_index,
+                scheduler=get_job_scheduler(),
+                job_class=BULK
+            )
+            if not self.is_running:
+                self.downloader.stop()
+            completed, failed = self.downloader.download(tasks)
+            for task, error in failed:
+                self.error.emit(f"下载失败 {task.remote_path}: {error}")
+            logger.info(f"远程任务调度统计: {get_job_scheduler().format_stats()}")
             
             if self.is_running:
                 logger.info("批量下载完成")
@@ -766,57 +525,68 @@ class BatchDownloadThread(QThread):
         for file_path in self.selected_files:
             try:
                 if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        file_data = json.load(f)
+                    file_data = read_checkpoint(file_path)
                     
-                    # 从文件中提取process_ids
+                    # 从文件中提取process_ids（旧格式检查点没有process_id）
                     processed_images = file_data.get('processed_images', [])
                     for image_info in processed_images:
                         process_id = image_info.get('process_id')
-                        if process_id and process_id not in self.process_ids:
+                        if process_id and process_id != 'unknown' and process_id not in self.process_ids:
                             self.process_ids.append(process_id)
                             
             except Exception as e:
                 logger.error(f"提取process_ids失败 {file_path}: {str(e)}")
                 continue
     
-    def download_single_result(self, ssh_download, process_id):
-        """下载单个处理结果"""
+    def build_download_tasks(self):
+        """
+        为每个处理ID生成预测图和热力图两个下载任务。
+        先用远程状态索引一次列出 output/，跳过远程没有结果的处理ID和本地已完整的文件。
+        Returns:
+            tuple: (下载任务列表, 远程状态索引)
+        """
+        ssh_download = SSHBatchDownload()
+        state_index = get_remote_state_index(ssh_download.host, ssh_download.port, ssh_download.remote_result_dir_path)
+        ssh_download.connect()
         try:
-            # 本地下载地址
+            existing_ids = state_index.filter_existing(ssh_download.sftp, self.process_ids)
+        finally:
+            ssh_download.close()
+        missing_count = len(self.process_ids) - len(existing_ids)
+        if missing_count:
+            logger.warning(f"{missing_count} 个处理ID在服务器上没有结果，跳过下载")
+        
+        tasks = []
+        for process_id in existing_ids:
             local_result_dir = os.path.join(ssh_download.local_download_dir, process_id)
-            local_result_pre_image = os.path.join(local_result_dir, 'prediction.png')
-            local_result_heat_map = os.path.join(local_result_dir, 'heat_map.png')
-            
-            # 远程结果文件路径
-            remote_result_pre_image = os.path.join(ssh_download.remote_result_dir_path, process_id, f"{process_id}.png").replace('\\', '/')
-            remote_result_heat_map = os.path.join(ssh_download.remote_result_dir_path, process_id, f"{process_id}_heatmap.png").replace('\\', '/')
-            
-            # 确保本地目录存在
-            if not os.path.exists(local_result_dir):
-                os.makedirs(local_result_dir)
-            
-            # 下载预测图
-            if not os.path.exists(local_result_pre_image):
-                ssh_download.sftp.get(remotepath=remote_result_pre_image, localpath=local_result_pre_image)
-                logger.info(f"成功下载预测图: {local_result_pre_image}")
-            
-            # 下载热力图
-            if not os.path.exists(local_result_heat_map):
-                ssh_download.sftp.get(remotepath=remote_result_heat_map, localpath=local_result_heat_map)
-                logger.info(f"成功下载热力图: {local_result_heat_map}")
-            
-        except Exception as e:
-            logger.error(f"下载单个结果失败 {process_id}: {str(e)}")
-            raise e
+            remote_result_dir = os.path.join(ssh_download.remote_result_dir_path, process_id)
+            tasks.append(DownloadTask(
+                os.path.join(remote_result_dir, f"{process_id}.png").replace('\\', '/'),
+                os.path.join(local_result_dir, 'prediction.png')
+            ))
+            tasks.append(DownloadTask(
+                os.path.join(remote_result_dir, f"{process_id}_heatmap.png").replace('\\', '/'),
+                os.path.join(local_result_dir, 'heat_map.png')
+            ))
+        pending_tasks = [task for task in tasks if not os.path.exists(task.local_path)]
+        logger.info(f"共 {len(tasks)} 个结果文件，本地已存在 {len(tasks) - len(pending_tasks)} 个")
+        return pending_tasks, state_index
+    
+    def report_progress(self, current, total, throughput, eta):
+        """转发下载进度（文件数、吞吐量、预计剩余时间）"""
+        self.download_progress.emit(current, total, throughput, eta)
     
     def stop(self):
         """停止下载"""
         self.is_running = False
+        if self.downloader is not None:
+            self.downloader.stop()
     
     def terminate(self):
         """强制终止下载线程"""
         self.is_running = False
+        if self.downloader is not None:
+            self.downloader.stop()
         if self.isRunning():
             super().terminate()
             logger.info("强制终止批量下载线程")
@@ -832,8 +602,12 @@ class AnomalyDetectionWidget(QWidget):
         self.download_thread = None  # 下载线程
         self.is_downloading = False  # 下载状态
         
-        # 创建下载队列管理器
-        self.download_queue_manager = DownloadQueueManager()
+        # 创建预览图下载线程池
+        load_dotenv()
+        self.download_queue_manager = PreviewDownloadPool(
+            workers=int(os.getenv('PREVIEW_DOWNLOAD_WORKERS', 2)),
+            keep_latest=int(os.getenv('PREVIEW_DOWNLOAD_KEEP_LATEST', 1))
+        )
         
         self.init_ui()
         self.setup_logging()
@@ -1376,30 +1150,33 @@ class AnomalyDetectionWidget(QWidget):
         logger.info("异常检测系统启动")
         
     def setup_download_queue(self):
-        """设置下载队列管理器"""
-        # 连接下载队列管理器的信号
-        self.download_queue_manager.request_download.connect(self.on_async_download_finished)
+        """设置预览图下载线程池"""
+        # 连接下载线程池的信号
+        self.download_queue_manager.download_finished.connect(self.on_async_download_finished)
         
     def start_batch_processing(self):
         """启动在线批处理"""
         try:
-            # 检查环境变量
-            load_dotenv()
-            processing_dir = os.getenv('ONLINE_PROCESSING_AD_DIR')
-            if not processing_dir:
-                QMessageBox.warning(self, "配置错误", "未找到ONLINE_PROCESSING_AD_DIR环境变量")
+            # 检查环境变量（ONLINE_PROCESSING_AD_DIRS 配置多个文件夹，或单个 ONLINE_PROCESSING_AD_DIR）
+            sources = load_watch_sources()
+            if not sources:
+                QMessageBox.warning(self, "配置错误", "未找到ONLINE_PROCESSING_AD_DIR或ONLINE_PROCESSING_AD_DIRS环境变量")
                 return
                 
-            # 检查文件夹是否存在
-            if not os.path.exists(processing_dir):
-                QMessageBox.warning(self, "文件夹不存在", f"指定的监控文件夹不存在: {processing_dir}")
+            # 检查文件夹是否存在：全部不存在时不启动，部分不存在时记录警告，文件夹出现后自动开始处理
+            missing_dirs = [source.directory for source in sources if not os.path.exists(source.directory)]
+            if len(missing_dirs) == len(sources):
+                QMessageBox.warning(self, "文件夹不存在", f"指定的监控文件夹不存在: {', '.join(missing_dirs)}")
                 return
+            for missing_dir in missing_dirs:
+                logger.warning(f"监控文件夹不存在: {missing_dir}")
             
-            # 检查检查点文件
+            # 检查检查点文件（多个文件夹时按批处理会话合并显示）
             checkpoint_dir = "temp/batch_processing_checkpoint"
             checkpoint_files = []
             if os.path.exists(checkpoint_dir):
-                checkpoint_files = [f for f in os.listdir(checkpoint_dir) if f.endswith('.json')]
+                checkpoint_files = list(dict.fromkeys(
+                    checkpoint_session(f) for f in os.listdir(checkpoint_dir) if f.endswith('.json')))
             
             checkpoint_file = None
             if checkpoint_files:
@@ -1430,7 +1207,7 @@ class AnomalyDetectionWidget(QWidget):
             logger.info(f"用户选择预览模式: {enable_preview}")
             
             # 启动批处理线程
-            self.batch_thread = BatchProcessingThread(processing_dir, checkpoint_file, enable_preview)
+            self.batch_thread = BatchProcessingThread(sources, checkpoint_file, enable_preview)
             self.batch_thread.progress.connect(self.on_batch_progress)
             self.batch_thread.error.connect(self.on_batch_error)
             self.batch_thread.batch_finished.connect(self.on_batch_finished)
@@ -1448,7 +1225,7 @@ class AnomalyDetectionWidget(QWidget):
             self.batch_status_label.setText("批处理状态: 运行中")
             self.batch_status_label.setStyleSheet("color: green; font-size: 10px;")
             
-            logger.info(f"在线批处理已启动，监控文件夹: {processing_dir}")
+            logger.info(f"在线批处理已启动，监控文件夹: {', '.join(source.directory for source in sources)}")
             
         except Exception as e:
             error_msg = f"启动批处理失败: {str(e)}"
@@ -1520,16 +1297,16 @@ class AnomalyDetectionWidget(QWidget):
         else:
             self.batch_status_label.setText("批处理状态: 运行中")
     
-    def on_consecutive_anomaly_detected(self, anomaly_images_list):
+    def on_consecutive_anomaly_detected(self, description, anomaly_images_list):
         """连续异常检测回调"""
         try:
-            logger.warning(f"检测到连续15次异常，共{len(anomaly_images_list)}张异常图片")
+            logger.warning(f"检测到{description}，共{len(anomaly_images_list)}张图片")
             
             # 创建弹窗提示
             msg_box = QMessageBox(self)
             msg_box.setWindowTitle("连续异常检测警告")
-            msg_box.setText(f"检测到连续15次异常！")
-            msg_box.setInformativeText(f"共检测到 {len(anomaly_images_list)} 张异常图片\n异常记录已保存到 temp/consecutive_anomalies/ 目录")
+            msg_box.setText(f"检测到{description}！")
+            msg_box.setInformativeText(f"共记录 {len(anomaly_images_list)} 张图片\n异常记录已保存到 temp/consecutive_anomalies/ 目录")
             msg_box.setIcon(QMessageBox.Critical)
             msg_box.setStandardButtons(QMessageBox.Ok)
             
@@ -1732,11 +1509,13 @@ class AnomalyDetectionWidget(QWidget):
         # 保持仅文字显示
         logger.info("批量下载已停止")
     
-    def on_download_progress_update(self, current, total):
+    def on_download_progress_update(self, current, total, throughput, eta):
         """下载进度更新回调"""
         if total > 0:
             progress_percent = int((current / total) * 100)
-            progress_text = f"当前下载进度 {current}/{total} ({progress_percent}%)"
+            progress_text = f"当前下载进度 {current}/{total} ({progress_percent}%) | {throughput / 1024 / 1024:.2f} MB/s"
+            if eta >= 0:
+                progress_text += f" | 剩余约 {int(eta // 60)}分{int(eta % 60)}秒"
             self.download_status_label.setText(f"下载状态: 运行中 | {progress_text}")
         else:
             self.download_status_label.setText("下载状态: 运行中")
@@ -2057,6 +1836,8 @@ class AnomalyDetectionWidget(QWidget):
 
     def closeEvent(self, event):
         """窗口关闭事件"""
+        # 停止预览图下载线程池
+        self.download_queue_manager.shutdown()
         # 关闭日志处理器
         if hasattr(self, 'log_handler'):
             # 先从root logger中移除handler，避免atexit时的错误
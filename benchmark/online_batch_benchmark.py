@@ -0,0 +1,432 @@
+"""
+在线批处理端到端吞吐压测：向监控文件夹投放N张合成图片，用在线批处理引擎（BatchEngine）对本地替身推理服务器处理，
+输出吞吐量、各阶段延迟分位数、传输字节数和客户端CPU/内存占用（JSON）：
+
+    python -m benchmark.online_batch_benchmark --images 500 --mix square=0.6,other=0.35,very_long=0.05
+    python -m benchmark.online_batch_benchmark --images 200 --rate 20 --set ONLINE_JOB_SLOTS=4 --set STANDIN_GPU_CONCURRENCY=4
+
+每次运行在 temp/benchmark/<时间戳>/ 下使用独立的监控文件夹、检查点、结果库、结果缓存和下载目录，互不影响。
+替身服务器默认在子进程中启动（CPU和内存统计只包含客户端），--external 时使用 .env 中配置的服务器。
+--set KEY=VALUE 覆盖本次运行的 .env 配置（客户端和替身服务器都生效），便于比较不同配置。
+"""
+from utils.batch_engine import BatchEngine
+from utils.watch_sources import WatchSource
+from utils.job_scheduler import get_job_scheduler, percentile
+from utils.ssh_connection_pool import get_connection_pool
+from utils.transfer_profiles import get_transfer_profile
+from benchmark.standin_server import client_env, png_chunk, STATS_COMMAND
+from dotenv import load_dotenv
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import logging
+import argparse
+import datetime
+import importlib
+import threading
+import subprocess
+
+logger = logging.getLogger("online_batch_benchmark")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 合成图片类型 -> 默认尺寸，对应 image_type_judge 的 square / other / very long
+IMAGE_KINDS = {
+    'square': (1024, 1024),
+    'other': (2048, 1024),
+    'very_long': (31901, 1000),
+}
+LATENCY_STAGES = ('upload', 'execute', 'fetch', 'total', 'end_to_end')
+
+def parse_mix(text: str) -> dict:
+    """'square=0.6,other=0.35,very_long=0.05' -> {类型: 比例}"""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in IMAGE_KINDS:
+            raise ValueError(f"未知的图片类型: {kind}（可选 {', '.join(IMAGE_KINDS)}）")
+        mix[kind] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("图片类型比例不能为空")
+    return mix
+
+def plan_images(count: int, mix: dict, seed: int) -> list:
+    """
+    按比例分配各类型的图片数（最大余数法），并按种子打乱顺序
+    Returns:
+        list: 每张图片的类型
+    """
+    total = sum(mix.values())
+    exact = {kind: count * weight / total for kind, weight in mix.items()}
+    counts = {kind: int(value) for kind, value in exact.items()}
+    for kind in sorted(exact, key=lambda k: exact[k] - counts[k], reverse=True)[:count - sum(counts.values())]:
+        counts[kind] += 1
+    kinds = [kind for kind, n in counts.items() for _ in range(n)]
+    random.Random(seed).shuffle(kinds)
+    return kinds
+
+def make_template(kind: str, noise: float) -> bytes:
+    """生成一种类型的模板PNG（带噪声的灰度图，压缩率接近相机图片）"""
+    from PIL import Image
+    image = Image.effect_noise(IMAGE_KINDS[kind], noise) if noise > 0 else Image.new('L', IMAGE_KINDS[kind], 128)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+def unique_png(template: bytes, index: int) -> bytes:
+    """在模板的 IEND 之前插入文本块，使每张图片内容不同（结果缓存不会命中）"""
+    return template[:-12] + png_chunk(b'tEXt', f"benchmark\x00{index}".encode('latin-1')) + template[-12:]
+
+def current_rss() -> int:
+    """当前进程的常驻内存（字节），无法获取时返回 None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def cpu_seconds() -> float:
+    """当前进程累计的用户态+内核态CPU时间"""
+    times = os.times()
+    return times.user + times.system
+
+def summarize(samples: list) -> dict:
+    """延迟样本（秒）的 p50/p95/p99、均值和最大值"""
+    if not samples:
+        return None
+    return {
+        'count': len(samples),
+        'mean': round(sum(samples) / len(samples), 4),
+        'p50': round(percentile(samples, 0.5), 4),
+        'p95': round(percentile(samples, 0.95), 4),
+        'p99': round(percentile(samples, 0.99), 4),
+        'max': round(max(samples), 4),
+    }
+
+class BenchmarkRecorder:
+    """记录每张图片的投放时间、提交时间和各阶段耗时"""
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.lock = threading.Lock()
+        self.arrivals = {}  # 文件名 -> 投放时间
+        self.records = []
+        self.done = threading.Event()
+
+    def arrived(self, filename: str):
+        with self.lock:
+            self.arrivals[filename] = time.time()
+
+    def committed(self, image_path: str, ok: bool, timings: dict):
+        filename = os.path.basename(image_path)
+        now = time.time()
+        with self.lock:
+            timings = dict(timings or {})
+            if filename in self.arrivals:
+                timings['end_to_end'] = now - self.arrivals[filename]
+            self.records.append({'file': filename, 'kind': filename.split('_', 1)[1].rsplit('.', 1)[0],
+                                 'ok': ok, 'commit_time': now, 'timings': timings})
+            if len(self.records) >= self.expected:
+                self.done.set()
+
+class BenchmarkEngine(BatchEngine):
+    """在线批处理引擎，提交每张图片时额外记录耗时"""
+    def __init__(self, *args, recorder: BenchmarkRecorder = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder
+
+    def commit_image(self, item):
+        super().commit_image(item)
+        ok = item['error'] is None and item['image_path'] in item['source'].processed_images
+        self.recorder.committed(item['image_path'], ok, item.get('timings'))
+
+class ResourceMonitor:
+    """定期采样客户端进程的常驻内存"""
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            rss = current_rss()
+            if rss is not None:
+                self.samples.append(rss)
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_standin(remote_root: str, log_file: str, startup_timeout: float = 60):
+    """
+    在子进程中启动替身服务器并等待其开始监听
+    Returns:
+        tuple: (子进程, 端口)
+    """
+    port = free_port()
+    log = open(log_file, 'w', encoding='utf-8')
+    process = subprocess.Popen([sys.executable, '-m', 'benchmark.standin_server', '--root', remote_root, '--port', str(port)],
+                               cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT, env=dict(os.environ))
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"替身服务器启动失败，见 {log_file}")
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("等待替身服务器启动超时")
+
+def stop_standin(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def query_remote_stats() -> dict:
+    """通过单独的SSH连接（不经过连接池）向替身服务器查询统计，服务器不支持时返回 None"""
+    import paramiko
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        ssh.connect(os.getenv('SSH_HOST_ANOMALY_DETECTION'), int(os.getenv('SSH_PORT_ANOMALY_DETECTION', 22)),
+                    os.getenv('SSH_USERNAME_ANOMALY_DETECTION'), os.getenv('SSH_PASSWORD_ANOMALY_DETECTION'), timeout=30)
+        stdin, stdout, stderr = ssh.exec_command(STATS_COMMAND)
+        output = stdout.read().decode().strip()
+        if stdout.channel.recv_exit_status() != 0:
+            return None
+        return json.loads(output)
+    except Exception as e:
+        logger.warning(f"查询远程统计失败: {e}")
+        return None
+    finally:
+        ssh.close()
+
+def feed_images(kinds: list, templates: dict, staging_dir: str, watch_dir: str, rate: float,
+                recorder: BenchmarkRecorder, stop_event: threading.Event):
+    """
+    按到达速率把图片投放到监控文件夹：先写入临时文件夹，再整体移动进去（与相机写完后移动相同）
+    Args:
+        rate: 每秒投放的图片数，0 为一次全部投放
+    """
+    start = time.time()
+    for index, kind in enumerate(kinds):
+        if stop_event.is_set():
+            return
+        if rate > 0:
+            delay = start + index / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        filename = f"{index:06d}_{kind}.png"
+        staging_path = os.path.join(staging_dir, filename)
+        with open(staging_path, 'wb') as f:
+            f.write(unique_png(templates[kind], index))
+        os.replace(staging_path, os.path.join(watch_dir, filename))
+        recorder.arrived(filename)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark.online_batch_benchmark", description="在线批处理端到端吞吐压测")
+    parser.add_argument('--images', type=int, default=200, help="投放的图片数，默认 200")
+    parser.add_argument('--mix', default='square=0.6,other=0.35,very_long=0.05',
+                        help="各类型图片比例，默认 square=0.6,other=0.35,very_long=0.05")
+    parser.add_argument('--rate', type=float, default=0, help="每秒投放的图片数，默认 0（开始时一次全部投放）")
+    parser.add_argument('--noise', type=float, default=8, help="合成图片的噪声强度，越大PNG越大，默认 8")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子，默认 0")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="覆盖本次运行的 .env 配置，可重复指定，例如 --set ONLINE_JOB_SLOTS=4")
+    parser.add_argument('--external', action='store_true', help="不启动替身服务器，使用 .env 中配置的服务器")
+    parser.add_argument('--workdir', help="运行目录，默认 temp/benchmark/<时间戳>")
+    parser.add_argument('--output', help="结果JSON路径，默认 <运行目录>/benchmark.json")
+    parser.add_argument('--label', default='', help="写入结果的标签，例如分支名或提交号")
+    parser.add_argument('--timeout', type=float, default=600, help="最长运行时间（秒），默认 600")
+    parser.add_argument('--keep-files', action='store_true', help="保留图片、远程目录和下载结果（默认运行后删除）")
+    parser.add_argument('--log-level', default='WARNING', help="日志级别，默认 WARNING")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        overrides[key.strip()] = value
+    os.environ.update(overrides)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    workdir = os.path.abspath(args.workdir or os.path.join("temp", "benchmark", timestamp))
+    output_file = os.path.abspath(args.output) if args.output else os.path.join(workdir, "benchmark.json")
+    watch_dir = os.path.join(workdir, "watch")
+    staging_dir = os.path.join(workdir, "staging")
+    remote_root = os.path.join(workdir, "remote")
+    for directory in (workdir, watch_dir, staging_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    # 引擎在处理第一张图片时才导入SSH客户端（及paramiko），这里提前导入，不计入运行耗时
+    importlib.import_module('utils.ssh_client_anomaly_detection')
+
+    kinds = plan_images(args.images, parse_mix(args.mix), args.seed)
+    print(f"生成合成图片模板: {', '.join(sorted(set(kinds)))}", flush=True)
+    templates = {kind: make_template(kind, args.noise) for kind in set(kinds)}
+
+    server = None
+    if not args.external:
+        server, port = start_standin(remote_root, os.path.join(workdir, "standin_server.log"))
+        os.environ.update(client_env('127.0.0.1', port))
+    # 检查点、结果库、结果缓存、下载目录和异常记录使用相对路径，全部落在运行目录中
+    os.chdir(workdir)
+    remote_before = query_remote_stats()
+
+    recorder = BenchmarkRecorder(len(kinds))
+    checkpoint_file = os.path.join("temp", "batch_processing_checkpoint", f"{timestamp}.json")
+    engine = BenchmarkEngine([WatchSource(watch_dir)], checkpoint_file, enable_preview=False, recorder=recorder)
+    engine_thread = threading.Thread(target=engine.run, name="benchmark-engine", daemon=True)
+    monitor = ResourceMonitor()
+    feed_stop = threading.Event()
+    feeder = threading.Thread(target=feed_images, args=(kinds, templates, staging_dir, watch_dir, args.rate, recorder, feed_stop),
+                              name="benchmark-feeder", daemon=True)
+
+    print(f"开始压测: {len(kinds)} 张图片，运行目录 {workdir}", flush=True)
+    rss_start = current_rss()
+    cpu_start = cpu_seconds()
+    wall_start = time.time()
+    monitor.start()
+    engine_thread.start()
+    feeder.start()
+    timed_out = not recorder.done.wait(args.timeout)
+    wall_end = max((record['commit_time'] for record in recorder.records), default=time.time())
+    feed_stop.set()
+    engine.stop()
+    engine_thread.join()
+    cpu_used = cpu_seconds() - cpu_start
+    wall_elapsed = time.time() - wall_start
+    monitor.stop()
+    rss_end = current_rss()
+    get_connection_pool().close_all()
+
+    remote_after = query_remote_stats()
+    if server is not None:
+        stop_standin(server)
+
+    records = list(recorder.records)
+    completed = [record for record in records if record['ok']]
+    processing_seconds = max(wall_end - wall_start, 1e-9)
+    by_kind = {}
+    for kind in sorted(set(kinds)):
+        kind_records = [record for record in completed if record['kind'] == kind]
+        by_kind[kind] = {
+            'requested': kinds.count(kind),
+            'completed': len(kind_records),
+            'end_to_end': summarize([record['timings']['end_to_end'] for record in kind_records
+                                     if 'end_to_end' in record['timings']]),
+        }
+
+    transferred = None
+    if remote_before is not None and remote_after is not None:
+        before, after = remote_before['stats'], remote_after['stats']
+        uploaded = after['bytes_uploaded'] - before['bytes_uploaded']
+        downloaded = after['bytes_downloaded'] - before['bytes_downloaded']
+        transferred = {
+            'uploaded': uploaded,
+            'downloaded': downloaded,
+            'uploaded_per_image': round(uploaded / len(completed)) if completed else None,
+            'downloaded_per_image': round(downloaded / len(completed)) if completed else None,
+            # 不含查询统计本身使用的连接和命令
+            'exec_commands': after['exec_commands'] - before['exec_commands'] - 1,
+            'ssh_connections': after['connections'] - before['connections'] - 1,
+        }
+
+    rss_samples = monitor.samples
+    result = {
+        'benchmark': 'online_batch',
+        'label': args.label,
+        'started_at': datetime.datetime.fromtimestamp(wall_start).isoformat(),
+        'timed_out': timed_out,
+        'config': {
+            'images': len(kinds),
+            'mix': parse_mix(args.mix),
+            'arrival_rate': args.rate,
+            'seed': args.seed,
+            'template_bytes': {kind: len(data) for kind, data in templates.items()},
+            'overrides': overrides,
+            'external_remote': args.external,
+            'upload_workers': engine.upload_workers,
+            'execute_workers': engine.execute_workers,
+            'fetch_workers': engine.fetch_workers,
+            'stage_queue_size': engine.stage_queue_size,
+            'micro_batch_size': engine.micro_batch_size,
+            'micro_batch_wait_ms': engine.micro_batch_wait_ms,
+            'inotify': engine.use_inotify,
+            'transfer_profile': get_transfer_profile().name,
+            'persistent_worker': os.getenv('ANOMALY_PERSISTENT_WORKER', 'false').lower() in ('1', 'true', 'yes'),
+            'tiled_mode': os.getenv('ANOMALY_TILED_MODE', 'false').lower() in ('1', 'true', 'yes'),
+            'remote_behavior': (remote_after or remote_before or {}).get('behavior'),
+        },
+        'images': {
+            'requested': len(kinds),
+            'committed': len(records),
+            'completed': len(completed),
+            'failed': len(records) - len(completed),
+            'by_kind': by_kind,
+        },
+        'throughput': {
+            'processing_seconds': round(processing_seconds, 3),
+            'images_per_second': round(len(completed) / processing_seconds, 3),
+        },
+        'latency': {stage: summarize([record['timings'][stage] for record in completed if stage in record['timings']])
+                    for stage in LATENCY_STAGES},
+        'bytes': transferred,
+        'client': {
+            'cpu_seconds': round(cpu_used, 3),
+            'cpu_percent': round(100 * cpu_used / wall_elapsed, 1) if wall_elapsed > 0 else None,
+            'rss_start_mb': round(rss_start / 1048576, 1) if rss_start else None,
+            'rss_peak_mb': round(max(rss_samples) / 1048576, 1) if rss_samples else None,
+            'rss_end_mb': round(rss_end / 1048576, 1) if rss_end else None,
+        },
+        'scheduler': get_job_scheduler().stats(),
+    }
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if not args.keep_files:
+        for directory in (watch_dir, staging_dir, remote_root, os.path.join(workdir, "download")):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    latency = result['latency']['end_to_end'] or {}
+    print(f"完成 {len(completed)}/{len(kinds)} 张（失败 {result['images']['failed']}），"
+          f"{result['throughput']['images_per_second']} 张/秒，"
+          f"端到端 p50 {latency.get('p50')}s p95 {latency.get('p95')}s p99 {latency.get('p99')}s，"
+          f"客户端CPU {result['client']['cpu_percent']}% 峰值内存 {result['client']['rss_peak_mb']}MB", flush=True)
+    print(f"结果已写入: {output_file}", flush=True)
+    return 1 if timed_out else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
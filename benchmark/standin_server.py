@@ -0,0 +1,777 @@
+"""
+本地替身推理服务器（离线端到端压测用），基于 paramiko 的 SSH/SFTP 服务端接口：
+
+    python -m benchmark.standin_server --port 2222
+
+按启动时输出的配置修改 .env 后，界面、守护进程和两个SSH客户端无需GPU服务器和网络即可完整运行。
+远程路径映射到本地根目录（默认 temp/standin_remote）下，目录布局与真实服务器相同：
+    /anomaly_detection/upload/<处理ID>.<后缀>         异常检测上传的图片
+    /anomaly_detection/output/<处理ID>/               <处理ID>.png、<处理ID>_heatmap.png、<处理ID>.json
+    /trend_analysis/upload/<处理ID>/                  趋势预测上传的图片组
+    /trend_analysis/output/<处理ID>/                  prediction.jpg、<处理ID>.json
+
+远程命令不真正执行，而是在进程内模拟：
+    bash -c 'cd ... && conda run -n ... python3 api*.py --file_path ... --process_id ...'   单张推理
+    bash -c '... python3 api.py --folder_path ... --process_id ...'                         趋势预测
+    bash -c '... python3 inference_worker.py --manifest ...'                                清单推理
+    bash -c '... python3 -u inference_worker.py'                                            常驻推理进程
+    test -f ... && echo 'exists' || echo 'not_exists'                                       结果文件检查
+    standin-stats                                                                           服务器统计（压测用）
+推理按配置的延迟（可加抖动、按输入大小增加）等待，每块GPU（CUDA_VISIBLE_DEVICES）同时只执行配置数量的推理，
+结果文件按配置的大小生成，并先写入临时文件夹、完成后整体重命名，客户端看到结果文件夹时结果总是完整的。
+"""
+from dotenv import load_dotenv
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shlex
+import random
+import socket
+import struct
+import logging
+import argparse
+import posixpath
+import threading
+import paramiko
+
+from remote.inference_worker import handle_job
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_BASE_PATH = '/anomaly_detection'
+TREND_BASE_PATH = '/trend_analysis'
+ANOMALY_SCRIPTS = ('api.py', 'api_v2_http_batch.py', 'api_v3_http.py')
+WORKER_SCRIPT = 'inference_worker.py'
+STATS_COMMAND = 'standin-stats'  # 返回服务器统计和推理行为（JSON），供压测统计传输字节数
+
+ANOMALY_LEVELS = ('正常', '低异常可能性', '中等异常可能性', '很可能异常')
+TREND_LEVELS = ('正常', '中等预测异常可能性', '很可能预测异常')
+
+# 执行很快的命令在回复前至少等待的时间：paramiko 在 check_channel_exec_request 返回后才发送请求成功消息，
+# 输出和退出状态若先于该消息到达，客户端的 exec_command 会报告通道已关闭
+EXEC_REPLY_GRACE = 0.02
+
+class StandinBehavior:
+    """替身服务器的推理行为：各脚本的延迟、结果文件大小、异常比例和失败比例"""
+    def __init__(self, script_latency: dict = None, trend_latency: float = 2.0, latency_jitter: float = 0.1,
+                 latency_per_mb: float = 0.0, gpu_concurrency: int = 1, prediction_bytes: int = 200 * 1024,
+                 heatmap_bytes: int = 200 * 1024, trend_prediction_bytes: int = 300 * 1024,
+                 anomaly_ratio: float = 0.05, failure_ratio: float = 0.0, seed: int = 0):
+        """
+        Args:
+            script_latency: 推理脚本 -> 每张图片的推理时间（秒），未给出的脚本为 0.5
+            trend_latency: 趋势预测每组图片的推理时间（秒）
+            latency_jitter: 推理时间的随机抖动比例（0.1 为 ±10%）
+            latency_per_mb: 输入每MB额外增加的推理时间（秒）
+            gpu_concurrency: 每块GPU同时执行的推理数，0 为不限制
+            prediction_bytes: 预测图大小（字节）
+            heatmap_bytes: 热力图大小（字节）
+            trend_prediction_bytes: 趋势预测 prediction.jpg 的大小（字节）
+            anomaly_ratio: 结果为异常级别（中等异常可能性/很可能异常）的比例
+            failure_ratio: 推理失败的比例
+            seed: 随机种子，相同种子下同一处理ID的结果相同
+        """
+        self.script_latency = {'api.py': 0.3, 'api_v2_http_batch.py': 2.0, 'api_v3_http.py': 0.5}
+        self.script_latency.update(script_latency or {})
+        self.trend_latency = trend_latency
+        self.latency_jitter = max(0.0, latency_jitter)
+        self.latency_per_mb = max(0.0, latency_per_mb)
+        self.gpu_concurrency = max(0, gpu_concurrency)
+        self.prediction_bytes = max(0, prediction_bytes)
+        self.heatmap_bytes = max(0, heatmap_bytes)
+        self.trend_prediction_bytes = max(0, trend_prediction_bytes)
+        self.anomaly_ratio = min(max(anomaly_ratio, 0.0), 1.0)
+        self.failure_ratio = min(max(failure_ratio, 0.0), 1.0)
+        self.seed = seed
+
+    def rng(self, process_id: str) -> random.Random:
+        """按处理ID确定的随机数发生器"""
+        return random.Random(f"{self.seed}:{process_id}")
+
+    def latency(self, base: float, input_bytes: int, rng: random.Random) -> float:
+        """一次推理的耗时：基础耗时加按输入大小的耗时，再加随机抖动"""
+        latency = base + self.latency_per_mb * input_bytes / (1024 * 1024)
+        if self.latency_jitter:
+            latency *= 1 + rng.uniform(-self.latency_jitter, self.latency_jitter)
+        return max(0.0, latency)
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+def get_standin_behavior() -> StandinBehavior:
+    """
+    按 .env 配置创建替身服务器的推理行为
+    Returns:
+        StandinBehavior: 推理行为
+    """
+    load_dotenv()
+    return StandinBehavior(
+        script_latency=json.loads(os.getenv('STANDIN_SCRIPT_LATENCY') or '{}'),
+        trend_latency=float(os.getenv('STANDIN_TREND_LATENCY', 2.0)),
+        latency_jitter=float(os.getenv('STANDIN_LATENCY_JITTER', 0.1)),
+        latency_per_mb=float(os.getenv('STANDIN_LATENCY_PER_MB', 0)),
+        gpu_concurrency=int(os.getenv('STANDIN_GPU_CONCURRENCY', 1)),
+        prediction_bytes=int(os.getenv('STANDIN_PREDICTION_BYTES', 200 * 1024)),
+        heatmap_bytes=int(os.getenv('STANDIN_HEATMAP_BYTES', 200 * 1024)),
+        trend_prediction_bytes=int(os.getenv('STANDIN_TREND_PREDICTION_BYTES', 300 * 1024)),
+        anomaly_ratio=float(os.getenv('STANDIN_ANOMALY_RATIO', 0.05)),
+        failure_ratio=float(os.getenv('STANDIN_FAILURE_RATIO', 0)),
+        seed=int(os.getenv('STANDIN_SEED', 0)),
+    )
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def make_png(size: int, side: int = 64) -> bytes:
+    """
+    生成可以正常打开的灰度PNG，用私有辅助数据块填充到指定大小（填充为随机字节，压缩不会使其变小）
+    Args:
+        size: 目标大小（字节），小于最小PNG时返回最小PNG
+        side: 图片边长（像素）
+    """
+    rows = b''.join(b'\x00' + bytes((x * 4) % 256 for x in range(side)) for _ in range(side))
+    header = b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', struct.pack('>IIBBBBB', side, side, 8, 0, 0, 0, 0))
+    body = png_chunk(b'IDAT', zlib.compress(rows))
+    end = png_chunk(b'IEND', b'')
+    padding = size - len(header) - len(body) - len(end) - 12
+    if padding > 0:
+        body += png_chunk(b'bnPd', os.urandom(padding))
+    return header + body + end
+
+def make_jpeg(size: int, side: int = 64) -> bytes:
+    """生成可以正常打开的JPEG，在文件头后插入注释段（随机字节）填充到指定大小"""
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('L', (side, side), 128).save(buffer, format='JPEG')
+    data = buffer.getvalue()
+    segments = []
+    remaining = size - len(data)
+    while remaining > 4:
+        payload = min(remaining - 4, 65533)
+        segments.append(b'\xff\xfe' + struct.pack('>H', payload + 2) + os.urandom(payload))
+        remaining -= payload + 4
+    return data[:2] + b''.join(segments) + data[2:]
+
+class PayloadCache:
+    """按类型和大小缓存生成的结果图片（压测时每张图片都生成会占用客户端之外的CPU）"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.payloads = {}
+
+    def get(self, kind: str, size: int) -> bytes:
+        with self.lock:
+            key = (kind, size)
+            if key not in self.payloads:
+                self.payloads[key] = make_jpeg(size) if kind == 'jpeg' else make_png(size)
+            return self.payloads[key]
+
+class StandinStats:
+    """替身服务器的计数：连接、远程命令、推理和SFTP传输字节数"""
+    FIELDS = ('connections', 'exec_commands', 'inferences', 'failures', 'trend_inferences',
+              'bytes_uploaded', 'bytes_downloaded')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def add(self, field: str, amount: int = 1):
+        with self.lock:
+            self.values[field] += amount
+
+    def reset(self):
+        with self.lock:
+            self.values = dict.fromkeys(self.FIELDS, 0)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+class StandinSFTPHandle(paramiko.SFTPHandle):
+    """本地文件句柄，读写字节计入统计"""
+    def __init__(self, stats: StandinStats, flags: int = 0):
+        super().__init__(flags)
+        self.stats = stats
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self.filename, attr)
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def read(self, offset, length):
+        data = super().read(offset, length)
+        if isinstance(data, bytes):
+            self.stats.add('bytes_downloaded', len(data))
+        return data
+
+    def write(self, offset, data):
+        result = super().write(offset, data)
+        if result == paramiko.SFTP_OK:
+            self.stats.add('bytes_uploaded', len(data))
+        return result
+
+class StandinSFTPServer(paramiko.SFTPServerInterface):
+    """把远程绝对路径映射到替身服务器根目录下的SFTP服务"""
+    def __init__(self, server, *args, standin=None, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.standin = standin
+
+    def to_local(self, path: str) -> str:
+        return self.standin.to_local(path)
+
+    def canonicalize(self, path):
+        return posixpath.normpath('/' + path.replace('\\', '/'))
+
+    def list_folder(self, path):
+        local_path = self.to_local(path)
+        try:
+            result = []
+            for filename in os.listdir(local_path):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local_path, filename)))
+                attr.filename = filename
+                result.append(attr)
+            return result
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.to_local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(self.to_local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        local_path = self.to_local(path)
+        try:
+            flags |= getattr(os, 'O_BINARY', 0)
+            mode = getattr(attr, 'st_mode', None) or 0o666
+            fd = os.open(local_path, flags, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode_str = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode_str = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode_str = 'rb'
+        try:
+            f = os.fdopen(fd, mode_str)
+        except OSError as e:
+            os.close(fd)
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = StandinSFTPHandle(self.standin.stats, flags)
+        handle.filename = local_path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self.to_local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        new_local = self.to_local(newpath)
+        if os.path.exists(new_local):
+            return paramiko.SFTP_FAILURE
+        try:
+            os.rename(self.to_local(oldpath), new_local)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self.to_local(oldpath), self.to_local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self.to_local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self.to_local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self.to_local(path), attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+class StandinServerInterface(paramiko.ServerInterface):
+    """密码认证、会话通道、远程命令（交给替身服务器模拟）和SFTP子系统"""
+    def __init__(self, standin):
+        self.standin = standin
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == self.standin.username and password == self.standin.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode('utf-8', errors='replace') if isinstance(command, bytes) else command
+        threading.Thread(target=self.standin.run_command, args=(channel, command, time.perf_counter()),
+                         daemon=True).start()
+        return True
+
+class StandinServer:
+    """
+    本地替身推理服务器：接受SSH连接，提供映射到本地目录的SFTP，并模拟远程推理命令。
+    可作为上下文管理器在压测中使用，port 为 0 时自动选择空闲端口。
+    """
+    def __init__(self, root: str = "temp/standin_remote", host: str = '127.0.0.1', port: int = 0,
+                 username: str = 'standin', password: str = 'standin', behavior: StandinBehavior = None,
+                 host_key_file: str = "temp/standin_host_key"):
+        """
+        Args:
+            root: 远程文件系统映射到的本地目录
+            host: 监听地址
+            port: 监听端口，0 为自动选择
+            username: 登录用户名
+            password: 登录密码
+            behavior: 推理行为，默认按 .env 配置（get_standin_behavior）
+            host_key_file: 主机密钥文件，不存在时生成
+        """
+        self.root = os.path.abspath(root)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.behavior = behavior or get_standin_behavior()
+        self.host_key_file = host_key_file
+        self.stats = StandinStats()
+        self.payloads = PayloadCache()
+        self.gpu_semaphores = {}
+        self.gpu_lock = threading.Lock()
+        self.listen_socket = None
+        self.transports = []
+        self.transports_lock = threading.Lock()
+        self.is_running = False
+
+    def to_local(self, path: str) -> str:
+        """远程绝对路径 -> 本地路径（规范化后不会超出根目录）"""
+        remote_path = posixpath.normpath('/' + path.replace('\\', '/'))
+        return os.path.join(self.root, *[part for part in remote_path.split('/') if part])
+
+    def load_host_key(self):
+        if os.path.exists(self.host_key_file):
+            return paramiko.RSAKey.from_private_key_file(self.host_key_file)
+        key = paramiko.RSAKey.generate(2048)
+        os.makedirs(os.path.dirname(os.path.abspath(self.host_key_file)), exist_ok=True)
+        key.write_private_key_file(self.host_key_file)
+        logger.info(f"已生成替身服务器主机密钥: {self.host_key_file}")
+        return key
+
+    def start(self):
+        """创建远程目录布局，开始监听"""
+        for base_path in (ANOMALY_BASE_PATH, TREND_BASE_PATH):
+            for sub_dir in ('upload', 'output'):
+                os.makedirs(self.to_local(posixpath.join(base_path, sub_dir)), exist_ok=True)
+        self.host_key = self.load_host_key()
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.bind((self.host, self.port))
+        self.listen_socket.listen(100)
+        self.port = self.listen_socket.getsockname()[1]
+        self.is_running = True
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        logger.info(f"替身推理服务器已启动: {self.host}:{self.port}，根目录 {self.root}")
+        return self
+
+    def stop(self):
+        """停止监听并断开所有连接"""
+        self.is_running = False
+        if self.listen_socket is not None:
+            try:
+                self.listen_socket.close()
+            except OSError:
+                pass
+        with self.transports_lock:
+            transports, self.transports = self.transports, []
+        for transport in transports:
+            transport.close()
+        logger.info("替身推理服务器已停止")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def accept_loop(self):
+        while self.is_running:
+            try:
+                sock, address = self.listen_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.serve_connection, args=(sock,), daemon=True).start()
+
+    def serve_connection(self, sock):
+        """一条SSH连接：协商、认证，之后持续接受通道（通道请求由传输层线程回调处理）"""
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        transport.use_compression(True)  # 与OpenSSH相同，客户端的传输配置开启压缩时可以协商
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StandinSFTPServer, standin=self)
+        try:
+            transport.start_server(server=StandinServerInterface(self))
+        except Exception as e:
+            logger.warning(f"替身服务器SSH协商失败: {e}")
+            transport.close()
+            return
+        self.stats.add('connections')
+        with self.transports_lock:
+            self.transports.append(transport)
+        # 取走已打开的通道，避免传输层的待接受队列无限增长；
+        # 通道对象被回收时 paramiko 会关闭通道，因此在通道关闭前保留引用
+        channels = []
+        while self.is_running and transport.is_active():
+            channel = transport.accept(1)
+            channels = [item for item in channels if not item.closed]
+            if channel is not None:
+                channels.append(channel)
+        with self.transports_lock:
+            if transport in self.transports:
+                self.transports.remove(transport)
+
+    def client_env(self) -> dict:
+        """让两个SSH客户端连接到本服务器的 .env 配置"""
+        return client_env(self.host, self.port, self.username, self.password)
+
+    def run_command(self, channel, command: str, request_time: float):
+        """模拟一个远程命令，写回标准输出/标准错误和退出状态"""
+        self.stats.add('exec_commands')
+        try:
+            gpu_id, argv, cwd = parse_command(command)
+            if argv and argv[0] == 'test':
+                stdout, stderr, status = self.run_test(argv)
+            elif argv and argv[0] == STATS_COMMAND:
+                stats = {'stats': self.stats.snapshot(), 'behavior': self.behavior.to_dict()}
+                stdout, stderr, status = json.dumps(stats, ensure_ascii=False) + '\n', '', 0
+            elif argv and argv[0] == WORKER_SCRIPT and '--manifest' not in argv:
+                self.serve_worker(channel, gpu_id)
+                return
+            elif argv and argv[0] == WORKER_SCRIPT:
+                stdout, stderr, status = self.run_manifest_command(argv, cwd, gpu_id)
+            elif argv and argv[0] in ANOMALY_SCRIPTS:
+                stdout, stderr, status = self.run_script_command(argv, gpu_id)
+            else:
+                stdout, stderr, status = '', f"standin: 不支持的命令: {command}\n", 127
+        except Exception as e:
+            stdout, stderr, status = '', f"{type(e).__name__}: {e}\n", 1
+        try:
+            remaining = EXEC_REPLY_GRACE - (time.perf_counter() - request_time)
+            if remaining > 0:
+                time.sleep(remaining)
+            if stdout:
+                channel.sendall(stdout.encode('utf-8'))
+            if stderr:
+                channel.sendall_stderr(stderr.encode('utf-8'))
+            channel.send_exit_status(status)
+        except Exception as e:
+            logger.debug(f"替身服务器回复命令失败: {e}")
+        finally:
+            channel.close()
+
+    def run_test(self, argv):
+        """test -f 路径（后面的 echo 由调用方约定为 exists / not_exists）"""
+        exists = len(argv) >= 3 and argv[1] == '-f' and os.path.isfile(self.to_local(argv[2]))
+        return ('exists\n' if exists else 'not_exists\n'), '', 0
+
+    def run_script_command(self, argv, gpu_id):
+        """python3 api*.py --file_path ... / --folder_path ... --process_id ..."""
+        args = parse_script_args(argv[1:])
+        if args.get('folder_path'):
+            self.infer_trend(args['folder_path'], args['process_id'], gpu_id)
+        else:
+            self.infer(argv[0], args['file_path'], args['process_id'], gpu_id)
+        return f"standin: {argv[0]} 完成 {args['process_id']}\n", '', 0
+
+    def run_manifest_command(self, argv, cwd, gpu_id):
+        """python3 inference_worker.py --manifest 清单文件：与远程单次执行清单的输出格式相同"""
+        manifest_path = argv[argv.index('--manifest') + 1]
+        if not manifest_path.startswith('/'):
+            manifest_path = posixpath.join(cwd or '/', manifest_path)
+        with open(self.to_local(manifest_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        response = handle_job({'job_id': posixpath.basename(manifest_path), 'manifest': manifest},
+                              self.worker_runner(gpu_id))
+        return json.dumps(response, ensure_ascii=False) + '\n', '', 0
+
+    def serve_worker(self, channel, gpu_id):
+        """
+        常驻推理进程：与 remote/inference_worker.py 的 serve 协议相同，逐行读取JSON任务、逐行写回结果。
+        不使用 serve 本身，因为它会重定向整个进程的标准输出，服务器中多个常驻进程并行时会互相干扰。
+        """
+        runner = self.worker_runner(gpu_id)
+
+        def reply(message):
+            channel.sendall((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        try:
+            reply({'ready': True, 'pid': os.getpid()})
+            for line in channel.makefile('r'):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    job = json.loads(line)
+                except ValueError:
+                    reply({'job_id': None, 'ok': False, 'error': f"无法解析的任务: {line[:200]}"})
+                    continue
+                if job.get('command') == 'shutdown':
+                    break
+                reply(handle_job(job, runner))
+            channel.send_exit_status(0)
+        except Exception as e:
+            logger.debug(f"替身服务器常驻进程结束: {e}")
+        finally:
+            channel.close()
+
+    def worker_runner(self, gpu_id):
+        """inference_worker.handle_job 使用的单张推理函数"""
+        def runner(script_name, file_path, process_id):
+            if script_name not in ANOMALY_SCRIPTS:
+                raise ValueError(f"不支持的推理脚本: {script_name}")
+            self.infer(script_name, file_path, process_id, gpu_id)
+        return runner
+
+    def gpu_slot(self, gpu_id):
+        """该GPU的推理并发限制"""
+        if not self.behavior.gpu_concurrency:
+            return _NullSlot()
+        with self.gpu_lock:
+            if gpu_id not in self.gpu_semaphores:
+                self.gpu_semaphores[gpu_id] = threading.Semaphore(self.behavior.gpu_concurrency)
+            return self.gpu_semaphores[gpu_id]
+
+    def infer(self, script_name: str, file_path: str, process_id: str, gpu_id: str):
+        """
+        模拟一次异常检测推理，生成 output/<处理ID>/ 下的预测图、热力图和JSON
+        Args:
+            script_name: 推理脚本
+            file_path: 远程图片路径（<工作目录>/upload/<文件名>）
+            process_id: 处理ID
+            gpu_id: CUDA_VISIBLE_DEVICES
+        """
+        local_input = self.to_local(file_path)
+        input_bytes = os.path.getsize(local_input)  # 图片不存在时与真实脚本一样失败
+        behavior = self.behavior
+        rng = behavior.rng(process_id)
+        latency = behavior.latency(behavior.script_latency.get(script_name, 0.5), input_bytes, rng)
+        with self.gpu_slot(gpu_id):
+            time.sleep(latency)
+        if rng.random() < behavior.failure_ratio:
+            self.stats.add('failures')
+            raise RuntimeError(f"模拟推理失败: {process_id}")
+
+        if rng.random() < behavior.anomaly_ratio:
+            anomaly_level = rng.choice(ANOMALY_LEVELS[2:])
+            analog_voltage = round(rng.uniform(3.5, 5.0), 3)
+        else:
+            anomaly_level = rng.choice(ANOMALY_LEVELS[:2])
+            analog_voltage = round(rng.uniform(0.5, 3.0), 3)
+        result = {
+            'process_id': process_id,
+            'script': script_name,
+            'anomaly_level': anomaly_level,
+            'analog_voltage': analog_voltage,
+            'gpu': gpu_id,
+            'elapsed': round(latency, 4),
+        }
+        base_path = posixpath.dirname(posixpath.dirname(file_path))
+        self.write_output(base_path, process_id, {
+            f"{process_id}.png": self.payloads.get('png', behavior.prediction_bytes),
+            f"{process_id}_heatmap.png": self.payloads.get('png', behavior.heatmap_bytes),
+            f"{process_id}.json": json.dumps(result, ensure_ascii=False).encode('utf-8'),
+        })
+        self.stats.add('inferences')
+
+    def infer_trend(self, folder_path: str, process_id: str, gpu_id: str):
+        """模拟一次趋势预测，生成 output/<处理ID>/prediction.jpg 和 <处理ID>.json"""
+        local_folder = self.to_local(folder_path)
+        files = [entry for entry in os.scandir(local_folder) if entry.is_file()]
+        input_bytes = sum(entry.stat().st_size for entry in files)
+        behavior = self.behavior
+        rng = behavior.rng(process_id)
+        latency = behavior.latency(behavior.trend_latency, input_bytes, rng)
+        with self.gpu_slot(gpu_id):
+            time.sleep(latency)
+        if rng.random() < behavior.failure_ratio:
+            self.stats.add('failures')
+            raise RuntimeError(f"模拟推理失败: {process_id}")
+
+        anomalous = rng.random() < behavior.anomaly_ratio
+        result = {
+            'process_id': process_id,
+            'pred_level': rng.choice(TREND_LEVELS[1:]) if anomalous else TREND_LEVELS[0],
+            'analog_voltage': round(rng.uniform(3.5, 5.0) if anomalous else rng.uniform(0.5, 3.0), 3),
+            'image_count': len(files),
+            'elapsed': round(latency, 4),
+        }
+        base_path = posixpath.dirname(posixpath.dirname(folder_path.rstrip('/')))
+        self.write_output(base_path, process_id, {
+            'prediction.jpg': self.payloads.get('jpeg', behavior.trend_prediction_bytes),
+            f"{process_id}.json": json.dumps(result, ensure_ascii=False).encode('utf-8'),
+        })
+        self.stats.add('trend_inferences')
+
+    def write_output(self, base_path: str, process_id: str, files: dict):
+        """先写入 output/.<处理ID>.partial，完成后整体重命名为 output/<处理ID>"""
+        output_dir = self.to_local(posixpath.join(base_path, 'output'))
+        staging_dir = os.path.join(output_dir, f".{process_id}.partial")
+        os.makedirs(staging_dir, exist_ok=True)
+        for filename, data in files.items():
+            with open(os.path.join(staging_dir, filename), 'wb') as f:
+                f.write(data)
+        os.replace(staging_dir, os.path.join(output_dir, process_id))
+
+def client_env(host: str, port: int, username: str = 'standin', password: str = 'standin') -> dict:
+    """
+    让两个SSH客户端连接到替身服务器的 .env 配置
+    Returns:
+        dict: 环境变量名 -> 值
+    """
+    env = {}
+    for suffix, base_path in (('ANOMALY_DETECTION', ANOMALY_BASE_PATH), ('TREND_ANALYSIS', TREND_BASE_PATH)):
+        env.update({
+            f'SSH_HOST_{suffix}': host,
+            f'SSH_PORT_{suffix}': str(port),
+            f'SSH_USERNAME_{suffix}': username,
+            f'SSH_PASSWORD_{suffix}': password,
+            f'SSH_REMOTE_BASE_PATH_{suffix}': base_path,
+            f'CONDA_EXECUTABLE_{suffix}': 'conda',
+            f'CONDA_ENV_NAME_{suffix}': 'standin',
+        })
+    return env
+
+class _NullSlot:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+def parse_command(command: str):
+    """
+    解析客户端发送的远程命令
+    Args:
+        command: 例如 "CUDA_VISIBLE_DEVICES=1 bash -c 'cd /base && conda run -n env python3 api.py --file_path ...'"
+    Returns:
+        tuple: (GPU编号, 以脚本名开头的参数列表（或 test 命令）, 工作目录)
+    """
+    gpu_id = '0'
+    match = re.match(r'\s*CUDA_VISIBLE_DEVICES=(\S+)\s+(.*)', command, re.S)
+    if match:
+        gpu_id, command = match.group(1), match.group(2)
+    tokens = shlex.split(command)
+    if len(tokens) >= 3 and tokens[0] == 'bash' and tokens[1] == '-c':
+        tokens = shlex.split(tokens[2])
+
+    cwd = None
+    argv = []
+    for part in split_and(tokens):
+        if part and part[0] == 'cd' and len(part) > 1:
+            cwd = part[1]
+        elif part:
+            argv = part
+            break
+    if argv and argv[0] in ('test', STATS_COMMAND):
+        return gpu_id, argv, cwd
+    # 去掉 conda run ... python3 [-u] 前缀，保留脚本名及其参数
+    for index, token in enumerate(argv):
+        if token.endswith('.py'):
+            return gpu_id, argv[index:], cwd
+    return gpu_id, [], cwd
+
+def split_and(tokens: list) -> list:
+    """按 && 拆分命令（|| 之后的部分忽略）"""
+    parts = [[]]
+    for token in tokens:
+        if token == '||':
+            break
+        if token == '&&':
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+def parse_script_args(args: list) -> dict:
+    """--file_path X --folder_path Y --process_id Z -> dict"""
+    result = {}
+    for index, token in enumerate(args):
+        if token.startswith('--') and index + 1 < len(args):
+            result[token[2:]] = args[index + 1]
+    if 'process_id' not in result:
+        raise ValueError("缺少 --process_id 参数")
+    if 'file_path' not in result and 'folder_path' not in result:
+        raise ValueError("缺少 --file_path 或 --folder_path 参数")
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark.standin_server", description="本地替身推理服务器（离线压测用）")
+    parser.add_argument('--root', default=os.getenv('STANDIN_ROOT', "temp/standin_remote"), help="远程文件系统映射的本地目录")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址，默认 127.0.0.1")
+    parser.add_argument('--port', type=int, default=int(os.getenv('STANDIN_PORT', 2222)), help="监听端口，默认 2222")
+    parser.add_argument('--username', default='standin', help="登录用户名")
+    parser.add_argument('--password', default='standin', help="登录密码")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    load_dotenv()
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = StandinServer(args.root, args.host, args.port, args.username, args.password)
+    server.start()
+    print("# 将以下配置写入 .env 即可让客户端连接替身服务器：")
+    for key, value in server.client_env().items():
+        print(f"{key}={value}")
+    print(f"# 推理行为: {json.dumps(server.behavior.to_dict(), ensure_ascii=False)}", flush=True)
+    try:
+        while True:
+            time.sleep(10)
+            logger.info(f"替身服务器统计: {server.stats.snapshot()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,6 @@ from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QObject
 from PyQt5.QtGui import QPixmap, QFont
 from utils.ssh_client_film_trend_analysis import SSHClient
 import tempfile
-import shutil
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -23,42 +22,18 @@ class ImageProcessingThread(QThread):
     
     def __init__(self, image_paths):
         super().__init__()
-        self.image_paths = image_paths
+        self.image_paths = list(image_paths)  # 拷贝一份，处理过程中界面清空列表不影响上传
         
     def run(self):
         try:
-            # 使用项目根目录下的temp文件夹
-            project_root = os.path.dirname(os.path.abspath(__file__))
-            temp_base_dir = os.path.join(project_root, "temp")
-            
-            # 确保temp目录存在
-            if not os.path.exists(temp_base_dir):
-                os.makedirs(temp_base_dir)
-            
-            # 创建带时间戳的临时子目录
-            import time
-            timestamp = int(time.time() * 1000)  # 毫秒时间戳
-            temp_dir = os.path.join(temp_base_dir, f"processing_{timestamp}")
-            os.makedirs(temp_dir)
-            
-            logger.info(f"创建临时目录: {temp_dir}")
-            
-            # 复制图片到临时目录
-            for i, image_path in enumerate(self.image_paths):
-                filename = os.path.basename(image_path)
-                dest_path = os.path.join(temp_dir, filename)
-                shutil.copy2(image_path, dest_path)
-                self.progress.emit(f"正在准备图片 {i+1}/{len(self.image_paths)}: {filename}")
+            # 直接从原始路径上传，原图由客户端在结果目录中链接归档，无需先复制到临时文件夹
+            self.progress.emit(f"准备处理 {len(self.image_paths)} 张图片")
             
             # 调用SSH客户端处理图片
             self.progress.emit("正在连接远程服务器...")
             ssh_client = SSHClient()
             self.progress.emit("正在上传图片到远程服务器...")
-            result_path, local_result_json = ssh_client.process_images(temp_dir)
-            
-            # 清理临时目录
-            shutil.rmtree(temp_dir)
-            logger.info(f"清理临时目录: {temp_dir}")
+            result_path, local_result_json = ssh_client.process_images(image_paths=self.image_paths, progress_callback=self.report_upload_progress)
             
             self.finished.emit(result_path, local_result_json)
             
@@ -67,6 +42,10 @@ class ImageProcessingThread(QThread):
             logger.error(error_msg)
             self.error.emit(error_msg)
 
+    def report_upload_progress(self, completed, total, filename):
+        """上传进度回调（在上传线程中调用，通过信号转发到界面）"""
+        self.progress.emit(f"已上传图片 {completed}/{total}: {filename}")
+
 class FilmTrendAnalysisWidget(QWidget):
     def __init__(self):
         super().__init__()
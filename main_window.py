@@ -1,15 +1,17 @@
 import sys
+from utils.startup_profiler import startup_profiler
+# 需在导入PyQt和界面模块之前开始记录导入耗时
+if '--profile-startup' in sys.argv:
+    startup_profiler.enable()
 import os
 import logging
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QStackedWidget, QLabel,
                              QFrame, QMenuBar, QAction, QMessageBox)
-from PyQt5.QtCore import Qt, QObject, pyqtSignal
+from PyQt5.QtCore import Qt, QObject, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont, QIcon
 
-# 导入两个界面模块
-from film_trend_analysis_tab import FilmTrendAnalysisWidget
-from anomaly_detection_tab import AnomalyDetectionWidget
+# 两个界面模块（及其依赖的SSH客户端等）在首次显示对应标签页时才导入
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -49,6 +51,7 @@ class FilmTrendAnalysisTab(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         
         # 创建镀膜褶皱趋势预测界面
+        from film_trend_analysis_tab import FilmTrendAnalysisWidget
         self.film_trend_widget = FilmTrendAnalysisWidget()
         # 移除原有的窗口装饰，只保留内容
         self.film_trend_widget.setParent(self)
@@ -66,6 +69,7 @@ class AnomalyDetectionTab(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         
         # 创建异常检测界面
+        from anomaly_detection_tab import AnomalyDetectionWidget
         self.anomaly_detection_widget = AnomalyDetectionWidget()
         # 移除原有的窗口装饰，只保留内容
         self.anomaly_detection_widget.setParent(self)
@@ -214,19 +218,40 @@ class MainWindow(QMainWindow):
         self.tab_stack = QStackedWidget()
         parent_layout.addWidget(self.tab_stack)
         
-        # 创建标签页
-        self.film_trend_tab = FilmTrendAnalysisTab()
-        self.anomaly_detection_tab = AnomalyDetectionTab()
-        
-        # 添加到堆栈
-        self.tab_stack.addWidget(self.film_trend_tab)
-        self.tab_stack.addWidget(self.anomaly_detection_tab)
+        # 每个标签页先放一个空容器，首次显示时才导入模块并构建界面
+        self.film_trend_tab = None
+        self.anomaly_detection_tab = None
+        self.tab_classes = [FilmTrendAnalysisTab, AnomalyDetectionTab]
+        self.tab_containers = []
+        for _ in self.tab_classes:
+            container = QWidget()
+            container_layout = QVBoxLayout(container)
+            container_layout.setContentsMargins(0, 0, 0, 0)
+            self.tab_stack.addWidget(container)
+            self.tab_containers.append(container)
+        
+        # 初始显示的标签页
+        self.ensure_tab(self.current_tab)
+        
+    def ensure_tab(self, tab_index):
+        """首次显示时构建标签页"""
+        tab_attrs = ['film_trend_tab', 'anomaly_detection_tab']
+        tab = getattr(self, tab_attrs[tab_index])
+        if tab is not None:
+            return tab
+        tab_class = self.tab_classes[tab_index]
+        with startup_profiler.phase(f"构建 {tab_class.__name__}"):
+            tab = tab_class()
+        self.tab_containers[tab_index].layout().addWidget(tab)
+        setattr(self, tab_attrs[tab_index], tab)
+        return tab
         
     def switch_to_tab(self, tab_index):
         """切换到指定标签页"""
         if tab_index == self.current_tab:
             return
             
+        self.ensure_tab(tab_index)
         self.current_tab = tab_index
         self.tab_stack.setCurrentIndex(tab_index)
         
@@ -341,9 +366,16 @@ class MainWindow(QMainWindow):
         event.accept()
 
 def main():
-    app = QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
+    # --profile-startup：输出导入和构建耗时（见 utils/startup_profiler.py）
+    argv = [arg for arg in sys.argv if arg != '--profile-startup']
+    with startup_profiler.phase("创建QApplication"):
+        app = QApplication(argv)
+    with startup_profiler.phase("构建主窗口"):
+        window = MainWindow()
+    with startup_profiler.phase("显示主窗口"):
+        window.show()
+    # 事件循环开始后输出启动报告
+    QTimer.singleShot(0, startup_profiler.report)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
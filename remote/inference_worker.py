@@ -0,0 +1,201 @@
+"""
+常驻远程推理进程（部署在异常检测服务器的 SSH_REMOTE_BASE_PATH_ANOMALY_DETECTION 目录下）
+
+客户端通过一次 exec_command 启动本脚本，之后通过标准输入逐行发送JSON任务，
+本脚本在同一个Python进程中调用 api.py / api_v2_http_batch.py / api_v3_http.py，
+并通过标准输出逐行返回JSON结果，从而避免每张图片都重新激活conda、启动解释器和加载模型。
+
+任务格式:   {"job_id": "...", "script": "api.py", "file_path": "...", "process_id": "..."}
+返回格式:   {"job_id": "...", "ok": true, "error": "", "elapsed": 0.12}
+
+清单任务（微批处理）: {"job_id": "...", "manifest": [{"script": "...", "file_path": "...", "process_id": "..."}, ...]}
+返回格式:   {"job_id": "...", "ok": true, "error": "", "elapsed": 1.5,
+             "results": [{"process_id": "...", "ok": true, "error": ""}, ...]}
+
+推理脚本若定义了 run_inference(file_path, process_id) 函数，将在模块首次导入后直接调用（模型只加载一次）；
+否则若定义了 main() 函数，则在模块导入后按原命令行参数设置 sys.argv 并调用 main()。
+两者都没有的（只能从命令行运行的）脚本不预先导入，每个任务以 __main__ 方式执行一次脚本并传入与原命令行相同的参数，
+结果与逐张启动进程相同，但模型每次重新加载（导入前先静态检查函数定义，不会为检查而加载模型）。
+清单中同一脚本的图片，若脚本定义了 run_inference_batch([(file_path, process_id), ...])，将一次性交给它处理。
+
+也可以单次执行一个清单文件（非常驻模式）:
+    python3 inference_worker.py --manifest upload/manifest_xxx.json
+执行完毕后在标准输出打印一行与清单任务相同格式的JSON结果。
+"""
+import os
+import sys
+import json
+import ast
+import time
+import runpy
+import argparse
+import traceback
+import importlib.util
+from contextlib import redirect_stdout
+
+ALLOWED_SCRIPTS = ('api.py', 'api_v2_http_batch.py', 'api_v3_http.py')
+ENTRY_FUNCTIONS = ('run_inference', 'main')
+
+_loaded_modules = {}
+_entry_names = {}
+
+def find_entry_name(script_name):
+    """不执行脚本，静态查找其顶层定义的入口函数名，没有时返回 None"""
+    if script_name not in _entry_names:
+        with open(script_name, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=script_name)
+        defined = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+        _entry_names[script_name] = next((name for name in ENTRY_FUNCTIONS if name in defined), None)
+    return _entry_names[script_name]
+
+def load_script_module(script_name):
+    """导入推理脚本模块并缓存，模块级的模型加载只发生一次"""
+    if script_name not in _loaded_modules:
+        module_name = os.path.splitext(script_name)[0]
+        spec = importlib.util.spec_from_file_location(module_name, os.path.abspath(script_name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_modules[script_name] = module
+    return _loaded_modules[script_name]
+
+def run_script(script_name, file_path, process_id):
+    """执行一次推理"""
+    if script_name not in ALLOWED_SCRIPTS:
+        raise ValueError(f"不支持的推理脚本: {script_name}")
+
+    entry_name = find_entry_name(script_name)
+    if entry_name is None:
+        # 只能从命令行运行的脚本：不导入模块，按原命令行方式执行（避免导入和执行各加载一次模型）
+        run_with_argv(lambda: runpy.run_path(script_name, run_name='__main__'), script_name, file_path, process_id)
+        return
+
+    module = load_script_module(script_name)
+    if entry_name == 'run_inference':
+        module.run_inference(file_path, process_id)
+        return
+
+    # 脚本只有命令行入口 main()，模块（模型）已导入一次，这里只按原命令行参数调用入口
+    run_with_argv(module.main, script_name, file_path, process_id)
+
+def run_with_argv(entry, script_name, file_path, process_id):
+    """以与原命令行相同的 sys.argv 调用命令行入口，非零退出状态视为失败"""
+    saved_argv = sys.argv
+    sys.argv = [script_name, '--file_path', file_path, '--process_id', process_id]
+    try:
+        entry()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"推理脚本退出状态: {e.code}")
+    finally:
+        sys.argv = saved_argv
+
+def find_batch_entry(script_name):
+    """返回推理脚本的批量入口 run_inference_batch，没有时返回 None"""
+    if script_name not in ALLOWED_SCRIPTS or find_entry_name(script_name) is None:
+        return None
+    return getattr(load_script_module(script_name), 'run_inference_batch', None)
+
+def run_manifest(manifest, runner=run_script):
+    """
+    执行一个清单中的所有推理，单张图片失败不影响其他图片
+    Args:
+        manifest: [{"script", "file_path", "process_id"}, ...]
+        runner: 单张推理执行函数
+    Returns:
+        list: 与清单顺序一致的 [{"process_id", "ok", "error"}, ...]
+    """
+    results = {}
+    groups = {}
+    for item in manifest:
+        groups.setdefault(item['script'], []).append(item)
+
+    for script_name, items in groups.items():
+        try:
+            batch_entry = find_batch_entry(script_name) if runner is run_script else None
+            if batch_entry is not None:
+                batch_entry([(item['file_path'], item['process_id']) for item in items])
+                for item in items:
+                    results[item['process_id']] = {'process_id': item['process_id'], 'ok': True, 'error': ''}
+                continue
+        except Exception:
+            # 批量入口失败时逐张重试，找出具体失败的图片
+            traceback.print_exc(file=sys.stderr)
+
+        for item in items:
+            result = {'process_id': item['process_id'], 'ok': True, 'error': ''}
+            try:
+                runner(script_name, item['file_path'], item['process_id'])
+            except Exception as e:
+                result['ok'] = False
+                result['error'] = f"{type(e).__name__}: {e}"
+                traceback.print_exc(file=sys.stderr)
+            results[item['process_id']] = result
+
+    return [results[item['process_id']] for item in manifest]
+
+def handle_job(job, runner):
+    """处理单个任务（或清单任务）并返回结果字典"""
+    start_time = time.time()
+    response = {'job_id': job.get('job_id'), 'ok': True, 'error': ''}
+    try:
+        if 'manifest' in job:
+            response['results'] = run_manifest(job['manifest'], runner)
+            failed = [r['process_id'] for r in response['results'] if not r['ok']]
+            if failed:
+                response['ok'] = False
+                response['error'] = f"{len(failed)}/{len(job['manifest'])} 张图片推理失败"
+        else:
+            runner(job['script'], job['file_path'], job['process_id'])
+    except Exception as e:
+        response['ok'] = False
+        response['error'] = f"{type(e).__name__}: {e}"
+        traceback.print_exc(file=sys.stderr)
+    response['elapsed'] = round(time.time() - start_time, 4)
+    return response
+
+def serve(in_stream, out_stream, runner=run_script):
+    """
+    任务循环：逐行读取JSON任务并逐行写回结果，输入流关闭时退出
+    Args:
+        in_stream: 任务输入流（文本）
+        out_stream: 结果输出流（文本）
+        runner: 推理执行函数 runner(script, file_path, process_id)
+    """
+    def reply(message):
+        out_stream.write(json.dumps(message, ensure_ascii=False) + '\n')
+        out_stream.flush()
+
+    reply({'ready': True, 'pid': os.getpid()})
+    for line in in_stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError:
+            reply({'job_id': None, 'ok': False, 'error': f"无法解析的任务: {line[:200]}"})
+            continue
+        if job.get('command') == 'shutdown':
+            break
+        # 推理脚本的打印输出重定向到标准错误，避免破坏协议
+        with redirect_stdout(sys.stderr):
+            response = handle_job(job, runner)
+        reply(response)
+
+def run_manifest_file(manifest_path, out_stream, runner=run_script):
+    """单次执行清单文件，并向输出流写一行JSON结果"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    with redirect_stdout(sys.stderr):
+        response = handle_job({'job_id': os.path.basename(manifest_path), 'manifest': manifest}, runner)
+    out_stream.write(json.dumps(response, ensure_ascii=False) + '\n')
+    out_stream.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻远程推理进程")
+    parser.add_argument('--manifest', help="单次执行的清单文件路径，不指定时进入常驻任务循环")
+    args = parser.parse_args()
+    if args.manifest:
+        run_manifest_file(args.manifest, sys.stdout)
+    else:
+        serve(sys.stdin, sys.stdout)
@@ -0,0 +1,104 @@
+import os
+import json
+import datetime
+
+import pytest
+
+from utils.anomaly_rules import (RingBuffer, ConsecutiveRule, KOfNRule, EwmaVoltageRule, AnomalyRuleEngine,
+                                 build_rule, parse_record_time)
+from utils.checkpoint_journal import read_checkpoint
+
+ANOMALY = {'anomaly_level': '很可能异常'}
+NORMAL = {'anomaly_level': '正常'}
+
+def feed(engine, flags):
+    """按 1/0 依次输入异常/正常结果，返回每次触发的 (序号, 规则名, 图片列表)"""
+    triggers = []
+    for index, flag in enumerate(flags, 1):
+        for rule, records in engine.update(f'img{index}', f'p{index}', ANOMALY if flag else NORMAL):
+            triggers.append((index, rule.name, [record['file_path'] for record in records]))
+    return triggers
+
+def test_ring_buffer_overwrites_oldest():
+    buffer = RingBuffer(3)
+    assert [buffer.append(value) for value in range(5)] == [None, None, None, 0, 1]
+    assert list(buffer.latest(5)) == [2, 3, 4]
+    assert list(buffer.latest(2)) == [3, 4]
+    buffer.clear()
+    assert len(buffer) == 0 and list(buffer.latest(3)) == []
+
+def test_consecutive_rule_resets_on_normal_and_after_trigger():
+    engine = AnomalyRuleEngine([ConsecutiveRule(3)])
+    triggers = feed(engine, [1, 1, 0, 1, 1, 1, 1, 1, 1])
+    assert triggers == [
+        (6, 'consecutive_3', ['img4', 'img5', 'img6']),
+        (9, 'consecutive_3', ['img7', 'img8', 'img9']),
+    ]
+
+def test_k_of_n_rule_reports_only_new_anomalies():
+    engine = AnomalyRuleEngine([KOfNRule(3, 10)])
+    triggers = feed(engine, [1, 1, 1, 0, 0, 0, 0, 0, 0, 1, 1, 1])
+    assert triggers == [
+        (3, 'k_of_n_3_10', ['img1', 'img2', 'img3']),
+        (12, 'k_of_n_3_10', ['img10', 'img11', 'img12']),
+    ]
+
+def test_k_of_n_rule_window_slides():
+    engine = AnomalyRuleEngine([KOfNRule(2, 3)])
+    # 两次异常相隔3张以上，窗口内始终不足2张
+    assert feed(engine, [1, 0, 0, 1, 0, 0, 1]) == []
+
+def test_rules_keep_independent_trigger_points():
+    engine = AnomalyRuleEngine([ConsecutiveRule(2), KOfNRule(3, 5)])
+    triggers = feed(engine, [1, 1, 0, 1])
+    assert triggers == [
+        (2, 'consecutive_2', ['img1', 'img2']),
+        (4, 'k_of_n_3_5', ['img1', 'img2', 'img4']),
+    ]
+
+def test_ewma_voltage_rule_triggers_once_per_crossing():
+    rule = EwmaVoltageRule(threshold=3.0, alpha=0.5, direction='above', min_samples=2, window=3)
+    engine = AnomalyRuleEngine([rule])
+    voltages = [1.0, 5.0, 5.0, 5.0, 1.0, 1.0, 5.0, 5.0]
+    fired = []
+    for index, voltage in enumerate(voltages, 1):
+        for _, records in engine.update(f'img{index}', f'p{index}', {'anomaly_level': '正常', 'analog_voltage': voltage}):
+            fired.append((index, [record['file_path'] for record in records]))
+    # EWMA: 1, 3, 4(越限触发), 4.5, 2.75(回落), 1.875, 3.44(再次越限触发), 4.22
+    assert fired == [(3, ['img1', 'img2', 'img3']), (7, ['img5', 'img6', 'img7'])]
+
+def test_ewma_voltage_rule_ignores_missing_voltage():
+    rule = EwmaVoltageRule(threshold=1.0, direction='below', min_samples=1)
+    assert rule.update({'analog_voltage': None}, False) is False
+    assert rule.update({'analog_voltage': 0.5}, False) is True
+
+def test_build_rule_from_spec():
+    assert isinstance(build_rule({'type': 'consecutive', 'n': 4}), ConsecutiveRule)
+    rule = build_rule({'type': 'k_of_n', 'k': 12, 'n': 10, 'name': 'line3'})
+    assert (rule.k, rule.n, rule.name) == (10, 10, 'line3')
+    with pytest.raises(ValueError):
+        build_rule({'type': 'unknown'})
+
+def test_save_record_names_are_unique_and_readable(tmp_path):
+    engine = AnomalyRuleEngine([ConsecutiveRule(1)], anomalies_dir=str(tmp_path), source_name='camA')
+    (rule, records), = engine.update('img1', 'p1', ANOMALY)
+    paths = [engine.save_record(rule, records) for _ in range(3)]
+
+    assert len(set(paths)) == 3
+    for path in paths:
+        filename = os.path.basename(path)
+        assert filename.endswith('_camA_consecutive_1.json') or '_camA_consecutive_1_' in filename
+        assert parse_record_time(filename) is not None
+        data = read_checkpoint(path)
+        assert [item['process_id'] for item in data['processed_images']] == ['p1']
+        with open(path, 'r', encoding='utf-8') as f:
+            assert json.load(f)['description'] == '连续 1 张异常'
+
+@pytest.mark.parametrize('filename, expected', [
+    ('20240102_030405.json', datetime.datetime(2024, 1, 2, 3, 4, 5)),
+    ('20240102_030405__camA.json', datetime.datetime(2024, 1, 2, 3, 4, 5)),
+    ('20240102_030405_123456_camA_k_of_n_3_10.json', datetime.datetime(2024, 1, 2, 3, 4, 5, 123456)),
+    ('readme.json', None),
+])
+def test_parse_record_time(filename, expected):
+    assert parse_record_time(filename) == expected
@@ -0,0 +1,153 @@
+import time
+import random
+import threading
+
+from utils.batch_pipeline import PipelineJob, PipelineStage, ReorderBuffer, StagedPipeline, MicroBatcher
+
+def test_reorder_buffer_commits_in_submission_order():
+    committed = []
+    buffer = ReorderBuffer(lambda job: committed.append(job.seq))
+
+    assert buffer.push(PipelineJob(2, None)) == 0
+    assert buffer.push(PipelineJob(1, None)) == 0
+    assert buffer.push(PipelineJob(0, None)) == 3
+    assert buffer.push(PipelineJob(3, None)) == 1
+    assert committed == [0, 1, 2, 3]
+    assert buffer.pending == {}
+
+def test_reorder_buffer_continues_after_sink_error():
+    committed = []
+
+    def sink(job):
+        if job.seq == 0:
+            raise RuntimeError('写检查点失败')
+        committed.append(job.seq)
+
+    buffer = ReorderBuffer(sink)
+    buffer.push(PipelineJob(1, None))
+    assert buffer.push(PipelineJob(0, None)) == 2
+    assert committed == [1]
+
+def test_pipeline_commits_out_of_order_completions_in_order():
+    committed = []
+
+    def slow_stage(job):
+        # 各任务耗时随机，完成顺序与提交顺序不同
+        time.sleep(random.uniform(0, 0.02))
+        job.context['seen'] = job.payload
+
+    pipeline = StagedPipeline([PipelineStage('a', slow_stage, workers=4),
+                               PipelineStage('b', slow_stage, workers=3)],
+                              sink=lambda job: committed.append(job.payload))
+    pipeline.start()
+    for index in range(30):
+        pipeline.submit(index)
+    assert pipeline.wait_idle(timeout=10)
+    pipeline.shutdown(cancel=False)
+    assert committed == list(range(30))
+    assert pipeline.pending_count() == 0
+
+def test_pipeline_skips_later_stages_after_failure():
+    calls = []
+    committed = []
+
+    def first(job):
+        if job.payload == 1:
+            raise ValueError('上传失败')
+
+    pipeline = StagedPipeline([PipelineStage('upload', first), PipelineStage('execute', lambda job: calls.append(job.payload))],
+                              sink=committed.append)
+    pipeline.start()
+    for index in range(3):
+        pipeline.submit(index)
+    assert pipeline.wait_idle(timeout=10)
+    pipeline.shutdown(cancel=False)
+
+    assert calls == [0, 2]
+    failed = committed[1]
+    assert failed.failed_stage == 'upload' and isinstance(failed.error, ValueError)
+    assert set(failed.timings) == {'upload'}
+
+def test_shutdown_without_cancel_drains_submitted_jobs():
+    release = threading.Event()
+    committed = []
+
+    def blocking_stage(job):
+        release.wait(5)
+
+    pipeline = StagedPipeline([PipelineStage('execute', blocking_stage, workers=1, queue_size=8)],
+                              sink=committed.append)
+    pipeline.start()
+    for index in range(3):
+        pipeline.submit(index)
+    threading.Timer(0.05, release.set).start()
+    pipeline.shutdown(cancel=False)
+
+    assert [job.payload for job in committed] == [0, 1, 2]
+    assert not any(job.cancelled for job in committed)
+
+def test_shutdown_with_cancel_marks_unstarted_jobs():
+    started = threading.Event()
+    release = threading.Event()
+    committed = []
+
+    def blocking_stage(job):
+        started.set()
+        release.wait(5)
+
+    pipeline = StagedPipeline([PipelineStage('execute', blocking_stage, workers=1, queue_size=8)],
+                              sink=committed.append)
+    pipeline.start()
+    for index in range(3):
+        pipeline.submit(index)
+    assert started.wait(5)
+    pipeline.cancel_pending()
+    release.set()
+    pipeline.shutdown(cancel=True)
+
+    assert [(job.payload, job.cancelled) for job in committed] == [(0, False), (1, True), (2, True)]
+
+def test_micro_batcher_flushes_full_batches_immediately():
+    batches = []
+    batcher = MicroBatcher(batches.append, max_size=3, max_wait=60)
+    for index in range(7):
+        batcher.add(index)
+    # 凑满的批次在 add 的调用线程中立即交出，不等待计时
+    assert batches == [[0, 1, 2], [3, 4, 5]]
+    batcher.close(flush=True)
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_micro_batcher_flushes_partial_batch_after_max_wait():
+    flushed = threading.Event()
+    batches = []
+
+    def on_flush(batch):
+        batches.append((batch, time.monotonic()))
+        flushed.set()
+
+    batcher = MicroBatcher(on_flush, max_size=10, max_wait=0.05)
+    added_at = time.monotonic()
+    batcher.add('a')
+    batcher.add('b')
+    assert flushed.wait(5)
+    batcher.close(flush=False)
+
+    assert [batch for batch, _ in batches] == [['a', 'b']]
+    assert batches[0][1] - added_at >= 0.05
+
+def test_micro_batcher_close_without_flush_keeps_items():
+    batches = []
+    batcher = MicroBatcher(batches.append, max_size=10, max_wait=60)
+    batcher.add('a')
+    batcher.close(flush=False)
+
+    assert batches == []
+    assert batcher.items == ['a']
+
+def test_micro_batcher_batch_of_one_flushes_each_item():
+    batches = []
+    batcher = MicroBatcher(batches.append, max_size=1, max_wait=60)
+    for index in range(3):
+        batcher.add(index)
+    batcher.close()
+    assert batches == [[0], [1], [2]]
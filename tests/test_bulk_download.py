@@ -0,0 +1,150 @@
+import os
+
+from utils.bulk_download import BulkDownloader, DownloadTask, PART_SUFFIX
+
+class FakeStat:
+    def __init__(self, size):
+        self.st_size = size
+
+class FakeRemoteFile:
+    """记录读取位置的远程文件"""
+    def __init__(self, data, reads):
+        self.data = data
+        self.position = 0
+        self.reads = reads
+
+    def seek(self, offset):
+        self.position = offset
+
+    def read(self, size):
+        chunk = self.data[self.position:self.position + size]
+        self.reads.append((self.position, len(chunk)))
+        self.position += len(chunk)
+        return chunk
+
+    def prefetch(self, *args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeSFTP:
+    def __init__(self, files):
+        self.files = files
+        self.reads = []
+
+    def stat(self, path):
+        if path not in self.files:
+            raise FileNotFoundError(path)
+        return FakeStat(len(self.files[path]))
+
+    def open(self, path, mode):
+        return FakeRemoteFile(self.files[path], self.reads)
+
+class FakeProfile:
+    prefetch_get = False
+    max_concurrent_prefetch_requests = None
+
+class FakeClient:
+    def __init__(self, sftp):
+        self.sftp = sftp
+        self.transfer_profile = FakeProfile()
+        self.lease = None
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+def make_downloader(sftp, **kwargs):
+    kwargs.setdefault('workers', 1)
+    kwargs.setdefault('block_size', 4)
+    return BulkDownloader(lambda: FakeClient(sftp), **kwargs)
+
+def test_resumes_from_part_offset(tmp_path):
+    data = b'0123456789abcdef'
+    sftp = FakeSFTP({'/out/p1/result.json': data})
+    local_path = str(tmp_path / 'p1' / 'result.json')
+    os.makedirs(os.path.dirname(local_path))
+    with open(local_path + PART_SUFFIX, 'wb') as f:
+        f.write(data[:6])
+
+    downloader = make_downloader(sftp)
+    completed, failed = downloader.download([DownloadTask('/out/p1/result.json', local_path)])
+
+    assert (completed, failed) == (1, [])
+    with open(local_path, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(local_path + PART_SUFFIX)
+    # 只读取 .part 之后的字节
+    assert sftp.reads[0][0] == 6
+    assert downloader.bytes_downloaded == len(data) - 6
+
+def test_part_larger_than_remote_restarts(tmp_path):
+    data = b'abc'
+    sftp = FakeSFTP({'/r/a': data})
+    local_path = str(tmp_path / 'a')
+    with open(local_path + PART_SUFFIX, 'wb') as f:
+        f.write(b'stale-and-longer')
+
+    completed, _ = make_downloader(sftp).download([DownloadTask('/r/a', local_path)])
+    assert completed == 1
+    with open(local_path, 'rb') as f:
+        assert f.read() == data
+
+def test_stop_keeps_part_for_next_run(tmp_path):
+    data = bytes(range(40))
+    sftp = FakeSFTP({'/r/a': data})
+    local_path = str(tmp_path / 'a')
+
+    downloader = make_downloader(sftp, progress_interval=0)
+    # 第一块写完后请求停止
+    downloader.progress_callback = lambda *args: downloader.stop()
+    completed, failed = downloader.download([DownloadTask('/r/a', local_path)])
+    assert (completed, failed) == (0, [])
+    assert not os.path.exists(local_path)
+    partial_size = os.path.getsize(local_path + PART_SUFFIX)
+    assert 0 < partial_size < len(data)
+
+    sftp.reads.clear()
+    completed, _ = make_downloader(sftp).download([DownloadTask('/r/a', local_path)])
+    assert completed == 1
+    assert sftp.reads[0][0] == partial_size
+    with open(local_path, 'rb') as f:
+        assert f.read() == data
+
+def test_existing_file_is_skipped_and_missing_file_fails(tmp_path):
+    sftp = FakeSFTP({'/r/a': b'new', '/r/b': b'bbb'})
+    existing = tmp_path / 'a'
+    existing.write_bytes(b'old')
+    tasks = [DownloadTask('/r/a', str(existing)), DownloadTask('/r/missing', str(tmp_path / 'm')),
+             DownloadTask('/r/b', str(tmp_path / 'b'))]
+
+    completed, failed = make_downloader(sftp, workers=2).download(tasks)
+
+    assert completed == 2
+    assert [task.remote_path for task, _ in failed] == ['/r/missing']
+    assert existing.read_bytes() == b'old'
+    assert (tmp_path / 'b').read_bytes() == b'bbb'
+
+def test_state_index_sizes_replace_stat(tmp_path):
+    class FakeIndex:
+        def __init__(self):
+            self.queries = []
+
+        def file_size(self, sftp, remote_path):
+            self.queries.append(remote_path)
+            return 3 if remote_path == '/r/a' else None
+
+    sftp = FakeSFTP({'/r/a': b'abc'})
+    index = FakeIndex()
+    completed, failed = make_downloader(sftp, state_index=index).download(
+        [DownloadTask('/r/a', str(tmp_path / 'a')), DownloadTask('/r/gone', str(tmp_path / 'g'))])
+
+    assert completed == 1
+    assert index.queries == ['/r/a', '/r/gone']
+    assert '远程文件不存在' in failed[0][1]
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+
+from utils.checkpoint_journal import CheckpointJournal, read_checkpoint, journal_path, ROTATED_SUFFIX
+
+def entry(name, process_id='p'):
+    return {'file_path': f'/watch/{name}', 'process_id': process_id, 'processed_time': f'2024-01-01T00:00:0{len(name) % 10}'}
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+def test_read_checkpoint_legacy_path_list(tmp_path):
+    checkpoint = tmp_path / 'c.json'
+    write_json(checkpoint, {'processed_images': ['/watch/a.png', '/watch/b.png'], 'last_update': 'x'})
+
+    data = read_checkpoint(str(checkpoint))
+    assert [item['file_path'] for item in data['processed_images']] == ['/watch/a.png', '/watch/b.png']
+    assert data['processed_images'][0]['process_id'] == 'unknown'
+    assert data['last_update'] == 'x'
+
+def test_read_checkpoint_merges_snapshot_and_journal(tmp_path):
+    checkpoint = tmp_path / 'c.json'
+    write_json(checkpoint, {'processed_images': [entry('a.png', 'old'), entry('b.png')], 'last_update': 'x'})
+    with open(journal_path(str(checkpoint)), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(entry('a.png', 'new')) + '\n')
+        f.write(json.dumps(entry('c.png')) + '\n')
+
+    data = read_checkpoint(str(checkpoint))
+    by_path = {item['file_path']: item for item in data['processed_images']}
+    assert set(by_path) == {'/watch/a.png', '/watch/b.png', '/watch/c.png'}
+    # 日志中后写入的记录覆盖快照
+    assert by_path['/watch/a.png']['process_id'] == 'new'
+    assert data['last_update'] == entry('c.png')['processed_time']
+
+def test_truncated_last_line_is_ignored_and_removed(tmp_path):
+    checkpoint = tmp_path / 'c.json'
+    write_json(checkpoint, {'processed_images': [], 'last_update': ''})
+    with open(journal_path(str(checkpoint)), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(entry('a.png')) + '\n')
+        f.write('{"file_path": "/watch/b.p')  # 崩溃时写了一半
+
+    assert [item['file_path'] for item in read_checkpoint(str(checkpoint))['processed_images']] == ['/watch/a.png']
+
+    journal = CheckpointJournal(str(checkpoint), compact_every=100)
+    journal.append(entry('c.png'))
+    journal.journal.flush()
+    with open(journal_path(str(checkpoint)), 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    # 半行被截掉，新记录不会与它粘连
+    assert [json.loads(line)['file_path'] for line in lines] == ['/watch/a.png', '/watch/c.png']
+    journal.close()
+
+def test_new_checkpoint_writes_empty_snapshot(tmp_path):
+    checkpoint = tmp_path / 'c.json'
+    journal = CheckpointJournal(str(checkpoint))
+    assert os.path.exists(checkpoint)
+    assert journal.processed_images == {}
+    journal.close()
+
+def test_compaction_moves_journal_into_snapshot(tmp_path):
+    checkpoint = tmp_path / 'c.json'
+    journal = CheckpointJournal(str(checkpoint), compact_every=3)
+    for name in ('a.png', 'b.png', 'c.png'):
+        journal.append(entry(name))
+    journal.compact_thread.join(5)
+    journal.append(entry('d.png'))
+
+    with open(checkpoint, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    assert [item['file_path'] for item in snapshot['processed_images']] == ['/watch/a.png', '/watch/b.png', '/watch/c.png']
+    assert not os.path.exists(str(checkpoint)[:-len('.json')] + ROTATED_SUFFIX)
+    assert len(read_checkpoint(str(checkpoint))['processed_images']) == 4
+
+    journal.close()
+    # 关闭时再压缩一次，只剩快照
+    assert not os.path.exists(journal_path(str(checkpoint)))
+    assert len(read_checkpoint(str(checkpoint))['processed_images']) == 4
+
+def test_reopen_after_interrupted_compaction(tmp_path):
+    checkpoint = tmp_path / 'c.json'
+    write_json(checkpoint, {'processed_images': [entry('a.png')], 'last_update': ''})
+    base = str(checkpoint)[:-len('.json')]
+    with open(base + ROTATED_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(entry('b.png')) + '\n')
+    with open(journal_path(str(checkpoint)), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(entry('c.png')) + '\n')
+
+    journal = CheckpointJournal(str(checkpoint))
+    assert set(journal.processed_images) == {'/watch/a.png', '/watch/b.png', '/watch/c.png'}
+    assert not os.path.exists(base + ROTATED_SUFFIX)
+    journal.close()
+
+def test_fsync_batches_and_idle_timer(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / 'c.json'), fsync_interval=0.5, fsync_batch=3, compact_every=100)
+    journal.last_sync = time.time()
+    journal.append(entry('a.png'))
+    journal.append(entry('b.png'))
+    assert journal.unsynced == 2
+    journal.append(entry('c.png'))
+    assert journal.unsynced == 0
+
+    # 追加停止后，间隔到达时由定时器刷盘
+    journal.append(entry('d.png'))
+    assert journal.unsynced == 1
+    deadline = time.time() + 5
+    while journal.unsynced and time.time() < deadline:
+        time.sleep(0.02)
+    assert journal.unsynced == 0
+    journal.close()
@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+from utils.directory_index import DirectoryIndex
+
+@pytest.fixture
+def watch_dir(tmp_path):
+    directory = tmp_path / 'watch'
+    directory.mkdir()
+    return directory
+
+def make_index(watch_dir, tmp_path, **kwargs):
+    kwargs.setdefault('settle_time', 2.0)
+    return DirectoryIndex(str(watch_dir), index_dir=str(tmp_path / 'index'), **kwargs)
+
+def write_image(directory, name, data=b'x', age=10.0):
+    """写入图片并把修改时间设为 age 秒之前（默认已稳定）"""
+    path = directory / name
+    path.write_bytes(data)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+def names(paths):
+    return [os.path.basename(path) for path in paths]
+
+def test_cursor_returns_only_new_files_in_creation_order(watch_dir, tmp_path):
+    write_image(watch_dir, 'b.png')
+    write_image(watch_dir, 'a.jpg')
+    write_image(watch_dir, 'notes.txt')
+    index = make_index(watch_dir, tmp_path)
+    index.refresh()
+    paths, cursor = index.entries_since(0)
+    assert sorted(names(paths)) == ['a.jpg', 'b.png']
+
+    write_image(watch_dir, 'c.png')
+    index.refresh()
+    paths, cursor = index.entries_since(cursor)
+    assert names(paths) == ['c.png']
+    assert index.entries_since(cursor) == ([], cursor)
+
+def test_unchanged_directory_is_not_listed_again(watch_dir, tmp_path):
+    write_image(watch_dir, 'a.png')
+    index = make_index(watch_dir, tmp_path, mtime_granularity=0)
+    # 文件夹修改时间早于上次读取（超出精度范围）时不重新读取
+    old = time.time() - 60
+    os.utime(watch_dir, (old, old))
+    assert index.refresh() is True
+    assert index.refresh() is False
+
+def test_file_still_being_written_is_held_until_it_settles(watch_dir, tmp_path):
+    path = write_image(watch_dir, 'a.png', b'x' * 10, age=0)
+    index = make_index(watch_dir, tmp_path, settle_time=0.2)
+    index.refresh()
+    assert index.entries_since(0) == ([], 0)
+    assert 'a.png' in index.unsettled
+
+    # 继续写入：大小变化，重新计时
+    with open(path, 'ab') as f:
+        f.write(b'y' * 10)
+    index.refresh()
+    assert index.entries_since(0) == ([], 0)
+
+    time.sleep(0.25)
+    index.refresh()
+    paths, _ = index.entries_since(0)
+    assert names(paths) == ['a.png']
+    assert index.entries['a.png'][1] == 20
+    assert index.unsettled == {}
+
+def test_unsettled_file_forces_relisting(watch_dir, tmp_path):
+    write_image(watch_dir, 'a.png', age=0)
+    index = make_index(watch_dir, tmp_path, settle_time=0.1, mtime_granularity=0)
+    old = time.time() - 60
+    os.utime(watch_dir, (old, old))
+    index.refresh()
+    # 写入文件内容不会改变文件夹修改时间，但仍有未稳定的文件，必须重新读取
+    time.sleep(0.15)
+    assert index.refresh() is True
+    assert names(index.entries_since(0)[0]) == ['a.png']
+
+def test_deleted_unsettled_file_is_forgotten(watch_dir, tmp_path):
+    path = write_image(watch_dir, 'a.png', age=0)
+    index = make_index(watch_dir, tmp_path)
+    index.refresh()
+    os.remove(path)
+    index.refresh()
+    assert index.unsettled == {}
+
+@pytest.mark.skipif(os.name == 'nt', reason="Windows 上只按文件名判断")
+def test_replaced_file_gets_new_sequence(watch_dir, tmp_path):
+    path = write_image(watch_dir, 'a.png')
+    index = make_index(watch_dir, tmp_path)
+    index.refresh()
+    _, cursor = index.entries_since(0)
+
+    # 相机软件先写临时文件再重命名覆盖：新文件的 inode 不同
+    write_image(watch_dir, 'tmp.tmp', b'new')
+    os.replace(watch_dir / 'tmp.tmp', path)
+    index.refresh()
+    paths, _ = index.entries_since(cursor)
+    assert names(paths) == ['a.png']
+
+def test_index_persists_across_instances(watch_dir, tmp_path):
+    write_image(watch_dir, 'a.png')
+    index = make_index(watch_dir, tmp_path)
+    index.refresh()
+    _, cursor = index.entries_since(0)
+    index.close()
+
+    write_image(watch_dir, 'b.png')
+    reopened = make_index(watch_dir, tmp_path)
+    assert set(reopened.entries) == {'a.png'}
+    reopened.refresh()
+    paths, _ = reopened.entries_since(cursor)
+    assert names(paths) == ['b.png']
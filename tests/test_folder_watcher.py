@@ -0,0 +1,73 @@
+import errno
+import os
+import sys
+
+import pytest
+
+from utils.folder_watcher import InotifyWatcher
+from utils.watch_sources import WatchSource
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify 仅在Linux上可用')
+
+
+def start_source(directory):
+    source = WatchSource(str(directory))
+    watcher = InotifyWatcher(str(directory))
+    if not watcher.start():
+        pytest.skip('当前文件系统不支持inotify')
+    source.watcher = watcher
+    source.last_scan_time = 1e18
+    return source
+
+
+def test_read_events_reports_new_images(tmp_path):
+    source = start_source(tmp_path)
+    try:
+        (tmp_path / 'a.png').write_bytes(b'x')
+        (tmp_path / 'notes.txt').write_bytes(b'x')
+        assert source.watcher.read_events(1.0) == [str(tmp_path / 'a.png')]
+    finally:
+        source.close()
+
+
+def test_read_error_falls_back_to_polling(tmp_path, monkeypatch):
+    source = start_source(tmp_path)
+    (tmp_path / 'a.png').write_bytes(b'x')
+
+    def failing_read(fd, size):
+        raise OSError(errno.EIO, os.strerror(errno.EIO))
+
+    monkeypatch.setattr('utils.folder_watcher.os.read', failing_read)
+    assert source.read_events() == []
+    assert source.watcher is None
+    assert source.fileno() is None
+    # 退回轮询后立即补一次扫描
+    assert source.scan_due(5, 300)
+
+
+def test_closed_descriptor_falls_back_to_polling(tmp_path):
+    source = start_source(tmp_path)
+    watcher = source.watcher
+    os.close(watcher.fd)
+    try:
+        assert source.read_events() == []
+        assert source.watcher is None
+        assert watcher.fd is None
+    finally:
+        watcher.fd = None
+
+
+def test_eagain_keeps_watching(tmp_path, monkeypatch):
+    source = start_source(tmp_path)
+    try:
+        (tmp_path / 'a.png').write_bytes(b'x')
+
+        def busy_read(fd, size):
+            raise BlockingIOError(errno.EAGAIN, os.strerror(errno.EAGAIN))
+
+        monkeypatch.setattr('utils.folder_watcher.os.read', busy_read)
+        assert source.read_events() == []
+        assert source.watcher is not None
+    finally:
+        monkeypatch.undo()
+        source.close()
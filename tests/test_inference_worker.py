@@ -0,0 +1,146 @@
+import io
+import json
+import textwrap
+
+import pytest
+
+from remote import inference_worker
+
+# 替身推理脚本：把每次调用写入 calls.txt，模块级代码（模拟模型加载）每执行一次写入 loads.txt
+RUN_INFERENCE_SCRIPT = '''
+with open('loads.txt', 'a') as f:
+    f.write('api.py\\n')
+
+def run_inference(file_path, process_id):
+    print('模型输出不应进入协议')
+    with open('calls.txt', 'a') as f:
+        f.write(f'run_inference {file_path} {process_id}\\n')
+
+def run_inference_batch(items):
+    with open('calls.txt', 'a') as f:
+        f.write(f'batch {len(items)}\\n')
+'''
+
+CLI_ONLY_SCRIPT = '''
+import argparse
+with open('loads.txt', 'a') as f:
+    f.write('api_v2_http_batch.py\\n')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file_path')
+    parser.add_argument('--process_id')
+    args = parser.parse_args()
+    print('命令行脚本输出')
+    with open('calls.txt', 'a') as f:
+        f.write(f'cli {args.file_path} {args.process_id}\\n')
+'''
+
+MAIN_SCRIPT = '''
+import sys
+import argparse
+with open('loads.txt', 'a') as f:
+    f.write('api_v3_http.py\\n')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file_path')
+    parser.add_argument('--process_id')
+    args = parser.parse_args()
+    if args.file_path == 'fail.png':
+        sys.exit(3)
+    with open('calls.txt', 'a') as f:
+        f.write(f'main {args.file_path} {args.process_id}\\n')
+
+if __name__ == '__main__':
+    main()
+'''
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录中放置替身推理脚本，并清空工作进程的模块缓存"""
+    (tmp_path / 'api.py').write_text(textwrap.dedent(RUN_INFERENCE_SCRIPT), encoding='utf-8')
+    (tmp_path / 'api_v2_http_batch.py').write_text(textwrap.dedent(CLI_ONLY_SCRIPT), encoding='utf-8')
+    (tmp_path / 'api_v3_http.py').write_text(textwrap.dedent(MAIN_SCRIPT), encoding='utf-8')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(inference_worker, '_loaded_modules', {})
+    monkeypatch.setattr(inference_worker, '_entry_names', {})
+    return tmp_path
+
+def read_lines(path):
+    return path.read_text(encoding='utf-8').splitlines() if path.exists() else []
+
+def run_serve(jobs):
+    """通过标准输入/输出协议驱动 serve，返回解析后的全部输出行"""
+    lines = [job if isinstance(job, str) else json.dumps(job, ensure_ascii=False) for job in jobs]
+    in_stream = io.StringIO('\n'.join(lines) + '\n')
+    out_stream = io.StringIO()
+    inference_worker.serve(in_stream, out_stream)
+    return [json.loads(line) for line in out_stream.getvalue().splitlines()]
+
+def job(job_id, script, file_path, process_id='p'):
+    return {'job_id': job_id, 'script': script, 'file_path': file_path, 'process_id': process_id}
+
+def test_serve_loads_run_inference_script_once(workdir):
+    replies = run_serve([job('1', 'api.py', 'a.png', 'p1'), job('2', 'api.py', 'b.png', 'p2')])
+
+    assert replies[0]['ready'] is True
+    assert [(r['job_id'], r['ok']) for r in replies[1:]] == [('1', True), ('2', True)]
+    assert read_lines(workdir / 'loads.txt') == ['api.py']
+    assert read_lines(workdir / 'calls.txt') == ['run_inference a.png p1', 'run_inference b.png p2']
+
+def test_serve_runs_cli_only_script_with_original_arguments(workdir):
+    replies = run_serve([job('1', 'api_v2_http_batch.py', 'a.png', 'p1'),
+                         job('2', 'api_v2_http_batch.py', 'b.png', 'p2')])
+
+    assert [r['ok'] for r in replies[1:]] == [True, True]
+    assert read_lines(workdir / 'calls.txt') == ['cli a.png p1', 'cli b.png p2']
+    # 不预先导入：每个任务只执行一次脚本
+    assert read_lines(workdir / 'loads.txt') == ['api_v2_http_batch.py'] * 2
+
+def test_serve_calls_main_entry_and_reports_exit_status(workdir):
+    replies = run_serve([job('1', 'api_v3_http.py', 'fail.png'), job('2', 'api_v3_http.py', 'a.png', 'p2')])
+
+    assert replies[1]['ok'] is False
+    assert '退出状态: 3' in replies[1]['error']
+    assert replies[2]['ok'] is True
+    assert read_lines(workdir / 'loads.txt') == ['api_v3_http.py']
+    assert read_lines(workdir / 'calls.txt') == ['main a.png p2']
+
+def test_serve_rejects_bad_input_and_stops_on_shutdown(workdir):
+    replies = run_serve(['not json', job('1', 'evil.py', 'a.png'), {'command': 'shutdown'},
+                         job('2', 'api.py', 'a.png')])
+
+    assert len(replies) == 3
+    assert replies[1]['ok'] is False and replies[1]['job_id'] is None
+    assert replies[2]['ok'] is False and '不支持的推理脚本' in replies[2]['error']
+    assert not (workdir / 'calls.txt').exists()
+
+def test_manifest_uses_batch_entry_and_isolates_failures(workdir):
+    manifest = [
+        {'script': 'api_v3_http.py', 'file_path': 'fail.png', 'process_id': 'p1'},
+        {'script': 'api.py', 'file_path': 'a.png', 'process_id': 'p2'},
+        {'script': 'api_v3_http.py', 'file_path': 'b.png', 'process_id': 'p3'},
+        {'script': 'api.py', 'file_path': 'c.png', 'process_id': 'p4'},
+    ]
+    replies = run_serve([{'job_id': 'm', 'manifest': manifest}])
+
+    response = replies[1]
+    assert response['ok'] is False
+    assert response['error'].startswith('1/4')
+    assert [(r['process_id'], r['ok']) for r in response['results']] == \
+        [('p1', False), ('p2', True), ('p3', True), ('p4', True)]
+    assert sorted(read_lines(workdir / 'calls.txt')) == ['batch 2', 'main b.png p3']
+
+def test_run_manifest_file_writes_single_result_line(workdir):
+    manifest_path = workdir / 'manifest.json'
+    out_stream = io.StringIO()
+    manifest_path.write_text(json.dumps([{'script': 'api_v3_http.py', 'file_path': 'fail.png', 'process_id': 'p1'},
+                                         {'script': 'api_v2_http_batch.py', 'file_path': 'a.png', 'process_id': 'p2'}]),
+                             encoding='utf-8')
+    inference_worker.run_manifest_file(str(manifest_path), out_stream)
+
+    lines = out_stream.getvalue().splitlines()
+    assert len(lines) == 1
+    response = json.loads(lines[0])
+    assert response['job_id'] == 'manifest.json'
+    assert [r['ok'] for r in response['results']] == [False, True]
@@ -0,0 +1,106 @@
+import time
+import threading
+
+import pytest
+
+from utils.job_scheduler import JobScheduler, INTERACTIVE, ONLINE_BATCH, PREVIEW, BULK
+
+def acquire_in_thread(scheduler, job_class, started, name=None):
+    """在后台线程中申请许可（取得后不归还），取得后把名称记入 started"""
+    def worker():
+        scheduler.acquire(job_class)
+        started.append(name or job_class)
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def waiting_count(scheduler):
+    with scheduler.condition:
+        return len(scheduler.waiting)
+
+def test_reserved_permit_is_kept_for_interactive():
+    scheduler = JobScheduler(max_concurrent=3, reserved_interactive=1)
+    batch_tickets = [scheduler.acquire(ONLINE_BATCH) for _ in range(2)]
+
+    started = []
+    thread = acquire_in_thread(scheduler, BULK, started)
+    assert wait_until(lambda: waiting_count(scheduler) == 1)
+    assert started == []  # 第3个许可只留给单图检测
+
+    interactive = scheduler.acquire(INTERACTIVE)  # 不必等待批处理
+    assert scheduler.running == 3
+
+    scheduler.release(interactive)
+    time.sleep(0.05)
+    assert started == []  # 归还的仍是保留许可
+    scheduler.release(batch_tickets[0])
+    thread.join(5)
+    assert started == [BULK]
+
+def test_released_permit_goes_to_highest_priority_waiter():
+    scheduler = JobScheduler(max_concurrent=2, reserved_interactive=0)
+    tickets = [scheduler.acquire(ONLINE_BATCH) for _ in range(2)]
+
+    started = []
+    threads = []
+    for job_class in (BULK, PREVIEW, INTERACTIVE):
+        thread = acquire_in_thread(scheduler, job_class, started)
+        threads.append(thread)
+        assert wait_until(lambda: waiting_count(scheduler) == len(threads))
+
+    scheduler.release(tickets[0])
+    assert wait_until(lambda: started == [INTERACTIVE])
+    scheduler.release(tickets[1])
+    assert wait_until(lambda: started == [INTERACTIVE, PREVIEW])
+    assert waiting_count(scheduler) == 1
+
+def test_class_limit_does_not_block_other_classes():
+    scheduler = JobScheduler(max_concurrent=4, limits={BULK: 1}, reserved_interactive=0)
+    bulk = scheduler.acquire(BULK)
+
+    started = []
+    thread = acquire_in_thread(scheduler, BULK, started, 'bulk-2')
+    assert wait_until(lambda: waiting_count(scheduler) == 1)
+    # 排在前面但已达上限的批量下载不挡住其他类别
+    preview = scheduler.acquire(PREVIEW)
+    assert started == []
+
+    scheduler.release(bulk)
+    thread.join(5)
+    assert started == ['bulk-2']
+    scheduler.release(preview)
+
+def test_cancelled_wait_raises_and_leaves_queue():
+    scheduler = JobScheduler(max_concurrent=1, reserved_interactive=0)
+    ticket = scheduler.acquire(ONLINE_BATCH)
+    with pytest.raises(InterruptedError):
+        scheduler.acquire(BULK, cancelled=lambda: True)
+    assert waiting_count(scheduler) == 0
+    scheduler.release(ticket)
+
+def test_slot_records_success_and_failure():
+    scheduler = JobScheduler(max_concurrent=2)
+    with scheduler.slot(ONLINE_BATCH):
+        pass
+    with pytest.raises(RuntimeError):
+        with scheduler.slot(ONLINE_BATCH):
+            raise RuntimeError('远程推理失败')
+
+    stats = scheduler.stats()[ONLINE_BATCH]
+    assert (stats['completed'], stats['failed'], stats['running']) == (1, 1, 0)
+    assert scheduler.running == 0
+    assert '在线批处理: 完成 1 失败 1' in scheduler.format_stats()
+
+def test_reserved_permits_never_exceed_capacity():
+    scheduler = JobScheduler(max_concurrent=1, reserved_interactive=5)
+    # 只有一个许可时不能全部保留，否则批处理永远无法开始
+    assert scheduler.reserved_interactive == 0
+    scheduler.release(scheduler.acquire(ONLINE_BATCH))
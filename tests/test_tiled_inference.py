@@ -0,0 +1,88 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+from PIL import Image
+
+from utils.tiled_inference import blend_weights, compute_tiles, merge_tile_results, stitch_tiles
+
+
+def naive_stitch(arrays, tiles, width):
+    """整图 float32 累加的参考实现"""
+    height, _, channels = arrays[0].shape
+    accumulator = np.zeros((height, width, channels), dtype=np.float32)
+    weight_sum = np.zeros(width, dtype=np.float32)
+    for index, ((x0, x1), array) in enumerate(zip(tiles, arrays)):
+        weights = blend_weights(tiles, index)
+        accumulator[:, x0:x1] += array.astype(np.float32) * weights[None, :, None]
+        weight_sum[x0:x1] += weights
+    stitched = accumulator / np.maximum(weight_sum, 1e-6)[None, :, None]
+    return np.clip(stitched + 0.5, 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('mode, width, tile_width, overlap', [
+    ('RGB', 103, 40, 10),
+    ('RGBA', 97, 30, 12),
+    ('RGB', 50, 20, 0),
+])
+def test_stitch_matches_full_frame_blend(tmp_path, mode, width, tile_width, overlap):
+    height = 7
+    tiles = compute_tiles(width, tile_width, overlap)
+    rng = np.random.default_rng(0)
+    arrays, paths = [], []
+    for index, (x0, x1) in enumerate(tiles):
+        array = rng.integers(0, 256, size=(height, x1 - x0, len(mode)), dtype=np.uint8)
+        path = tmp_path / f'tile_{index}.png'
+        Image.fromarray(array, mode).save(path)
+        arrays.append(array)
+        paths.append(str(path))
+
+    output = tmp_path / 'stitched.png'
+    stitch_tiles(paths, tiles, (width, height), str(output))
+
+    with Image.open(output) as stitched:
+        assert stitched.mode == mode
+        result = np.asarray(stitched)
+    assert np.array_equal(result, naive_stitch(arrays, tiles, width))
+
+
+def test_stitch_resizes_tiles_to_tile_size(tmp_path):
+    tiles = compute_tiles(60, 40, 20)
+    paths = []
+    for index, (x0, x1) in enumerate(tiles):
+        path = tmp_path / f'tile_{index}.png'
+        Image.new('RGB', ((x1 - x0) // 2, 5), (10 * (index + 1), 0, 0)).save(path)
+        paths.append(str(path))
+    output = tmp_path / 'stitched.png'
+    stitch_tiles(paths, tiles, (60, 10), str(output))
+    with Image.open(output) as stitched:
+        assert stitched.size == (60, 10)
+        assert stitched.getpixel((0, 0)) == (10, 0, 0)
+        assert stitched.getpixel((59, 9)) == (20, 0, 0)
+
+
+def test_merge_takes_fields_from_most_severe_tile():
+    tiles = [(0, 40), (30, 70), (60, 100)]
+    tile_results = [
+        {'anomaly_level': '正常', 'analog_voltage': 9.5},
+        {'anomaly_level': '很可能异常', 'analog_voltage': 1.2},
+        {'anomaly_level': '低异常可能性', 'analog_voltage': 3.0},
+    ]
+    merged = merge_tile_results(tile_results, tiles)
+    assert merged['anomaly_level'] == '很可能异常'
+    # 电压来自代表分块，而不是各分块的最大值
+    assert merged['analog_voltage'] == 1.2
+    assert merged['tiled'] is True
+    assert [tile['x0'] for tile in merged['tiles']] == [0, 30, 60]
+    assert [tile['analog_voltage'] for tile in merged['tiles']] == [9.5, 1.2, 3.0]
+
+
+def test_merge_breaks_level_ties_by_score():
+    tiles = [(0, 40), (30, 70)]
+    tile_results = [
+        {'anomaly_level': '中等异常可能性', 'anomaly_score': 0.55, 'analog_voltage': 4.0},
+        {'anomaly_level': '中等异常可能性', 'anomaly_score': 0.61, 'analog_voltage': 2.0},
+    ]
+    merged = merge_tile_results(tile_results, tiles)
+    assert merged['anomaly_score'] == 0.61
+    assert merged['analog_voltage'] == 2.0
+    assert [tile['anomaly_score'] for tile in merged['tiles']] == [0.55, 0.61]
@@ -0,0 +1,308 @@
+from utils.results_store import to_float
+from dotenv import load_dotenv
+import os
+import re
+import json
+import logging
+import datetime
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_LEVELS = ('中等异常可能性', '很可能异常')  # 默认视为异常的级别
+DEFAULT_RULES = [{'type': 'consecutive', 'n': 15}]  # 原有规则：连续15张异常
+# 记录文件名开头的时间戳：<年月日_时分秒>，新格式后接 _<微秒>
+RECORD_TIME_PATTERN = re.compile(r'^(\d{8}_\d{6})(?:_(\d{6}))?(?=[_.])')
+
+def parse_record_time(filename: str):
+    """
+    由检查点或连续异常记录的文件名解析创建时间，支持：
+    <时间戳>.json（旧格式）、<时间戳>__<文件夹名>.json、<时间戳>_<微秒>[_<文件夹名>]_<规则名>.json
+    Args:
+        filename: 文件名
+    Returns:
+        datetime.datetime: 创建时间，无法解析时返回 None
+    """
+    match = RECORD_TIME_PATTERN.match(os.path.basename(filename))
+    if not match:
+        return None
+    try:
+        record_time = datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+    if match.group(2):
+        record_time = record_time.replace(microsecond=int(match.group(2)))
+    return record_time
+
+class RingBuffer:
+    """
+    固定容量的环形缓冲区：预先分配槽位，追加和清空都是 O(1)，满后覆盖最旧的元素
+    """
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.items = [None] * self.capacity
+        self.head = 0  # 下一个写入位置
+        self.size = 0
+
+    def append(self, item):
+        """追加一个元素，返回被覆盖的最旧元素（未满时为 None）"""
+        evicted = self.items[self.head] if self.size == self.capacity else None
+        self.items[self.head] = item
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return evicted
+
+    def clear(self):
+        """清空（只重置计数，旧槽位在之后的追加中被覆盖）"""
+        self.head = 0
+        self.size = 0
+
+    def latest(self, count: int):
+        """按时间顺序依次返回最近 count 个元素"""
+        count = min(count, self.size)
+        start = self.head - count
+        for offset in range(count):
+            yield self.items[(start + offset) % self.capacity]
+
+    def __len__(self):
+        return self.size
+
+class AnomalyRule:
+    """流式异常规则的基类：每个结果 O(1) 更新一次，触发时返回 True"""
+    def __init__(self, name: str, window: int):
+        self.name = name
+        self.window = max(1, window)  # 触发时保存最近多少条结果
+        self.last_trigger_seq = 0  # 上次触发时最新结果的序号，之前的结果已报告过
+
+    def update(self, record: dict, is_anomaly: bool) -> bool:
+        raise NotImplementedError
+
+    def window_records(self, history: RingBuffer) -> list:
+        """触发时需要保存的记录（只包含上次触发之后的结果，已报告过的不重复报告）"""
+        return [record for seq, record in history.latest(self.window) if seq > self.last_trigger_seq]
+
+    def describe(self) -> str:
+        return self.name
+
+class ConsecutiveRule(AnomalyRule):
+    """连续 N 张异常时触发，触发后重新计数"""
+    def __init__(self, n: int = 15, name: str = None):
+        super().__init__(name or f"consecutive_{n}", n)
+        self.n = max(1, n)
+        self.count = 0
+
+    def update(self, record: dict, is_anomaly: bool) -> bool:
+        self.count = self.count + 1 if is_anomaly else 0
+        if self.count >= self.n:
+            self.count = 0
+            return True
+        return False
+
+    def describe(self) -> str:
+        return f"连续 {self.n} 张异常"
+
+class KOfNRule(AnomalyRule):
+    """最近 N 张中至少 K 张异常时触发，触发后清空窗口"""
+    def __init__(self, k: int, n: int, name: str = None):
+        super().__init__(name or f"k_of_n_{k}_{n}", n)
+        self.n = max(1, n)
+        self.k = min(max(1, k), self.n)
+        self.flags = RingBuffer(self.n)
+        self.anomaly_count = 0  # 窗口内的异常数，随滑入/滑出增减
+
+    def update(self, record: dict, is_anomaly: bool) -> bool:
+        if self.flags.append(is_anomaly):
+            self.anomaly_count -= 1
+        if is_anomaly:
+            self.anomaly_count += 1
+        if self.anomaly_count >= self.k:
+            self.flags.clear()
+            self.anomaly_count = 0
+            return True
+        return False
+
+    def window_records(self, history: RingBuffer) -> list:
+        return [record for record in super().window_records(history) if record['is_anomaly']]
+
+    def describe(self) -> str:
+        return f"最近 {self.n} 张中 {self.k} 张异常"
+
+class EwmaVoltageRule(AnomalyRule):
+    """
+    模拟电压（analog_voltage）的指数加权移动平均越过阈值时触发；
+    触发后需回到阈值另一侧才会再次触发，避免持续越限时每张图片都报警
+    """
+    def __init__(self, threshold: float, alpha: float = 0.2, direction: str = 'above',
+                 min_samples: int = 5, window: int = 15, name: str = None):
+        super().__init__(name or f"ewma_voltage_{direction}_{threshold:g}", window)
+        self.threshold = threshold
+        self.alpha = min(max(alpha, 0.0), 1.0)
+        self.direction = direction
+        self.min_samples = max(1, min_samples)
+        self.ewma = None
+        self.samples = 0
+        self.armed = True
+
+    def update(self, record: dict, is_anomaly: bool) -> bool:
+        voltage = record.get('analog_voltage')
+        if voltage is None:
+            return False
+        self.ewma = voltage if self.ewma is None else self.alpha * voltage + (1 - self.alpha) * self.ewma
+        self.samples += 1
+        crossed = self.ewma > self.threshold if self.direction == 'above' else self.ewma < self.threshold
+        if not crossed:
+            self.armed = True
+            return False
+        if self.armed and self.samples >= self.min_samples:
+            self.armed = False
+            return True
+        return False
+
+    def describe(self) -> str:
+        side = '高于' if self.direction == 'above' else '低于'
+        return f"模拟电压EWMA {self.ewma:.3f} {side}阈值 {self.threshold:g}"
+
+def build_rule(spec: dict) -> AnomalyRule:
+    """
+    由配置创建规则
+    Args:
+        spec: 例如 {"type": "consecutive", "n": 15}、{"type": "k_of_n", "k": 10, "n": 20}、
+              {"type": "ewma_voltage", "threshold": 3.5, "alpha": 0.2, "direction": "above"}
+    Returns:
+        AnomalyRule: 规则
+    """
+    rule_type = spec.get('type')
+    name = spec.get('name')
+    if rule_type == 'consecutive':
+        return ConsecutiveRule(int(spec.get('n', 15)), name)
+    if rule_type == 'k_of_n':
+        return KOfNRule(int(spec['k']), int(spec['n']), name)
+    if rule_type == 'ewma_voltage':
+        return EwmaVoltageRule(float(spec['threshold']), float(spec.get('alpha', 0.2)),
+                               spec.get('direction', 'above'), int(spec.get('min_samples', 5)),
+                               int(spec.get('window', 15)), name)
+    raise ValueError(f"未知的异常规则类型: {rule_type}")
+
+class AnomalyRuleEngine:
+    """
+    连续异常检测的流式规则引擎（每个监控文件夹一个）。
+    最近的结果记录保存在共享的环形缓冲区中，各规则只维护计数器或滑动和，每个结果 O(1) 更新；
+    只有规则触发时才取出窗口内的记录，发出通知并写入 temp/consecutive_anomalies。
+    """
+    def __init__(self, rules: list, anomaly_levels=ANOMALY_LEVELS, anomalies_dir: str = "temp/consecutive_anomalies",
+                 source_name: str = None):
+        """
+        Args:
+            rules: 规则列表
+            anomaly_levels: 视为异常的级别
+            anomalies_dir: 触发记录保存目录
+            source_name: 监控文件夹名称，写入记录文件名，避免多个文件夹的记录互相覆盖
+        """
+        self.rules = rules
+        self.source_name = source_name
+        self.anomaly_levels = set(anomaly_levels)
+        self.anomalies_dir = anomalies_dir
+        self.history = RingBuffer(max([rule.window for rule in rules] + [1]))  # (序号, 记录)
+        self.seq = 0
+
+    def update(self, image_path: str, process_id: str, result_data: dict) -> list:
+        """
+        输入一张图片的结果
+        Args:
+            image_path: 图片路径
+            process_id: 处理ID
+            result_data: result.json 的内容
+        Returns:
+            list: 本次触发的 (规则, 记录列表)
+        """
+        anomaly_level = result_data.get('anomaly_level', '')
+        is_anomaly = anomaly_level in self.anomaly_levels
+        record = {
+            'file_path': image_path,
+            'process_id': process_id,
+            'processed_time': datetime.datetime.now().isoformat(),
+            'anomaly_level': anomaly_level,
+            'analog_voltage': to_float(result_data.get('analog_voltage')),
+            'is_anomaly': is_anomaly,
+        }
+        self.seq += 1
+        self.history.append((self.seq, record))
+        triggered = []
+        for rule in self.rules:
+            if rule.update(record, is_anomaly):
+                triggered.append((rule, rule.window_records(self.history)))
+                rule.last_trigger_seq = self.seq
+        return triggered
+
+    def save_record(self, rule: AnomalyRule, records: list) -> str:
+        """
+        保存一次触发的记录（processed_images 格式与检查点相同，结果库导入时可直接读取）。
+        文件名为 <年月日_时分秒>_<微秒>[_<文件夹名>]_<规则名>.json，用 parse_record_time 解析时间
+        Returns:
+            str: 记录文件路径
+        """
+        os.makedirs(self.anomalies_dir, exist_ok=True)
+        # 文件名精确到微秒，同一秒内多次触发（例如K=1的规则）不会互相覆盖
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        prefix = f"{timestamp}_{self.source_name}" if self.source_name else timestamp
+        record_file = os.path.join(self.anomalies_dir, f"{prefix}_{rule.name}.json")
+        counter = 1
+        while os.path.exists(record_file):
+            record_file = os.path.join(self.anomalies_dir, f"{prefix}_{rule.name}_{counter}.json")
+            counter += 1
+        anomaly_data = {
+            "source": self.source_name,
+            "rule": rule.name,
+            "description": rule.describe(),
+            "processed_images": records,
+            "last_update": datetime.datetime.now().isoformat()
+        }
+        with open(record_file, 'w', encoding='utf-8') as f:
+            json.dump(anomaly_data, f, ensure_ascii=False, indent=2)
+        return record_file
+
+def load_rule_specs(watch_dir: str = None) -> list:
+    """
+    读取监控文件夹的规则配置：ANOMALY_RULES_FILE 中按文件夹路径配置（"default" 为其余文件夹的默认值），
+    其次为 ANOMALY_RULES（JSON列表），都未配置时使用连续15张异常
+    Args:
+        watch_dir: 监控文件夹
+    Returns:
+        list: 规则配置列表
+    """
+    load_dotenv()
+    rules_file = os.getenv('ANOMALY_RULES_FILE', '')
+    if rules_file and os.path.exists(rules_file):
+        with open(rules_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if watch_dir:
+            watch_key = os.path.normcase(os.path.abspath(watch_dir))
+            for folder, specs in config.items():
+                if folder != 'default' and os.path.normcase(os.path.abspath(folder)) == watch_key:
+                    return specs
+        if 'default' in config:
+            return config['default']
+    rules_env = os.getenv('ANOMALY_RULES', '')
+    if rules_env:
+        return json.loads(rules_env)
+    return DEFAULT_RULES
+
+def create_rule_engine(watch_dir: str = None, anomalies_dir: str = "temp/consecutive_anomalies",
+                       source_name: str = None) -> AnomalyRuleEngine:
+    """
+    按配置为监控文件夹创建规则引擎，配置无效时退回默认规则
+    Args:
+        watch_dir: 监控文件夹
+        anomalies_dir: 触发记录保存目录
+        source_name: 监控文件夹名称
+    Returns:
+        AnomalyRuleEngine: 规则引擎
+    """
+    load_dotenv()
+    levels = [level.strip() for level in os.getenv('ANOMALY_RULE_LEVELS', '').split(',') if level.strip()]
+    try:
+        rules = [build_rule(spec) for spec in load_rule_specs(watch_dir)]
+    except Exception as e:
+        logger.error(f"异常规则配置无效，使用默认规则: {str(e)}")
+        rules = [build_rule(spec) for spec in DEFAULT_RULES]
+    logger.info(f"异常规则 ({watch_dir}): {', '.join(rule.name for rule in rules)}")
+    return AnomalyRuleEngine(rules, levels or ANOMALY_LEVELS, anomalies_dir, source_name)
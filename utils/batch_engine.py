@@ -0,0 +1,436 @@
+from utils.batch_pipeline import StagedPipeline, PipelineStage, MicroBatcher
+from utils.results_store import get_results_store
+from utils.job_slots import get_job_slot_pool
+from utils.job_scheduler import get_job_scheduler, ONLINE_BATCH
+from utils.watch_sources import WatchSource, WeightedFairScheduler, source_checkpoint_file
+from dotenv import load_dotenv
+import os
+import json
+import time
+import select
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+def record_result(image_path, ssh_client, results, source, timings=None):
+    """
+    将一张图片的结果写入结果库（结果库出错不影响处理流程）
+    Args:
+        image_path: 本地图片路径
+        ssh_client: 处理该图片的SSH客户端
+        results: (本地预测图路径, 本地热力图路径, 本地JSON文件路径)
+        source: 结果来源（single / online_batch）
+        timings: 各阶段耗时（秒）
+    """
+    results_store = get_results_store()
+    if results_store is None:
+        return
+    try:
+        local_result_pre_image, local_result_heat_map, local_result_json = results
+        results_store.record(image_path, ssh_client.process_id, local_result_json,
+                             prediction_path=local_result_pre_image, heat_map_path=local_result_heat_map,
+                             content_hash=ssh_client.content_hash, source=source, timings=timings)
+    except Exception as e:
+        logger.error(f"写入结果库失败 {os.path.basename(image_path)}: {str(e)}")
+
+class BatchEngineListener:
+    """批处理引擎的事件回调，默认不做任何处理；界面线程和守护进程按需覆盖"""
+    def on_progress(self, message: str):
+        pass
+
+    def on_error(self, message: str):
+        pass
+
+    def on_finished(self):
+        pass
+
+    def on_image_processed(self, prediction_path: str, heatmap_path: str, json_path: str):
+        pass
+
+    def on_batch_progress(self, current: int, total: int):
+        pass
+
+    def on_consecutive_anomaly(self, description: str, anomaly_images_list: list):
+        pass
+
+    def on_request_download(self, process_id: str):
+        pass
+
+    def on_preview(self, image_path: str):
+        pass
+
+class BatchEngine:
+    """
+    在线批处理引擎（不依赖Qt）：监控文件夹、流水线处理、检查点和连续异常检测。
+    界面中的 BatchProcessingThread 和无界面的 analysis_daemon 都使用它，写出相同的检查点和结果。
+    """
+    def __init__(self, sources, checkpoint_file=None, enable_preview=False, listener: BatchEngineListener = None):
+        """
+        Args:
+            sources: 监控文件夹列表（WatchSource），也可以是单个文件夹路径
+            checkpoint_file: 本次批处理的检查点（多个文件夹时各文件夹的检查点由它派生）
+            enable_preview: 是否在每张图片完成后请求下载预览图
+            listener: 事件回调
+        """
+        self.sources = [WatchSource(sources)] if isinstance(sources, str) else list(sources)
+        self.checkpoint_file = checkpoint_file
+        self.enable_preview = enable_preview  # 是否启用预览
+        self.listener = listener or BatchEngineListener()
+        self.scheduler = WeightedFairScheduler(self.sources)  # 各文件夹按优先级和权重共享流水线和任务槽位
+        self.in_flight_images = {}  # 已提交到流水线、尚未完成的图片 -> 所属文件夹
+        self.is_running = True
+        self.stop_event = threading.Event()
+        self.wake_pipe = None  # 空闲时与inotify描述符一起 select，stop 写入一个字节立即唤醒
+        self.polling_interval = 5  # 轮询间隔5秒
+        self.current_batch_total = 0  # 当前批次的图片数量
+        self.current_batch_processed = 0  # 当前批次已处理的图片数量
+        self.pipeline = None  # 上传 -> 远程执行 -> 获取结果 流水线
+
+        # 流水线各阶段的并发数和队列容量
+        load_dotenv()
+        self.upload_workers = int(os.getenv('ONLINE_PIPELINE_UPLOAD_WORKERS', 2))
+        # 并发任务槽位（ONLINE_JOB_SLOTS，可按 ONLINE_JOB_SLOT_GPUS 绑定GPU），远程执行阶段每个槽位一个线程
+        self.job_slots = get_job_slot_pool()
+        self.execute_workers = len(self.job_slots.slots)
+        self.fetch_workers = int(os.getenv('ONLINE_PIPELINE_FETCH_WORKERS', 2))
+        self.stage_queue_size = int(os.getenv('ONLINE_PIPELINE_QUEUE_SIZE', 4))
+        # 微批处理：凑满N张或等待T毫秒后以一次远程调用处理，N为1时逐张处理
+        self.micro_batch_size = int(os.getenv('ONLINE_MICRO_BATCH_SIZE', 1))
+        self.micro_batch_wait_ms = int(os.getenv('ONLINE_MICRO_BATCH_WAIT_MS', 500))
+        self.micro_batcher = None
+        # inotify事件驱动监控（Linux本地文件系统），不支持时自动退回轮询
+        self.use_inotify = os.getenv('ONLINE_WATCH_INOTIFY', 'true').lower() in ('1', 'true', 'yes')
+        self.rescan_interval = int(os.getenv('ONLINE_WATCH_RESCAN_INTERVAL', 60))  # inotify模式下的兜底全量扫描间隔（秒）
+
+        # 连续异常检测：每个文件夹按各自配置的流式规则（连续N张、N张中K张、模拟电压EWMA）独立统计
+        self.anomalies_dir = "temp/consecutive_anomalies"  # 异常记录保存目录
+
+    def run(self):
+        """运行批处理，阻塞直到 stop 被调用且进行中的任务结束"""
+        try:
+            logger.info(f"批处理启动，监控文件夹: {', '.join(source.directory for source in self.sources)}")
+
+            # 各文件夹加载自己的检查点并启动监控（inotify不支持时退回轮询）
+            for source in self.sources:
+                source.open(source_checkpoint_file(self.checkpoint_file, source, len(self.sources) > 1),
+                            self.use_inotify, self.anomalies_dir)
+            if any(source.fileno() is not None for source in self.sources):
+                self.wake_pipe = os.pipe()
+
+            # 启动流水线：扫描(本线程) -> 上传 -> 远程执行 -> 获取结果 -> 异常统计(按文件顺序提交)
+            self.pipeline = StagedPipeline([
+                PipelineStage('upload', self.upload_stage, self.upload_workers, self.stage_queue_size),
+                PipelineStage('execute', self.execute_stage, self.execute_workers, self.stage_queue_size),
+                PipelineStage('fetch', self.fetch_stage, self.fetch_workers, self.stage_queue_size),
+            ], sink=self.commit_stage, name="online-batch")
+            self.pipeline.start()
+            self.micro_batcher = MicroBatcher(self.pipeline.submit, self.micro_batch_size, self.micro_batch_wait_ms / 1000)
+
+            while self.is_running:
+                found = 0
+                for source in self.sources:
+                    new_images = source.read_events()
+                    if source.scan_due(self.polling_interval, self.rescan_interval):
+                        new_images = source.scan() + new_images
+                    found += self.enqueue_new_images(source, new_images)
+                if found:
+                    logger.info(f"发现 {found} 张新图片待处理")
+
+                # 每次只交出一张：第一阶段队列满时在此阻塞，空出位置后再按调度选择下一张，
+                # 使新到达的高优先级图片不必排在已积压的低优先级图片之后
+                if self.dispatch_next():
+                    continue
+                # 没有待处理图片时阻塞等待新事件、下一次扫描或停止请求
+                self.wait_idle()
+
+            # 丢弃尚未提交到流水线的图片（调度队列中未取出的、微批中未交出的），下次启动时重新发现；
+            # 已提交的任务（可能已上传或已在远程推理）继续执行完并写入检查点，之后再关闭任务槽位
+            self.micro_batcher.close(flush=False)
+            for image_path in self.micro_batcher.items:
+                self.in_flight_images.pop(image_path, None)
+            self.pipeline.shutdown(cancel=False)
+            self.job_slots.close()
+            logger.info(f"任务槽位统计: {self.job_slots.stats()}")
+            logger.info(f"远程任务调度统计: {get_job_scheduler().format_stats()}")
+            for source in self.sources:
+                source.close()
+            self.close_wake_pipe()
+
+            logger.info("批处理已停止")
+            self.listener.on_finished()
+
+        except Exception as e:
+            error_msg = f"批处理线程异常: {str(e)}"
+            logger.error(error_msg)
+            self.listener.on_error(error_msg)
+
+    def stop(self):
+        """请求停止批处理（可在任意线程或信号处理函数中调用）"""
+        self.is_running = False
+        self.stop_event.set()
+        wake_pipe = self.wake_pipe
+        if wake_pipe is not None:
+            try:
+                os.write(wake_pipe[1], b'\0')
+            except OSError:
+                pass
+
+    def wait_idle(self):
+        """
+        空闲时等待：inotify模式下在各文件夹的inotify描述符和唤醒管道上 select，新图片写入后立即返回；
+        纯轮询模式下等待到下一次扫描。两种情况都最迟在下一次扫描到期时返回，stop 时立即返回
+        """
+        timeout = min(source.seconds_until_scan(self.polling_interval, self.rescan_interval)
+                      for source in self.sources) if self.sources else self.polling_interval
+        fds = [source.fileno() for source in self.sources if source.fileno() is not None]
+        if not fds or self.wake_pipe is None:
+            self.stop_event.wait(timeout)
+            return
+        try:
+            readable, _, _ = select.select(fds + [self.wake_pipe[0]], [], [], timeout)
+        except (OSError, ValueError):
+            # 描述符在等待期间被关闭（监控失效），下一轮 read_events 会退回轮询
+            return
+        if self.wake_pipe[0] in readable:
+            os.read(self.wake_pipe[0], 64)
+
+    def close_wake_pipe(self):
+        """关闭唤醒管道"""
+        wake_pipe, self.wake_pipe = self.wake_pipe, None
+        if wake_pipe is not None:
+            for fd in wake_pipe:
+                os.close(fd)
+
+    def enqueue_new_images(self, source, image_files):
+        """
+        过滤掉已处理、正在处理和已在排队的图片，放入文件夹的待调度队列
+        Args:
+            source: 所属文件夹
+            image_files: 候选图片路径列表（按处理顺序）
+        Returns:
+            int: 新排队的图片数量
+        """
+        if not image_files:
+            return 0
+        # 没有处理中和排队中的图片时开始新的批次计数
+        if not self.in_flight_images and not self.scheduler.has_pending():
+            self.current_batch_total = 0
+            self.current_batch_processed = 0
+        new_images = self.scheduler.enqueue(source, [img for img in dict.fromkeys(image_files)
+                                                     if img not in source.processed_images and img not in self.in_flight_images])
+        if not new_images:
+            return 0
+        self.current_batch_total += len(new_images)
+
+        # 发送批次开始信号
+        self.listener.on_batch_progress(self.current_batch_processed, self.current_batch_total)
+        return len(new_images)
+
+    def dispatch_next(self):
+        """
+        按优先级和权重选出下一张图片，收集成微批提交到流水线
+        Returns:
+            bool: 是否提交了图片
+        """
+        selected = self.scheduler.next()
+        if selected is None:
+            return False
+        source, image_path = selected
+        self.in_flight_images[image_path] = source
+        self.micro_batcher.add(image_path)
+        return True
+
+    def upload_stage(self, job):
+        """流水线上传阶段：任务数据为一个微批的图片列表，逐张查缓存并上传"""
+        # paramiko 在第一张图片时才导入，守护进程启动时不需要加载
+        from utils.ssh_client_anomaly_detection import SSHClient
+        job.context['items'] = []
+        for image_path in job.payload:
+            logger.info(f"开始处理图片: {os.path.basename(image_path)}")
+            self.listener.on_progress(f"正在处理图片: {os.path.basename(image_path)}")
+
+            # 更新图片预览
+            self.listener.on_preview(image_path)
+
+            ssh_client = SSHClient(batch_process=True)
+            item = {'image_path': image_path, 'ssh_client': ssh_client, 'error': None}
+            job.context['items'].append(item)
+            try:
+                item['script_name'] = ssh_client.select_script(image_path)
+                # 相同内容的图片已处理过时直接使用缓存结果，跳过后续远程阶段
+                cached_result = ssh_client.lookup_cached_result(image_path, item['script_name'])
+                if cached_result is not None:
+                    item['results'] = cached_result
+                    continue
+                # 超长图片在远程执行阶段分块上传和推理
+                if ssh_client.use_tiled_mode(item['script_name']):
+                    item['tiled'] = True
+                    continue
+                item['remote_path'] = ssh_client.upload_image(image_path)
+            except Exception as e:
+                item['error'] = e
+
+    def execute_stage(self, job):
+        """
+        流水线远程执行阶段：借用一个任务槽位（可绑定GPU）执行，单张图片按原方式执行，多张图片以一个清单一次远程调用。
+        各槽位并发执行，结果仍经重排序缓冲区按文件顺序提交
+        """
+        # 已提交到流水线的任务在停止时也要执行完（见 run），这里不因停止请求放弃等待许可
+        scheduler = get_job_scheduler()
+        pending = []
+        for item in self.pending_items(job):
+            if not item.get('tiled'):
+                pending.append(item)
+                continue
+            try:
+                with scheduler.slot(ONLINE_BATCH):
+                    item['results'] = item['ssh_client'].process_tiled(item['image_path'])
+            except Exception as e:
+                item['error'] = e
+        if not pending:
+            return
+
+        try:
+            # 先取得GPU槽位，再向共享调度器申请许可（单图检测优先）
+            with self.job_slots.slot() as slot, scheduler.slot(ONLINE_BATCH):
+                for item in pending:
+                    item['ssh_client'].gpu_id = slot.gpu
+                if len(pending) == 1:
+                    pending[0]['ssh_client'].execute_remote(pending[0]['image_path'], pending[0]['remote_path'])
+                    return
+
+                manifest = [{
+                    'script': item['script_name'],
+                    'file_path': item['remote_path'],
+                    'process_id': item['ssh_client'].process_id
+                } for item in pending]
+                logger.info(f"微批提交远程推理 ({slot.name}): {len(manifest)} 张图片")
+                errors = pending[0]['ssh_client'].execute_manifest(manifest)
+        except Exception as e:
+            # 槽位出错只影响本任务中的图片
+            for item in pending:
+                item['error'] = e
+            return
+        for item in pending:
+            error = errors.get(item['ssh_client'].process_id, "远程推理没有返回该图片的结果")
+            if error:
+                item['error'] = Exception(error)
+
+    def fetch_stage(self, job):
+        """流水线结果获取阶段"""
+        for item in self.pending_items(job):
+            try:
+                item['results'] = item['ssh_client'].fetch_result(item['image_path'])
+            except Exception as e:
+                item['error'] = e
+
+    def pending_items(self, job):
+        """尚未得到结果且没有出错的图片"""
+        return [item for item in job.context['items'] if 'results' not in item and item['error'] is None]
+
+    def commit_stage(self, job):
+        """异常统计阶段：按文件顺序提交结果，微批拆分回单张图片，更新检查点和连续异常计数"""
+        items = {item['image_path']: item for item in job.context.get('items', [])}
+        for image_path in job.payload:
+            item = items.get(image_path) or {'image_path': image_path, 'error': None}
+            item['source'] = self.in_flight_images.pop(image_path, None) or self.sources[0]
+            if job.cancelled:
+                continue
+            if 'results' not in item and item['error'] is None:
+                # 阶段本身异常（未记录到单张图片上）
+                item['error'] = job.error
+            # 微批内各图片共用该批的阶段耗时
+            item['timings'] = dict(job.timings, total=time.time() - job.submit_time)
+            self.commit_image(item)
+
+    def commit_image(self, item):
+        """提交单张图片的结果"""
+        image_path = item['image_path']
+        source = item['source']
+        self.current_batch_processed += 1
+        self.listener.on_batch_progress(self.current_batch_processed, self.current_batch_total)
+
+        if item['error'] is not None:
+            error_msg = f"图片处理失败: {os.path.basename(image_path)} - {str(item['error'])}"
+            logger.error(error_msg)
+            self.listener.on_error(error_msg)
+            source.failed_images.add(image_path)
+            # 批处理状态下不弹出错误提示，继续处理下一张
+            return
+
+        try:
+            process_id = item['ssh_client'].process_id
+            local_result_pre_image, local_result_heat_map, local_result_json = item['results']
+
+            # 记录已处理的图片和对应的process_id，并更新该文件夹的检查点
+            source.record_processed({
+                'file_path': image_path,
+                'process_id': process_id,
+                'processed_time': datetime.datetime.now().isoformat()
+            })
+            record_result(image_path, item['ssh_client'], item['results'], 'online_batch', item.get('timings'))
+
+            logger.info(f"图片处理完成: {os.path.basename(image_path)} (process_id: {process_id})")
+            self.listener.on_progress(f"图片处理完成: {os.path.basename(image_path)}")
+
+            # 检查是否为异常图片并更新连续异常计数
+            self.check_anomaly_and_update_count(source, image_path, process_id, local_result_json)
+
+            # 如果启用预览，请求异步下载热力图和预测图
+            if self.enable_preview:
+                logger.info(f"启用预览模式，请求异步下载: {process_id}")
+                self.listener.on_request_download(process_id)
+
+            # 发送处理完成信号
+            self.listener.on_image_processed(local_result_pre_image, local_result_heat_map, local_result_json)
+
+        except Exception as e:
+            error_msg = f"图片处理失败: {os.path.basename(image_path)} - {str(e)}"
+            logger.error(error_msg)
+            self.listener.on_error(error_msg)
+            if image_path not in source.processed_images:
+                source.failed_images.add(image_path)
+
+    def check_anomaly_and_update_count(self, source, image_path, process_id, json_path):
+        """将结果交给所属文件夹的异常规则引擎（每张图片 O(1) 更新），有规则触发时发出警告并保存记录"""
+        try:
+            if not os.path.exists(json_path):
+                return
+            with open(json_path, 'r', encoding='utf-8') as f:
+                json_data = json.load(f)
+
+            anomaly_level = json_data.get('anomaly_level', '')
+            if anomaly_level in source.anomaly_rules.anomaly_levels:
+                logger.info(f"检测到异常图片: {os.path.basename(image_path)} (异常级别: {anomaly_level})")
+
+            for rule, anomaly_images_list in source.anomaly_rules.update(image_path, process_id, json_data):
+                self.handle_consecutive_anomalies(source, rule, anomaly_images_list)
+
+        except Exception as e:
+            logger.error(f"检查异常图片失败: {str(e)}")
+
+    def handle_consecutive_anomalies(self, source, rule, anomaly_images_list):
+        """
+        处理一次规则触发：通知界面并保存异常记录
+        Args:
+            source: 所属文件夹
+            rule: 触发的规则
+            anomaly_images_list: 触发窗口内的图片记录
+        """
+        try:
+            description = rule.describe()
+            if len(self.sources) > 1:
+                description = f"[{source.name}] {description}"
+            logger.warning(f"异常规则触发: {description}，共 {len(anomaly_images_list)} 张图片")
+
+            # 通知界面
+            self.listener.on_consecutive_anomaly(description, anomaly_images_list)
+
+            # 保存异常记录到文件
+            record_file = source.anomaly_rules.save_record(rule, anomaly_images_list)
+            logger.info(f"连续异常记录已保存: {record_file}")
+
+        except Exception as e:
+            logger.error(f"处理连续异常失败: {str(e)}")
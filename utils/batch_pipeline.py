@@ -0,0 +1,231 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # 线程退出标记
+
+class PipelineJob:
+    """流水线中的一个任务，依次流经各个阶段"""
+    def __init__(self, seq: int, payload):
+        self.seq = seq  # 提交序号，决定最终提交顺序
+        self.payload = payload
+        self.context = {}  # 各阶段之间传递的数据
+        self.error = None  # 某阶段失败时记录异常，之后的阶段将被跳过
+        self.failed_stage = None
+        self.cancelled = False
+        self.timings = {}  # 阶段名 -> 耗时（秒）
+        self.submit_time = time.time()
+
+class PipelineStage:
+    """流水线阶段：处理函数、并发线程数和输入队列容量"""
+    def __init__(self, name: str, func, workers: int = 1, queue_size: int = 4):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+class ReorderBuffer:
+    """
+    重排序缓冲区：任务可能乱序完成，这里按提交序号依次交给 sink，
+    保证后续的计数、检查点等逻辑看到的顺序与提交顺序一致。
+    """
+    def __init__(self, sink, start_seq: int = 0):
+        self.sink = sink
+        self.next_seq = start_seq
+        self.pending = {}
+
+    def push(self, job: PipelineJob) -> int:
+        """放入一个已完成的任务，并提交所有已就绪的连续任务，返回本次提交的任务数"""
+        self.pending[job.seq] = job
+        committed = 0
+        while self.next_seq in self.pending:
+            ready_job = self.pending.pop(self.next_seq)
+            self.next_seq += 1
+            committed += 1
+            try:
+                self.sink(ready_job)
+            except Exception as e:
+                logger.error(f"提交任务结果失败 (序号 {ready_job.seq}): {str(e)}")
+        return committed
+
+class StagedPipeline:
+    """
+    多阶段流水线。
+    每个阶段有独立的有界队列和工作线程数，阶段之间通过队列衔接，
+    使第N+1个任务的上传可以与第N个任务的远程推理重叠；
+    所有任务最终经重排序缓冲区按提交顺序交给 sink（在单独的提交线程中串行调用）。
+    """
+    def __init__(self, stages, sink, name: str = "pipeline"):
+        self.stages = stages
+        self.name = name
+        self.reorder_buffer = ReorderBuffer(sink)
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.commit_queue = queue.Queue()
+        self.threads = []
+        self.commit_thread = None
+        self.next_seq = 0
+        self.in_flight = 0
+        self.cancelled = False
+        self.lock = threading.Condition()
+
+    def start(self):
+        """启动各阶段工作线程和提交线程"""
+        for index, stage in enumerate(self.stages):
+            stage_threads = []
+            for worker_index in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._stage_worker,
+                    args=(index,),
+                    name=f"{self.name}-{stage.name}-{worker_index}",
+                    daemon=True
+                )
+                thread.start()
+                stage_threads.append(thread)
+            self.threads.append(stage_threads)
+
+        self.commit_thread = threading.Thread(target=self._commit_worker, name=f"{self.name}-commit", daemon=True)
+        self.commit_thread.start()
+        logger.info("流水线已启动: " + " -> ".join(f"{s.name}(x{s.workers})" for s in self.stages))
+
+    def submit(self, payload) -> PipelineJob:
+        """
+        提交任务，第一个阶段队列已满时阻塞（背压）
+        Args:
+            payload: 任务数据
+        Returns:
+            PipelineJob: 流水线任务
+        """
+        with self.lock:
+            job = PipelineJob(self.next_seq, payload)
+            self.next_seq += 1
+            self.in_flight += 1
+        self.queues[0].put(job)
+        return job
+
+    def pending_count(self) -> int:
+        """尚未提交给 sink 的任务数"""
+        with self.lock:
+            return self.in_flight
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """等待所有已提交任务处理完毕"""
+        with self.lock:
+            return self.lock.wait_for(lambda: self.in_flight == 0, timeout)
+
+    def cancel_pending(self):
+        """取消尚未开始的阶段处理，任务仍会以 cancelled 状态流到 sink"""
+        self.cancelled = True
+
+    def shutdown(self, cancel: bool = True):
+        """
+        关闭流水线：逐个阶段发送退出标记并等待线程结束
+        Args:
+            cancel: 是否跳过尚未处理的任务
+        """
+        if cancel:
+            self.cancel_pending()
+        for index, stage_threads in enumerate(self.threads):
+            for _ in stage_threads:
+                self.queues[index].put(_STOP)
+            for thread in stage_threads:
+                thread.join()
+        self.commit_queue.put(_STOP)
+        if self.commit_thread:
+            self.commit_thread.join()
+        logger.info("流水线已关闭")
+
+    def _stage_worker(self, index: int):
+        """阶段工作线程"""
+        stage = self.stages[index]
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.queues) else self.commit_queue
+        while True:
+            job = input_queue.get()
+            if job is _STOP:
+                break
+            if self.cancelled:
+                job.cancelled = True
+            elif job.error is None:
+                start_time = time.perf_counter()
+                try:
+                    stage.func(job)
+                except Exception as e:
+                    job.error = e
+                    job.failed_stage = stage.name
+                job.timings[stage.name] = time.perf_counter() - start_time
+            output_queue.put(job)
+
+    def _commit_worker(self):
+        """提交线程：按序把任务交给 sink"""
+        while True:
+            job = self.commit_queue.get()
+            if job is _STOP:
+                break
+            committed = self.reorder_buffer.push(job)
+            with self.lock:
+                self.in_flight -= committed
+                self.lock.notify_all()
+
+class MicroBatcher:
+    """
+    微批收集器：凑满 max_size 个条目，或第一个条目等待超过 max_wait 秒时，
+    将已收集的条目作为一个列表交给 flush_callback。
+    """
+    def __init__(self, flush_callback, max_size: int = 8, max_wait: float = 0.5):
+        self.flush_callback = flush_callback
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait)
+        self.items = []
+        self.first_item_time = None
+        self.lock = threading.Condition()
+        self.flush_lock = threading.Lock()  # 保证批次按收集顺序交出
+        self.closed = False
+        self.timer_thread = threading.Thread(target=self._timer_worker, name="micro-batcher", daemon=True)
+        self.timer_thread.start()
+
+    def add(self, item):
+        """加入一个条目，凑满一批时在调用线程中立即交出"""
+        with self.lock:
+            self.items.append(item)
+            if self.first_item_time is None:
+                self.first_item_time = time.monotonic()
+                self.lock.notify_all()
+            full = len(self.items) >= self.max_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """立即交出已收集的条目"""
+        with self.flush_lock:
+            with self.lock:
+                batch = self.items
+                self.items = []
+                self.first_item_time = None
+            if batch:
+                self.flush_callback(batch)
+
+    def close(self, flush: bool = True):
+        """停止计时线程，flush 为 True 时交出剩余条目"""
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        self.timer_thread.join()
+        if flush:
+            self.flush()
+
+    def _timer_worker(self):
+        """等待时间到达后交出未凑满的批次"""
+        while True:
+            with self.lock:
+                while not self.closed and self.first_item_time is None:
+                    self.lock.wait()
+                if self.closed:
+                    return
+                remaining = self.first_item_time + self.max_wait - time.monotonic()
+                if remaining > 0:
+                    self.lock.wait(remaining)
+                    continue
+            self.flush()
@@ -0,0 +1,191 @@
+import os
+import time
+import queue
+import logging
+import threading
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'  # 未完成文件的临时后缀，完成后重命名为目标文件名
+
+class DownloadTask:
+    """一个待下载的远程文件"""
+    def __init__(self, remote_path: str, local_path: str):
+        self.remote_path = remote_path
+        self.local_path = local_path
+
+class BulkDownloader:
+    """
+    并行、可续传的批量下载引擎。
+    每个工作线程从连接池借用一条连接（独立的SFTP通道），依次领取任务；
+    数据先写入 <文件名>.part，完整后才重命名，再次运行时从 .part 已有的字节处继续下载。
+    """
+    def __init__(self, client_factory, workers: int = 4, block_size: int = 1024 * 1024,
+                 progress_callback=None, progress_interval: float = 0.5, state_index=None,
+                 scheduler=None, job_class: str = None):
+        """
+        Args:
+            client_factory: 创建SSH客户端的函数（需提供 connect/close/sftp/lease/transfer_profile）
+            workers: 并行下载的工作线程数
+            block_size: 每次读取的字节数
+            progress_callback: 进度回调 progress_callback(已完成数, 总数, 字节/秒, 预计剩余秒数)
+            progress_interval: 进度回调的最小间隔（秒）
+            state_index: 远程状态索引（RemoteStateIndex），提供时用缓存的目录列表代替逐个文件stat
+            scheduler: 共享的任务调度器（JobScheduler），提供时每个文件下载前按 job_class 申请许可
+            job_class: 调度器中的任务类别
+        """
+        self.client_factory = client_factory
+        self.workers = max(1, workers)
+        self.block_size = block_size
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.state_index = state_index
+        self.scheduler = scheduler
+        self.job_class = job_class
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.reset_stats(0)
+
+    def reset_stats(self, total: int):
+        """重置统计数据"""
+        self.total = total
+        self.completed = 0
+        self.failed = []
+        self.bytes_downloaded = 0
+        self.start_time = time.time()
+        self.last_report = 0
+
+    def stop(self):
+        """请求停止，正在下载的文件保留 .part 以便下次续传"""
+        self.stop_event.set()
+
+    def download(self, tasks: list) -> tuple[int, list]:
+        """
+        下载全部任务，阻塞直到完成或被停止
+        Args:
+            tasks: DownloadTask 列表
+        Returns:
+            tuple[int, list]: (成功数, 失败的 (任务, 错误信息) 列表)
+        """
+        self.reset_stats(len(tasks))
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+
+        threads = [threading.Thread(target=self.worker, args=(pending,), name=f"bulk-download-{index}", daemon=True)
+                   for index in range(min(self.workers, len(tasks)) or 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.report(force=True)
+        elapsed = time.time() - self.start_time
+        logger.info(f"批量下载结束: 成功 {self.completed}/{self.total}，失败 {len(self.failed)}，"
+                    f"共 {self.bytes_downloaded / 1024 / 1024:.1f} MB，用时 {elapsed:.1f} 秒")
+        return self.completed, self.failed
+
+    def worker(self, pending: queue.Queue):
+        """工作线程：整个下载过程持有同一条借用的连接，出错时重新借用"""
+        client = None
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with self.admit():
+                        if client is None:
+                            client = self.client_factory()
+                            client.connect()
+                        self.download_file(client, task)
+                    with self.lock:
+                        self.completed += 1
+                except InterruptedError:
+                    logger.info(f"下载已停止，保留临时文件以便续传: {task.local_path}{PART_SUFFIX}")
+                    return
+                except Exception as e:
+                    logger.error(f"下载失败 {task.remote_path}: {str(e)}")
+                    with self.lock:
+                        self.failed.append((task, str(e)))
+                    if client is not None and not isinstance(e, FileNotFoundError):
+                        # 连接状态未知，归还并在下一个任务时重新借用
+                        if getattr(client, 'lease', None) is not None:
+                            client.lease.mark_broken()
+                        client.close()
+                        client = None
+                self.report()
+        finally:
+            if client is not None:
+                client.close()
+
+    def admit(self):
+        """下载一个文件前向调度器申请许可，停止时放弃等待"""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(self.job_class, cancelled=self.stop_event.is_set)
+
+    def download_file(self, client, task: DownloadTask):
+        """下载单个文件，已完成的跳过，存在 .part 时从断点继续"""
+        if os.path.exists(task.local_path):
+            return
+        local_dir = os.path.dirname(task.local_path)
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+
+        part_path = task.local_path + PART_SUFFIX
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if self.state_index is not None:
+            remote_size = self.state_index.file_size(client.sftp, task.remote_path)
+            if remote_size is None:
+                raise FileNotFoundError(f"远程文件不存在: {task.remote_path}")
+        else:
+            remote_size = client.sftp.stat(task.remote_path).st_size
+        if offset > remote_size:
+            logger.warning(f"临时文件比远程文件大，重新下载: {part_path}")
+            offset = 0
+        if offset:
+            logger.info(f"从 {offset}/{remote_size} 字节处继续下载: {task.remote_path}")
+
+        with client.sftp.open(task.remote_path, 'rb') as remote_file, \
+                open(part_path, 'r+b' if offset else 'wb') as local_file:
+            remote_file.seek(offset)
+            local_file.seek(offset)
+            local_file.truncate()
+            if client.transfer_profile.prefetch_get and remote_size > offset:
+                remote_file.prefetch(remote_size, client.transfer_profile.max_concurrent_prefetch_requests)
+            position = offset
+            while position < remote_size:
+                if self.stop_event.is_set():
+                    raise InterruptedError("下载已停止")
+                data = remote_file.read(min(self.block_size, remote_size - position))
+                if not data:
+                    break
+                local_file.write(data)
+                position += len(data)
+                with self.lock:
+                    self.bytes_downloaded += len(data)
+                self.report()
+
+        if position != remote_size:
+            raise IOError(f"文件不完整 {position}/{remote_size}")
+        os.replace(part_path, task.local_path)
+
+    def report(self, force: bool = False):
+        """按间隔回调进度：完成数、吞吐量和预计剩余时间"""
+        if self.progress_callback is None:
+            return
+        now = time.time()
+        with self.lock:
+            if not force and now - self.last_report < self.progress_interval:
+                return
+            self.last_report = now
+            done = self.completed + len(self.failed)
+            elapsed = max(now - self.start_time, 1e-6)
+            throughput = self.bytes_downloaded / elapsed
+            # 按已完成文件的平均用时估算剩余时间
+            eta = elapsed / done * (self.total - done) if done else -1.0
+            completed, total = self.completed, self.total
+        self.progress_callback(completed, total, throughput, eta)
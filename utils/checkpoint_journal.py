@@ -0,0 +1,246 @@
+from dotenv import load_dotenv
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.jsonl'  # <时间戳>.json 快照旁的追加日志
+ROTATED_SUFFIX = '.jsonl.old'  # 压缩进行中被轮换出来的日志，快照写完后删除
+
+def journal_path(checkpoint_file: str) -> str:
+    """检查点快照对应的追加日志路径"""
+    return os.path.splitext(checkpoint_file)[0] + JOURNAL_SUFFIX
+
+def normalize_entries(processed_images_data: list) -> list:
+    """
+    兼容新旧格式的 processed_images
+    Args:
+        processed_images_data: 旧格式为文件路径列表，新格式为包含 process_id 和处理信息的字典列表
+    Returns:
+        list: 字典列表
+    """
+    entries = []
+    for item in processed_images_data:
+        if isinstance(item, dict):
+            entries.append(item)
+        else:
+            # 旧格式没有process_id
+            entries.append({'file_path': item, 'process_id': 'unknown', 'processed_time': 'unknown'})
+    return entries
+
+def read_journal_lines(path: str) -> list:
+    """读取追加日志，忽略崩溃时写了一半的最后一行"""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"检查点日志第 {line_number} 行不完整，已忽略: {path}")
+    return entries
+
+def read_checkpoint(checkpoint_file: str) -> dict:
+    """
+    读取检查点：快照（新旧格式均可）+ 压缩中轮换出的日志 + 追加日志，按文件路径去重（后写入的优先）
+    Args:
+        checkpoint_file: 检查点快照路径（<时间戳>.json）
+    Returns:
+        dict: {'processed_images': 字典列表, 'last_update': 最后更新时间}
+    """
+    snapshot = {}
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    base_path = os.path.splitext(checkpoint_file)[0]
+    journal_entries = read_journal_lines(base_path + ROTATED_SUFFIX) + read_journal_lines(base_path + JOURNAL_SUFFIX)
+
+    merged = {}
+    for item in normalize_entries(snapshot.get('processed_images', [])) + journal_entries:
+        file_path = item.get('file_path')
+        if file_path:
+            merged.pop(file_path, None)
+            merged[file_path] = item
+
+    last_update = snapshot.get('last_update', '')
+    if journal_entries and journal_entries[-1].get('processed_time'):
+        last_update = journal_entries[-1]['processed_time']
+    result = dict(snapshot)
+    result['processed_images'] = list(merged.values())
+    result['last_update'] = last_update
+    return result
+
+class CheckpointJournal:
+    """
+    追加写入的检查点日志。
+    每处理完一张图片只向 <时间戳>.jsonl 追加一行（JSON Lines），按条数或时间间隔批量 fsync
+    （追加停止后由定时器在间隔到达时补一次 fsync，空闲时未刷盘的行不会无限期滞留）；
+    日志达到一定行数后在后台线程压缩为 <时间戳>.json 快照（先写临时文件再替换），
+    崩溃时最多丢失未 fsync 的几行，快照不会被写坏。
+    """
+    def __init__(self, checkpoint_file: str, fsync_interval: float = 1.0, fsync_batch: int = 32,
+                 compact_every: int = 1000):
+        """
+        Args:
+            checkpoint_file: 检查点快照路径
+            fsync_interval: 两次 fsync 的最长间隔（秒）
+            fsync_batch: 累计多少行后 fsync
+            compact_every: 日志累计多少行后在后台压缩为快照
+        """
+        self.checkpoint_file = checkpoint_file
+        self.base_path = os.path.splitext(checkpoint_file)[0]
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = max(1, fsync_batch)
+        self.compact_every = max(1, compact_every)
+        self.lock = threading.Lock()
+        self.compact_thread = None
+        self.sync_timer = None  # 有未 fsync 的行时，在 fsync_interval 到达时刷盘
+
+        checkpoint_dir = os.path.dirname(checkpoint_file)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        checkpoint_data = read_checkpoint(checkpoint_file)
+        self.entries = {item['file_path']: item for item in checkpoint_data['processed_images']}
+
+        # 上次压缩中途退出，或旧格式检查点：先同步整理为新快照
+        if os.path.exists(self.base_path + ROTATED_SUFFIX) or not os.path.exists(checkpoint_file):
+            self.write_snapshot(list(self.entries.values()))
+            self.remove_rotated()
+
+        self.truncate_partial_line()
+        self.journal = open(self.base_path + JOURNAL_SUFFIX, 'a', encoding='utf-8')
+        self.journal_lines = len(read_journal_lines(self.base_path + JOURNAL_SUFFIX))
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def truncate_partial_line(self):
+        """截掉崩溃时写了一半的最后一行，避免与新追加的行粘连"""
+        path = self.base_path + JOURNAL_SUFFIX
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    @property
+    def processed_images(self) -> dict:
+        """文件路径 -> 处理信息"""
+        with self.lock:
+            return dict(self.entries)
+
+    def append(self, entry: dict):
+        """
+        记录一张已处理的图片
+        Args:
+            entry: 处理信息，需包含 file_path
+        """
+        with self.lock:
+            self.entries[entry['file_path']] = entry
+            self.journal.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.journal.flush()
+            self.unsynced += 1
+            self.journal_lines += 1
+            if self.unsynced >= self.fsync_batch or time.time() - self.last_sync >= self.fsync_interval:
+                self.sync_locked()
+            elif self.sync_timer is None:
+                delay = max(0.0, self.last_sync + self.fsync_interval - time.time())
+                self.sync_timer = threading.Timer(delay, self.sync_due)
+                self.sync_timer.daemon = True
+                self.sync_timer.start()
+            need_compact = self.journal_lines >= self.compact_every and \
+                (self.compact_thread is None or not self.compact_thread.is_alive())
+        if need_compact:
+            self.compact_thread = threading.Thread(target=self.compact, name="checkpoint-compact", daemon=True)
+            self.compact_thread.start()
+
+    def sync_locked(self):
+        """将日志刷到磁盘（调用方持有锁）"""
+        if self.unsynced:
+            os.fsync(self.journal.fileno())
+            self.unsynced = 0
+        self.last_sync = time.time()
+
+    def sync_due(self):
+        """定时器回调：追加停止后，把间隔内未刷盘的行刷到磁盘"""
+        try:
+            with self.lock:
+                self.sync_timer = None
+                if not self.journal.closed:
+                    self.sync_locked()
+        except Exception as e:
+            logger.error(f"检查点日志刷盘失败: {str(e)}")
+
+    def compact(self):
+        """将当前日志轮换出来，写入新快照后删除，期间的新记录写入新日志"""
+        try:
+            with self.lock:
+                self.sync_locked()
+                self.journal.close()
+                os.replace(self.base_path + JOURNAL_SUFFIX, self.base_path + ROTATED_SUFFIX)
+                self.journal = open(self.base_path + JOURNAL_SUFFIX, 'a', encoding='utf-8')
+                self.journal_lines = 0
+                entries = list(self.entries.values())
+            self.write_snapshot(entries)
+            self.remove_rotated()
+            logger.info(f"检查点已压缩为快照: {len(entries)} 条记录")
+        except Exception as e:
+            logger.error(f"压缩检查点失败: {str(e)}")
+
+    def write_snapshot(self, entries: list):
+        """写入快照（与原检查点格式相同）"""
+        temp_path = self.checkpoint_file + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'processed_images': entries,
+                'last_update': datetime.datetime.now().isoformat()
+            }, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_file)
+
+    def remove_rotated(self):
+        """删除已写入快照的轮换日志"""
+        try:
+            os.remove(self.base_path + ROTATED_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """刷盘并压缩为快照，之后只需读取 <时间戳>.json"""
+        if self.compact_thread is not None:
+            self.compact_thread.join()
+        if self.journal_lines > 0:
+            self.compact()
+        with self.lock:
+            if self.sync_timer is not None:
+                self.sync_timer.cancel()
+                self.sync_timer = None
+            self.sync_locked()
+            self.journal.close()
+            if self.journal_lines == 0 and os.path.exists(self.base_path + JOURNAL_SUFFIX):
+                os.remove(self.base_path + JOURNAL_SUFFIX)
+
+def open_checkpoint_journal(checkpoint_file: str) -> CheckpointJournal:
+    """
+    按 .env 配置打开检查点日志
+    Args:
+        checkpoint_file: 检查点快照路径
+    Returns:
+        CheckpointJournal: 检查点日志
+    """
+    load_dotenv()
+    return CheckpointJournal(
+        checkpoint_file,
+        fsync_interval=float(os.getenv('CHECKPOINT_FSYNC_INTERVAL', 1.0)),
+        fsync_batch=int(os.getenv('CHECKPOINT_FSYNC_BATCH', 32)),
+        compact_every=int(os.getenv('CHECKPOINT_COMPACT_EVERY', 1000)),
+    )
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import bisect
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DirectoryIndex:
+    """
+    监控文件夹的增量索引。
+    记录已见过的文件 (inode, 大小, 修改时间) 并持久化到磁盘；文件夹修改时间未变时不读取目录，
+    变化时用 os.scandir 读取一次，只对新出现的文件调用 stat。每个新文件分配递增序号，
+    调用方通过游标只取上次之后新增的文件：除读取目录项本身外，stat、排序和过滤的开销只与新文件数量成正比。
+    新文件的大小和修改时间稳定后才分配序号，避免把仍在写入的图片以不完整的状态交给调用方。
+    """
+    def __init__(self, directory: str, extensions=('.png', '.jpg', '.jpeg'), index_dir: str = "temp/directory_index",
+                 save_interval: float = 30.0, mtime_granularity: float = 2.0, settle_time: float = 2.0):
+        """
+        Args:
+            directory: 监控文件夹
+            extensions: 需要索引的文件扩展名
+            index_dir: 索引文件保存目录
+            save_interval: 索引写盘的最小间隔（秒）
+            mtime_granularity: 文件夹修改时间的精度（秒），网络共享通常为1~2秒；
+                               上次读取时文件夹刚被修改过，则下次即使修改时间相同也重新读取
+            settle_time: 新文件的修改时间距今不足该秒数时视为仍在写入，
+                         等到大小和修改时间在至少该秒数内不再变化后才加入索引
+        """
+        self.directory = directory
+        self.extensions = tuple(extensions)
+        self.save_interval = save_interval
+        self.mtime_granularity = mtime_granularity
+        self.settle_time = settle_time
+        path_hash = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+        self.index_path = os.path.join(index_dir, f"{path_hash}.json")
+        self.entries = {}  # 文件名 -> [inode, 大小, 修改时间, 创建时间, 序号]
+        self.sequence = 0  # 最近分配的序号
+        self.order = []  # 按序号排列的 (序号, 文件名)，游标查询用二分定位
+        self.unsettled = {}  # 可能仍在写入的新文件: 文件名 -> [大小, 修改时间, 首次观察到该状态的时间]
+        self.directory_mtime = None  # 上次读取目录时的修改时间
+        self.listed_at = 0
+        self.dirty = False
+        self.last_saved = 0
+        self.load()
+
+    def load(self):
+        """读取持久化的索引，文件不存在或损坏时从空索引开始"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('directory') != os.path.abspath(self.directory):
+                return
+            self.entries = data.get('entries', {})
+            self.sequence = data.get('sequence', 0)
+            self.directory_mtime = data.get('directory_mtime')
+            self.listed_at = data.get('listed_at', 0)
+            self.order = sorted((entry[4], name) for name, entry in self.entries.items())
+            logger.info(f"加载目录索引: {len(self.entries)} 个文件 ({self.directory})")
+        except Exception as e:
+            logger.warning(f"目录索引损坏，将重新建立: {str(e)}")
+            self.entries = {}
+            self.sequence = 0
+            self.order = []
+            self.directory_mtime = None
+
+    def save(self, force: bool = False):
+        """索引有变化时写盘（先写临时文件再替换），默认按 save_interval 节流"""
+        if not self.dirty or (not force and time.time() - self.last_saved < self.save_interval):
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'directory': os.path.abspath(self.directory),
+                    'directory_mtime': self.directory_mtime,
+                    'listed_at': self.listed_at,
+                    'sequence': self.sequence,
+                    'entries': self.entries,
+                }, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+            self.dirty = False
+            self.last_saved = time.time()
+        except Exception as e:
+            logger.error(f"保存目录索引失败: {str(e)}")
+
+    def refresh(self) -> bool:
+        """
+        文件夹有变化时更新索引
+        Returns:
+            bool: 是否读取了目录
+        """
+        directory_mtime = os.stat(self.directory).st_mtime
+        # 修改时间未变，且上次读取不在修改时间精度范围内（排除同一时间粒度内的后续写入）；
+        # 写入文件内容不会改变文件夹修改时间，有未稳定的新文件时总是重新读取
+        if directory_mtime == self.directory_mtime and self.listed_at - directory_mtime > self.mtime_granularity \
+                and not self.unsettled:
+            return False
+
+        listed_at = time.time()
+        seen = set()
+        added = []
+        with os.scandir(self.directory) as iterator:
+            for entry in iterator:
+                _, ext = os.path.splitext(entry.name.lower())
+                if ext not in self.extensions:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+                    known = self.entries.get(entry.name)
+                    # POSIX 上 inode 来自目录项本身，不需要额外的 stat，inode 变化说明文件被替换；
+                    # Windows 上读取 inode 需要单独 stat，只按文件名判断
+                    if known is not None and (os.name == 'nt' or known[0] == entry.inode()):
+                        continue
+                    stat_result = entry.stat()
+                except OSError:
+                    # 读取过程中被删除
+                    continue
+                if not self.is_settled(entry.name, stat_result, listed_at):
+                    continue
+                added.append((stat_result.st_ctime, entry.name, stat_result))
+
+        # 新文件按创建时间排序（旧的在前）后分配序号
+        added.sort()
+        for _, name, stat_result in added:
+            self.sequence += 1
+            self.entries[name] = [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime,
+                                  stat_result.st_ctime, self.sequence]
+            self.order.append((self.sequence, name))
+        for name in [name for name in self.unsettled if name not in seen]:
+            del self.unsettled[name]
+        removed = [name for name in self.entries if name not in seen]
+        for name in removed:
+            del self.entries[name]
+        if removed and len(self.order) > 2 * len(self.entries) + 1024:
+            # 被删除的文件较多时压缩序号列表
+            self.order = [(sequence, name) for sequence, name in self.order
+                          if name in self.entries and self.entries[name][4] == sequence]
+
+        self.directory_mtime = directory_mtime
+        self.listed_at = listed_at
+        if added or removed:
+            self.dirty = True
+            logger.debug(f"目录索引更新: 新增 {len(added)}，移除 {len(removed)}，共 {len(self.entries)} 个文件")
+        self.save()
+        return True
+
+    def is_settled(self, name: str, stat_result, now: float) -> bool:
+        """
+        新文件是否已写完：大小和修改时间与上次观察一致，且修改时间（或首次观察到该状态的时间）已超过 settle_time；
+        未写完时记录本次观察，等下次读取目录时再比较
+        """
+        observed = [stat_result.st_size, stat_result.st_mtime]
+        pending = self.unsettled.get(name)
+        if pending is not None and pending[:2] != observed:
+            pending = None  # 仍在变化，重新开始计时
+        elif pending is not None and now - pending[2] >= self.settle_time:
+            del self.unsettled[name]
+            return True
+        if now - stat_result.st_mtime >= self.settle_time:
+            self.unsettled.pop(name, None)
+            return True
+        if pending is None:
+            self.unsettled[name] = observed + [now]
+        return False
+
+    def entries_since(self, cursor: int) -> tuple[list, int]:
+        """
+        取游标之后新增的文件
+        Args:
+            cursor: 上次返回的游标，0 表示全部
+        Returns:
+            tuple[list, int]: (按发现顺序排列的文件路径列表, 新游标)
+        """
+        if cursor >= self.sequence:
+            return [], cursor
+        start = bisect.bisect_left(self.order, (cursor + 1,))
+        paths = [os.path.join(self.directory, name) for sequence, name in self.order[start:]
+                 if name in self.entries and self.entries[name][4] == sequence]
+        return paths, self.sequence
+
+    def close(self):
+        """保存未写盘的索引"""
+        self.save(force=True)
@@ -0,0 +1,111 @@
+import os
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+FICLONE = 0x40049409  # Linux ioctl: 写时复制克隆整个文件（btrfs、xfs等支持）
+
+def reflink_file(src: str, dst: str) -> bool:
+    """
+    尝试以reflink（写时复制）方式克隆文件
+    Returns:
+        bool: 文件系统支持并克隆成功时返回 True
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+def clone_or_copy(src: str, dst: str):
+    """
+    生成与源文件互不影响的副本：优先reflink（写时复制，不占额外空间），不支持时真正复制。
+    不使用硬链接，修改或覆盖其中一个文件不会影响另一个
+    """
+    if not reflink_file(src, dst):
+        shutil.copy2(src, dst)
+
+def link_or_clone(src: str, dst: str) -> bool:
+    """
+    不复制数据地归档文件：优先reflink，其次硬链接
+    Returns:
+        bool: 成功时返回 True，返回 False 表示需要真正复制
+    """
+    if os.path.exists(dst):
+        return True
+    if reflink_file(src, dst):
+        return True
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        return False
+
+def unique_file_names(file_paths) -> list:
+    """
+    为一组文件生成不冲突的文件名（来自不同文件夹的同名文件追加序号）
+    Args:
+        file_paths: 文件路径列表
+    Returns:
+        list: [(文件路径, 文件名), ...]
+    """
+    used_names = set()
+    result = []
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        stem, ext = os.path.splitext(filename)
+        index = 1
+        while filename in used_names:
+            filename = f"{stem}_{index}{ext}"
+            index += 1
+        if filename != os.path.basename(file_path):
+            logger.warning(f"文件名重复，{file_path} 将以 {filename} 保存")
+        used_names.add(filename)
+        result.append((file_path, filename))
+    return result
+
+def archive_files(named_files, dest_dir: str) -> threading.Thread:
+    """
+    将原始文件归档到目标文件夹：能链接的立即链接，其余文件在后台线程中复制
+    Args:
+        named_files: [(文件路径, 归档文件名), ...]
+        dest_dir: 归档目标文件夹
+    Returns:
+        threading.Thread: 后台复制线程，没有需要复制的文件时返回 None
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    pending_copies = []
+    linked_count = 0
+    for file_path, filename in named_files:
+        dest_path = os.path.join(dest_dir, filename)
+        if link_or_clone(file_path, dest_path):
+            linked_count += 1
+        else:
+            pending_copies.append((file_path, dest_path))
+
+    if linked_count:
+        logger.info(f"已通过链接归档 {linked_count} 个原始文件到: {dest_dir}")
+    if not pending_copies:
+        return None
+
+    def copy_worker():
+        for file_path, dest_path in pending_copies:
+            try:
+                shutil.copy2(file_path, dest_path)
+            except Exception as e:
+                logger.error(f"后台归档文件失败 {file_path}: {str(e)}")
+        logger.info(f"后台复制归档完成，共 {len(pending_copies)} 个文件: {dest_dir}")
+
+    thread = threading.Thread(target=copy_worker, daemon=True)
+    thread.start()
+    logger.info(f"文件系统不支持链接，{len(pending_copies)} 个原始文件转入后台复制")
+    return thread
@@ -0,0 +1,148 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008  # 以写方式打开的文件被关闭（写入完成）
+IN_MOVED_TO = 0x00000080     # 文件被移入监控目录（先写临时文件再重命名的相机软件）
+IN_Q_OVERFLOW = 0x00004000   # 内核事件队列溢出，有事件丢失
+IN_IGNORED = 0x00008000      # 监控被移除（目录被删除或卸载）
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+# 不支持inotify（或无法收到其他主机写入事件）的文件系统，需要退回轮询
+UNSUPPORTED_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'ceph', 'glusterfs',
+                           'fuse.sshfs', 'fuse.glusterfs', 'fuse.cephfs', 'afs', 'davfs', 'fuse.rclone')
+
+def filesystem_type(path: str) -> str:
+    """
+    从 /proc/self/mountinfo 查找路径所在挂载点的文件系统类型
+    Args:
+        path: 文件夹路径
+    Returns:
+        str: 文件系统类型，无法判断时返回空字符串
+    """
+    try:
+        real_path = os.path.realpath(path)
+        best_mount, best_type = '', ''
+        with open('/proc/self/mountinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                separator = fields.index('-')
+                mount_point = fields[4].replace('\\040', ' ')
+                if (real_path == mount_point or real_path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) >= len(best_mount):
+                    best_mount, best_type = mount_point, fields[separator + 1]
+        return best_type
+    except (OSError, ValueError, IndexError):
+        return ''
+
+def supports_inotify(path: str) -> bool:
+    """当前平台和路径所在文件系统是否能可靠地使用inotify"""
+    if not sys.platform.startswith('linux'):
+        return False
+    fs_type = filesystem_type(path)
+    if fs_type in UNSUPPORTED_FILESYSTEMS:
+        logger.info(f"监控文件夹位于 {fs_type} 文件系统，inotify无法收到其他主机的写入事件")
+        return False
+    return True
+
+class InotifyWatcher:
+    """
+    基于Linux inotify的文件夹监控（通过ctypes直接调用内核接口）。
+    只关注写入完成（IN_CLOSE_WRITE）和移入（IN_MOVED_TO）的文件，避免处理尚未写完的图片。
+    """
+    def __init__(self, path: str, extensions=('.png', '.jpg', '.jpeg')):
+        self.path = path
+        self.extensions = tuple(extensions)
+        self.fd = None
+        self.overflowed = False  # 事件队列溢出后需要做一次全量扫描
+
+    def start(self) -> bool:
+        """
+        开始监控
+        Returns:
+            bool: 成功时返回 True；平台或文件系统不支持时返回 False，调用方应退回轮询
+        """
+        if not supports_inotify(self.path):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+            wd = libc.inotify_add_watch(fd, os.fsencode(self.path), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                error_code = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(error_code, os.strerror(error_code))
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify 不可用，退回轮询: {str(e)}")
+            return False
+        self.fd = fd
+        logger.info(f"已启用inotify监控: {self.path}")
+        return True
+
+    def read_events(self, timeout: float) -> list:
+        """
+        等待并读取事件
+        Args:
+            timeout: 最长等待时间（秒）
+        Returns:
+            list: 按事件顺序排列的新图片路径
+        """
+        if self.fd is None:
+            return []
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if not readable:
+                return []
+            data = os.read(self.fd, 64 * 1024)
+        except (OSError, ValueError) as e:
+            if getattr(e, 'errno', None) == errno.EAGAIN:
+                return []
+            # 描述符失效等读取错误：关闭监控，调用方据 fd 为 None 退回轮询，不中断监控主循环
+            logger.warning(f"inotify 读取失败，退回轮询: {str(e)}")
+            self.close()
+            return []
+
+        paths = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify 事件队列溢出，将进行一次全量扫描")
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                logger.warning(f"inotify 监控已失效: {self.path}")
+                self.close()
+                break
+            if mask & IN_ISDIR or not name:
+                continue
+            filename = os.fsdecode(name)
+            if os.path.splitext(filename.lower())[1] in self.extensions:
+                paths.append(os.path.join(self.path, filename))
+        return paths
+
+    def close(self):
+        """停止监控"""
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
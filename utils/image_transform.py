@@ -0,0 +1,92 @@
+from dotenv import load_dotenv
+from utils.file_namer import FileNamer
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 无损格式的源文件才重新编码；JPEG重新编码为无损格式只会变大
+LOSSLESS_SOURCE_EXTENSIONS = ('.bmp', '.tif', '.tiff', '.png')
+
+class UploadTransform:
+    """
+    上传前的图片预处理：将BMP/TIFF/未压缩PNG无损重新编码为紧凑格式，
+    并可按图片类型（square / other）缩小到模型输入分辨率。very long 图片不缩放。
+    处理结果写入临时文件，只有比原文件小时才会替换上传。
+    """
+    def __init__(self, enabled: bool = False, output_format: str = 'png', compress_level: int = 6,
+                 max_side_square: int = 0, max_side_other: int = 0, temp_dir: str = "temp/upload_transform"):
+        self.enabled = enabled
+        self.output_format = output_format.lower()
+        self.compress_level = compress_level
+        self.max_side = {'square': max_side_square, 'other': max_side_other}  # 0 表示不缩放
+        self.temp_dir = temp_dir
+
+    def prepare(self, image_path: str, image_type: str = None) -> str:
+        """
+        生成用于上传的文件
+        Args:
+            image_path: 原始图片路径
+            image_type: image_type_judge 的结果，为 None 时不缩放
+        Returns:
+            str: 需要上传的文件路径；未处理时返回原路径，否则返回临时文件路径（上传后应调用 cleanup 删除）
+        """
+        if not self.enabled:
+            return image_path
+        max_side = self.max_side.get(image_type, 0)
+        is_lossless_source = os.path.splitext(image_path)[1].lower() in LOSSLESS_SOURCE_EXTENSIONS
+        if not is_lossless_source and not max_side:
+            return image_path
+
+        try:
+            from PIL import Image
+            os.makedirs(self.temp_dir, exist_ok=True)
+            output_path = os.path.join(self.temp_dir, f"{FileNamer.generate_unique_string()}.{self.output_format}")
+            with Image.open(image_path) as img:
+                width, height = img.size
+                if max_side and max(width, height) > max_side:
+                    scale = max_side / max(width, height)
+                    img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.LANCZOS)
+                    logger.info(f"上传前缩放图片: {width}x{height} -> {img.size[0]}x{img.size[1]}")
+                elif not is_lossless_source:
+                    return image_path
+                if self.output_format == 'webp':
+                    img.save(output_path, 'WEBP', lossless=True)
+                else:
+                    img.save(output_path, 'PNG', compress_level=self.compress_level)
+
+            original_size = os.path.getsize(image_path)
+            output_size = os.path.getsize(output_path)
+            if output_size >= original_size:
+                os.remove(output_path)
+                logger.info(f"预处理后文件未变小，上传原图: {os.path.basename(image_path)}")
+                return image_path
+            logger.info(f"上传前预处理 {os.path.basename(image_path)}: {original_size} -> {output_size} 字节，"
+                        f"节省 {original_size - output_size} 字节 ({(original_size - output_size) * 100 / original_size:.1f}%)")
+            return output_path
+        except Exception as e:
+            logger.error(f"上传前预处理失败，上传原图: {str(e)}")
+            return image_path
+
+    def cleanup(self, original_path: str, upload_path: str):
+        """删除 prepare 生成的临时文件"""
+        if upload_path != original_path and os.path.exists(upload_path):
+            try:
+                os.remove(upload_path)
+            except OSError as e:
+                logger.warning(f"删除预处理临时文件失败: {upload_path}, {e}")
+
+def get_upload_transform() -> UploadTransform:
+    """
+    按 .env 配置创建上传预处理
+    Returns:
+        UploadTransform: 上传预处理
+    """
+    load_dotenv()
+    return UploadTransform(
+        enabled=os.getenv('UPLOAD_TRANSFORM_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        output_format=os.getenv('UPLOAD_TRANSFORM_FORMAT', 'png'),
+        compress_level=int(os.getenv('UPLOAD_TRANSFORM_PNG_COMPRESS_LEVEL', 6)),
+        max_side_square=int(os.getenv('UPLOAD_MAX_SIDE_SQUARE', 0)),
+        max_side_other=int(os.getenv('UPLOAD_MAX_SIDE_OTHER', 0)),
+    )
@@ -0,0 +1,194 @@
+from dotenv import load_dotenv
+import os
+import time
+import logging
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 任务类别，按优先级从高到低
+INTERACTIVE = 'interactive'    # 单图检测（操作员手动检查）
+ONLINE_BATCH = 'online_batch'  # 在线批处理的远程推理
+PREVIEW = 'preview'            # 在线批处理的预览图下载
+BULK = 'bulk'                  # 批量导出下载
+JOB_CLASSES = (INTERACTIVE, ONLINE_BATCH, PREVIEW, BULK)
+
+CLASS_NAMES = {INTERACTIVE: '单图检测', ONLINE_BATCH: '在线批处理', PREVIEW: '预览下载', BULK: '批量下载'}
+
+def percentile(samples, fraction: float) -> float:
+    """最近样本的分位数（样本为空时返回 0）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class JobClassState:
+    """一个任务类别的并发上限、当前运行数和延迟统计"""
+    def __init__(self, name: str, limit: int, sample_size: int = 1000):
+        self.name = name
+        self.limit = max(1, limit)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_samples = deque(maxlen=sample_size)  # 排队等待时间（秒）
+        self.run_samples = deque(maxlen=sample_size)   # 占用远程资源的时间（秒）
+
+class JobTicket:
+    """一个排队中的请求"""
+    def __init__(self, job_class: str, seq: int):
+        self.job_class = job_class
+        self.priority = JOB_CLASSES.index(job_class)
+        self.seq = seq
+        self.enqueue_time = time.perf_counter()
+
+class JobScheduler:
+    """
+    所有访问远程服务器的任务共用的优先级调度器。
+    单图检测、在线批处理、预览下载和批量下载在开始远程操作前都要取得许可：
+    空出的许可总是先给优先级最高（同优先级先到先得）且未达到本类别并发上限的请求；
+    低优先级类别不能占用为单图检测保留的许可，操作员手动检测不必排在批处理积压之后。
+    """
+    def __init__(self, max_concurrent: int = 8, limits: dict = None, reserved_interactive: int = 1):
+        """
+        Args:
+            max_concurrent: 所有类别合计的最大并发数
+            limits: 类别 -> 并发上限，未给出的类别上限为 max_concurrent
+            reserved_interactive: 只允许单图检测使用的许可数
+        """
+        limits = limits or {}
+        self.max_concurrent = max(1, max_concurrent)
+        self.reserved_interactive = min(max(0, reserved_interactive), self.max_concurrent - 1)
+        self.classes = {job_class: JobClassState(job_class, limits.get(job_class) or self.max_concurrent)
+                        for job_class in JOB_CLASSES}
+        self.running = 0
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def eligible(self, ticket: JobTicket) -> bool:
+        """该请求当前是否有可用许可（调用方持有锁）"""
+        state = self.classes[ticket.job_class]
+        capacity = self.max_concurrent if ticket.job_class == INTERACTIVE else \
+            self.max_concurrent - self.reserved_interactive
+        return state.running < state.limit and self.running < capacity
+
+    def can_start(self, ticket: JobTicket) -> bool:
+        """有可用许可，且没有排在前面、同样可以开始的请求（调用方持有锁）"""
+        if not self.eligible(ticket):
+            return False
+        return not any((other.priority, other.seq) < (ticket.priority, ticket.seq) and self.eligible(other)
+                       for other in self.waiting)
+
+    def acquire(self, job_class: str, cancelled=None) -> JobTicket:
+        """
+        等待并取得一个许可
+        Args:
+            job_class: 任务类别
+            cancelled: 可选的函数，返回 True 时放弃等待
+        Returns:
+            JobTicket: 许可，用完后交给 release
+        """
+        with self.condition:
+            ticket = JobTicket(job_class, next(self.sequence))
+            self.waiting.append(ticket)
+            try:
+                while not self.can_start(ticket):
+                    if cancelled is not None and cancelled():
+                        raise InterruptedError("任务已取消")
+                    self.condition.wait(0.5 if cancelled is not None else None)
+            finally:
+                self.waiting.remove(ticket)
+                # 本请求离开队列后，排在后面的请求可能可以开始了
+                self.condition.notify_all()
+            state = self.classes[job_class]
+            state.running += 1
+            self.running += 1
+            state.wait_samples.append(time.perf_counter() - ticket.enqueue_time)
+            ticket.start_time = time.perf_counter()
+            return ticket
+
+    def release(self, ticket: JobTicket, ok: bool = True):
+        """归还许可并记录运行时间"""
+        with self.condition:
+            state = self.classes[ticket.job_class]
+            state.running -= 1
+            self.running -= 1
+            state.run_samples.append(time.perf_counter() - ticket.start_time)
+            if ok:
+                state.completed += 1
+            else:
+                state.failed += 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, job_class: str, cancelled=None):
+        """在代码块执行期间持有一个许可，代码块抛出异常时记为失败"""
+        ticket = self.acquire(job_class, cancelled)
+        ok = False
+        try:
+            yield ticket
+            ok = True
+        finally:
+            self.release(ticket, ok)
+
+    def stats(self) -> dict:
+        """
+        各类别的统计
+        Returns:
+            dict: 类别 -> {running, waiting, completed, failed, wait_p50, wait_p95, run_p50, run_p95}（秒）
+        """
+        with self.condition:
+            result = {}
+            for job_class, state in self.classes.items():
+                result[job_class] = {
+                    'running': state.running,
+                    'waiting': sum(1 for ticket in self.waiting if ticket.job_class == job_class),
+                    'completed': state.completed,
+                    'failed': state.failed,
+                    'wait_p50': percentile(state.wait_samples, 0.5),
+                    'wait_p95': percentile(state.wait_samples, 0.95),
+                    'run_p50': percentile(state.run_samples, 0.5),
+                    'run_p95': percentile(state.run_samples, 0.95),
+                }
+            return result
+
+    def format_stats(self) -> str:
+        """统计的可读文本（只列出有过任务的类别）"""
+        lines = []
+        for job_class, item in self.stats().items():
+            if not (item['completed'] or item['failed'] or item['running'] or item['waiting']):
+                continue
+            lines.append(f"{CLASS_NAMES[job_class]}: 完成 {item['completed']} 失败 {item['failed']} "
+                         f"运行 {item['running']} 排队 {item['waiting']} | "
+                         f"等待 p50 {item['wait_p50']:.2f}s p95 {item['wait_p95']:.2f}s | "
+                         f"执行 p50 {item['run_p50']:.2f}s p95 {item['run_p95']:.2f}s")
+        return '; '.join(lines) or "暂无任务"
+
+_job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+def get_job_scheduler() -> JobScheduler:
+    """
+    获取进程内共享的任务调度器（按 .env 配置创建）
+    Returns:
+        JobScheduler: 任务调度器
+    """
+    global _job_scheduler
+    with _job_scheduler_lock:
+        if _job_scheduler is None:
+            load_dotenv()
+            max_concurrent = int(os.getenv('SCHEDULER_MAX_CONCURRENT', 8))
+            _job_scheduler = JobScheduler(
+                max_concurrent=max_concurrent,
+                limits={
+                    INTERACTIVE: int(os.getenv('SCHEDULER_LIMIT_INTERACTIVE', 2)),
+                    ONLINE_BATCH: int(os.getenv('SCHEDULER_LIMIT_ONLINE_BATCH', max_concurrent)),
+                    PREVIEW: int(os.getenv('SCHEDULER_LIMIT_PREVIEW', 2)),
+                    BULK: int(os.getenv('SCHEDULER_LIMIT_BULK', 4)),
+                },
+                reserved_interactive=int(os.getenv('SCHEDULER_RESERVED_INTERACTIVE', 1)),
+            )
+        return _job_scheduler
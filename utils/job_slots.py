@@ -0,0 +1,124 @@
+from dotenv import load_dotenv
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class JobSlot:
+    """一个远程任务槽位，可绑定到服务器上的一块GPU"""
+    def __init__(self, index: int, gpu: str = None):
+        self.index = index
+        self.gpu = gpu  # CUDA_VISIBLE_DEVICES 的值，为 None 时不指定
+        self.busy = False
+        self.consecutive_failures = 0
+        self.disabled_until = 0  # 连续失败后暂停使用，到该时间后恢复
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def name(self) -> str:
+        return f"slot-{self.index}" + (f"(GPU {self.gpu})" if self.gpu is not None else "")
+
+class JobSlotPool:
+    """
+    在线批处理的并发任务槽位。
+    每个槽位同一时刻只运行一个远程任务，多块GPU时槽位轮流绑定到各GPU；
+    某个槽位连续失败达到阈值后暂停一段时间，其余槽位继续处理，不会被拖住。
+    """
+    def __init__(self, slots: int = 1, gpus: list = None, failure_threshold: int = 3, cooldown: float = 60.0):
+        """
+        Args:
+            slots: 槽位数
+            gpus: GPU编号列表，槽位 i 绑定到 gpus[i % len(gpus)]，为空时不指定GPU
+            failure_threshold: 连续失败多少次后暂停该槽位
+            cooldown: 暂停时长（秒）
+        """
+        gpus = gpus or []
+        self.slots = [JobSlot(index, gpus[index % len(gpus)] if gpus else None) for index in range(max(1, slots))]
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def acquire(self) -> JobSlot:
+        """
+        取得一个空闲且未暂停的槽位，全部不可用时等待
+        Returns:
+            JobSlot: 槽位
+        """
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise InterruptedError("任务槽位已关闭")
+                now = time.time()
+                available = [slot for slot in self.slots if not slot.busy and slot.disabled_until <= now]
+                if available:
+                    # 优先使用完成任务较少的槽位，使各GPU负载均衡
+                    slot = min(available, key=lambda slot: slot.completed + slot.failed)
+                    slot.busy = True
+                    return slot
+                # 等待其他槽位释放，或暂停中的槽位恢复
+                resume_times = [slot.disabled_until for slot in self.slots if not slot.busy and slot.disabled_until > now]
+                self.condition.wait(min(resume_times) - now if resume_times else None)
+
+    def release(self, slot: JobSlot, ok: bool):
+        """
+        归还槽位
+        Args:
+            slot: 槽位
+            ok: 任务是否成功
+        """
+        with self.condition:
+            slot.busy = False
+            if ok:
+                slot.completed += 1
+                slot.consecutive_failures = 0
+            else:
+                slot.failed += 1
+                slot.consecutive_failures += 1
+                if slot.consecutive_failures >= self.failure_threshold:
+                    slot.disabled_until = time.time() + self.cooldown
+                    slot.consecutive_failures = 0
+                    logger.warning(f"任务槽位 {slot.name} 连续失败 {self.failure_threshold} 次，暂停 {self.cooldown:.0f} 秒，其余槽位继续处理")
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """借用一个槽位，代码块抛出异常时记为失败"""
+        slot = self.acquire()
+        ok = False
+        try:
+            yield slot
+            ok = True
+        finally:
+            self.release(slot, ok)
+
+    def close(self):
+        """关闭槽位池，唤醒所有等待中的线程"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self) -> str:
+        """各槽位的完成/失败数"""
+        with self.condition:
+            return ', '.join(f"{slot.name}: 完成 {slot.completed} 失败 {slot.failed}" for slot in self.slots)
+
+def get_job_slot_pool() -> JobSlotPool:
+    """
+    按 .env 配置创建在线批处理的任务槽位池
+    Returns:
+        JobSlotPool: 任务槽位池
+    """
+    load_dotenv()
+    gpus = [gpu.strip() for gpu in os.getenv('ONLINE_JOB_SLOT_GPUS', '').split(',') if gpu.strip()]
+    slots = int(os.getenv('ONLINE_JOB_SLOTS', 0) or os.getenv('ONLINE_PIPELINE_EXECUTE_WORKERS', 0) or len(gpus) or 1)
+    return JobSlotPool(
+        slots=slots,
+        gpus=gpus,
+        failure_threshold=int(os.getenv('ONLINE_JOB_SLOT_FAILURE_THRESHOLD', 3)),
+        cooldown=float(os.getenv('ONLINE_JOB_SLOT_COOLDOWN', 60)),
+    )
@@ -0,0 +1,132 @@
+from dotenv import load_dotenv
+import os
+import stat
+import time
+import logging
+import posixpath
+import threading
+
+logger = logging.getLogger(__name__)
+
+class RemoteStateIndex:
+    """
+    远程结果目录（output/）的状态索引。
+    批量查询（下载前筛选、批量下载）时一次 listdir_attr 读取 output/ 下所有结果文件夹及其修改时间，在短时间内缓存，
+    供成千上万个处理ID共用；结果文件夹内的文件名、大小按需列出，文件夹修改时间未变时直接使用缓存，不再访问服务器。
+    单张图片等待推理完成时只 stat 该图片的结果文件夹，开销不随 output/ 中历史结果的数量增长。
+    """
+    def __init__(self, root: str, ttl: float = 5.0):
+        self.root = root.rstrip('/')
+        self.ttl = ttl  # 缓存有效期（秒）
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()  # 多个线程同时需要刷新时只列一次
+        self.top_entries = {}  # 文件夹名 -> 修改时间
+        self.top_listed_at = 0
+        self.dir_entries = {}  # 文件夹名 -> (列出时的修改时间, 列出时间, {文件名: (大小, 修改时间)})
+        self.listing_calls = 0
+
+    def refresh(self, sftp):
+        """重新读取 output/ 顶层"""
+        entries = {}
+        for attr in sftp.listdir_attr(self.root):
+            if stat.S_ISDIR(attr.st_mode or 0):
+                entries[attr.filename] = attr.st_mtime
+        with self.lock:
+            self.top_entries = entries
+            self.top_listed_at = time.time()
+            self.listing_calls += 1
+        logger.debug(f"远程结果索引已刷新: {len(entries)} 个结果文件夹")
+
+    def ensure_fresh(self, sftp, max_age: float = None):
+        """缓存超过有效期（默认 ttl）时刷新顶层；其他线程正在刷新时等待并复用其结果"""
+        max_age = self.ttl if max_age is None else max_age
+        if time.time() - self.top_listed_at <= max_age:
+            return
+        with self.refresh_lock:
+            if time.time() - self.top_listed_at > max_age:
+                self.refresh(sftp)
+
+    def is_ready(self, sftp, process_id: str) -> bool:
+        """
+        单个结果文件夹是否已生成：只 stat 该文件夹，不列出整个 output/
+        Args:
+            sftp: SFTP客户端
+            process_id: 处理ID
+        Returns:
+            bool: 是否就绪
+        """
+        with self.lock:
+            if process_id in self.top_entries:
+                return True
+        try:
+            attr = sftp.stat(posixpath.join(self.root, process_id))
+        except FileNotFoundError:
+            return False
+        if not stat.S_ISDIR(attr.st_mode or 0):
+            return False
+        # 记入缓存，之后获取结果时可直接复用文件夹修改时间
+        with self.lock:
+            self.top_entries[process_id] = attr.st_mtime
+        return True
+
+    def filter_existing(self, sftp, process_ids) -> list:
+        """返回远程存在结果文件夹的处理ID（一次顶层列表回答全部查询）"""
+        self.ensure_fresh(sftp)
+        return [process_id for process_id in process_ids if process_id in self.top_entries]
+
+    def list_result_files(self, sftp, process_id: str) -> dict:
+        """
+        列出结果文件夹内的文件，文件夹修改时间未变且缓存未过期时不访问服务器
+        Returns:
+            dict: 文件名 -> (大小, 修改时间)，文件夹不存在时返回空字典
+        """
+        with self.lock:
+            top_mtime = self.top_entries.get(process_id)
+            cached = self.dir_entries.get(process_id)
+        if cached is not None:
+            cached_mtime, listed_at, files = cached
+            if (top_mtime is not None and top_mtime == cached_mtime) or time.time() - listed_at <= self.ttl:
+                return files
+
+        try:
+            attrs = sftp.listdir_attr(posixpath.join(self.root, process_id))
+        except FileNotFoundError:
+            return {}
+        files = {attr.filename: (attr.st_size, attr.st_mtime) for attr in attrs
+                 if not stat.S_ISDIR(attr.st_mode or 0)}
+        with self.lock:
+            self.dir_entries[process_id] = (top_mtime, time.time(), files)
+            self.listing_calls += 1
+        return files
+
+    def file_size(self, sftp, remote_path: str) -> int:
+        """
+        查询 output/<处理ID>/<文件名> 的大小
+        Returns:
+            int: 文件大小，不存在时返回 None
+        """
+        directory, filename = posixpath.split(remote_path)
+        if posixpath.dirname(directory) != self.root:
+            return sftp.stat(remote_path).st_size
+        info = self.list_result_files(sftp, posixpath.basename(directory)).get(filename)
+        return info[0] if info else None
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_remote_state_index(host: str, port: int, root: str) -> RemoteStateIndex:
+    """
+    获取进程内共享的远程状态索引（按主机和目录区分）
+    Args:
+        host: 服务器地址
+        port: 端口
+        root: 远程 output 目录
+    Returns:
+        RemoteStateIndex: 远程状态索引
+    """
+    key = (host, port, root)
+    with _indexes_lock:
+        if key not in _indexes:
+            load_dotenv()
+            _indexes[key] = RemoteStateIndex(root, ttl=float(os.getenv('REMOTE_INDEX_TTL', 5)))
+        return _indexes[key]
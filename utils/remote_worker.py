@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+import weakref
+from utils.file_namer import FileNamer
+
+logger = logging.getLogger(__name__)
+
+# 本地的常驻推理脚本，首次使用时自动部署到远程工作目录
+LOCAL_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'remote', 'inference_worker.py')
+REMOTE_WORKER_SCRIPT_NAME = 'inference_worker.py'
+
+# 已确认与本地内容一致的远程路径（按SFTP客户端记录），避免每个清单都重新读取远程脚本
+_deployed_paths = weakref.WeakKeyDictionary()
+
+class RemoteInferenceWorker:
+    """
+    远程常驻推理进程的客户端。
+    通过一个SSH通道启动 inference_worker.py，之后以JSON行的形式经由stdin发送任务、从stdout读取结果。
+    同一时刻只处理一个任务，多个线程共用时按顺序排队。
+    """
+    def __init__(self, ssh, command: str, startup_timeout: int = 180):
+        self.ssh = ssh
+        self.command = command
+        self.startup_timeout = startup_timeout
+        self.lock = threading.Lock()
+        self.channel = None
+        self.stdin = None
+        self.stdout = None
+        self.remote_pid = None
+
+    def is_running(self) -> bool:
+        """检查远程进程是否仍在运行"""
+        return self.channel is not None and not self.channel.closed and not self.channel.exit_status_ready()
+
+    def start(self):
+        """启动远程常驻进程并等待其就绪"""
+        logger.info(f"启动远程常驻推理进程: {self.command}")
+        stdin, stdout, stderr = self.ssh.exec_command(self.command)
+        self.stdin = stdin
+        self.stdout = stdout
+        self.channel = stdout.channel
+
+        # 持续读取标准错误，避免通道窗口被推理脚本的输出占满
+        threading.Thread(target=self._drain_stderr, args=(stderr,), daemon=True).start()
+
+        ready = self._read_message(lambda message: message.get('ready'), self.startup_timeout)
+        self.remote_pid = ready.get('pid')
+        logger.info(f"远程常驻推理进程已就绪 (pid: {self.remote_pid})")
+
+    def submit(self, script_name: str, file_path: str, process_id: str, timeout: int = 120) -> dict:
+        """
+        提交一个推理任务并等待结果
+        Args:
+            script_name: 推理脚本名称
+            file_path: 远程图片路径
+            process_id: 处理ID
+            timeout: 等待结果的最长时间（秒）
+        Returns:
+            dict: 远程返回的结果
+        """
+        job = {
+            'job_id': FileNamer.generate_unique_string(),
+            'script': script_name,
+            'file_path': file_path,
+            'process_id': process_id
+        }
+        response = self.request(job, timeout)
+        if not response.get('ok'):
+            raise Exception(f"远程推理失败: {response.get('error')}")
+        logger.info(f"远程常驻进程完成推理 {process_id}，耗时 {response.get('elapsed')} 秒")
+        return response
+
+    def submit_manifest(self, manifest: list, timeout: int = 600) -> list:
+        """
+        提交一个清单任务（微批处理），部分图片失败时不抛出异常
+        Args:
+            manifest: [{"script", "file_path", "process_id"}, ...]
+            timeout: 等待结果的最长时间（秒）
+        Returns:
+            list: 每张图片的结果 [{"process_id", "ok", "error"}, ...]
+        """
+        job = {'job_id': FileNamer.generate_unique_string(), 'manifest': manifest}
+        response = self.request(job, timeout)
+        if 'results' not in response:
+            raise Exception(f"远程推理失败: {response.get('error')}")
+        logger.info(f"远程常驻进程完成清单推理 ({len(manifest)} 张)，耗时 {response.get('elapsed')} 秒")
+        return response['results']
+
+    def request(self, job: dict, timeout: int) -> dict:
+        """发送任务并等待对应的响应，多个线程共用时按顺序排队"""
+        with self.lock:
+            if not self.is_running():
+                self.start()
+            try:
+                self.stdin.write(json.dumps(job, ensure_ascii=False) + '\n')
+                self.stdin.flush()
+                return self._read_message(lambda message: message.get('job_id') == job['job_id'], timeout)
+            except Exception:
+                # 通道状态未知，关闭后下次重新启动
+                self.close()
+                raise
+
+    def close(self):
+        """关闭远程常驻进程（关闭stdin后进程会自行退出）"""
+        try:
+            if self.channel is not None and not self.channel.closed:
+                self.channel.shutdown_write()
+                self.channel.close()
+        except Exception as e:
+            logger.error(f"关闭远程常驻推理进程时出错: {str(e)}")
+        finally:
+            self.channel = None
+
+    def _read_message(self, predicate, timeout):
+        """读取stdout直到出现满足条件的JSON消息，跳过非协议输出"""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise Exception("等待远程常驻推理进程响应超时")
+            self.channel.settimeout(remaining)
+            try:
+                line = self.stdout.readline()
+            except socket.timeout:
+                raise Exception("等待远程常驻推理进程响应超时")
+            if not line:
+                raise Exception("远程常驻推理进程已退出")
+            line = line.strip()
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.info(f"远程常驻推理进程输出: {line}")
+                continue
+            if isinstance(message, dict) and predicate(message):
+                return message
+
+    def _drain_stderr(self, stderr):
+        """将远程标准错误转写到日志"""
+        try:
+            for line in stderr:
+                line = line.strip()
+                if line:
+                    logger.debug(f"远程常驻推理进程: {line}")
+        except Exception:
+            pass
+
+def deploy_worker_script(sftp, remote_base_path: str):
+    """
+    若远程工作目录中没有常驻推理脚本或版本不一致，则上传本地的 remote/inference_worker.py
+    Args:
+        sftp: SFTP客户端
+        remote_base_path: 远程工作目录
+    """
+    remote_path = os.path.join(remote_base_path, REMOTE_WORKER_SCRIPT_NAME).replace('\\', '/')
+    deployed = _deployed_paths.setdefault(sftp, set())
+    if remote_path in deployed:
+        return
+
+    with open(LOCAL_WORKER_SCRIPT, 'rb') as f:
+        local_digest = hashlib.sha256(f.read()).hexdigest()
+    try:
+        with sftp.open(remote_path, 'rb') as f:
+            remote_digest = hashlib.sha256(f.read()).hexdigest()
+    except IOError:
+        remote_digest = None
+    if remote_digest != local_digest:
+        sftp.put(LOCAL_WORKER_SCRIPT, remote_path)
+        logger.info(f"已部署常驻推理脚本: {remote_path}")
+    deployed.add(remote_path)
+
+def get_remote_worker(lease, command: str, remote_base_path: str) -> RemoteInferenceWorker:
+    """
+    获取绑定在连接池连接上的常驻推理进程，每条连接只启动一个
+    Args:
+        lease: 连接池借用对象
+        command: 启动常驻进程的命令
+        remote_base_path: 远程工作目录
+    Returns:
+        RemoteInferenceWorker: 常驻推理进程客户端
+    """
+    connection = lease.connection
+    with connection.attachment_lock:
+        worker = connection.attachments.get(('inference_worker', command))
+        if worker is None:
+            deploy_worker_script(lease.sftp, remote_base_path)
+            worker = RemoteInferenceWorker(lease.ssh, command)
+            connection.attachments[('inference_worker', command)] = worker
+    return worker
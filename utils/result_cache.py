@@ -0,0 +1,205 @@
+from dotenv import load_dotenv
+from utils.file_archiver import clone_or_copy
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def compute_file_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的SHA256哈希
+    Args:
+        file_path: 文件路径
+        chunk_size: 分块读取大小
+    Returns:
+        str: 十六进制哈希字符串
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    以图片内容哈希为键的本地结果缓存（异常检测）。
+    键由图片内容哈希、远程推理脚本和模型版本共同决定；缓存总大小超过上限时按LRU淘汰。
+    缓存文件与下载目录中的文件之间只用reflink或复制，不用硬链接，修改下载的结果不会破坏缓存。
+    """
+    ARTIFACTS = ('prediction.png', 'heat_map.png', 'result.json')
+
+    def __init__(self, cache_dir: str = "temp/result_cache", max_bytes: int = 2 * 1024 ** 3, model_version: str = ""):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.model_version = model_version
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> 缓存条目信息，按最近使用排序（最旧的在前）
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.load_index()
+
+    def make_key(self, content_hash: str, script_name: str) -> str:
+        """由内容哈希、推理脚本和模型版本生成缓存键"""
+        raw_key = f"{content_hash}:{script_name}:{self.model_version}"
+        return hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, need_images: bool) -> dict:
+        """
+        查询缓存
+        Args:
+            key: 缓存键
+            need_images: 是否需要预测图和热力图（批处理模式只需要JSON）
+        Returns:
+            dict: 命中时返回缓存条目（含 process_id 和各结果文件路径），未命中返回 None
+        """
+        required = self.ARTIFACTS if need_images else ('result.json',)
+        with self.lock:
+            entry = self.entries.get(key)
+            entry_dir = self.entry_dir(key)
+            if entry and all(os.path.exists(os.path.join(entry_dir, name)) for name in required):
+                self.entries.move_to_end(key)
+                entry['last_access'] = time.time()
+                self.hits += 1
+                hit = True
+            else:
+                self.misses += 1
+                hit = False
+            self.log_stats(hit)
+            if not hit:
+                return None
+            return {
+                'process_id': entry['process_id'],
+                'files': {name: os.path.join(entry_dir, name) for name in entry['files']}
+            }
+
+    def put(self, key: str, process_id: str, files: dict):
+        """
+        写入缓存，已有条目时合并结果文件
+        Args:
+            key: 缓存键
+            process_id: 产生该结果的处理ID
+            files: 结果文件名 -> 本地路径，例如 {'result.json': '...'}
+        """
+        entry_dir = self.entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        stored = []
+        for name, local_path in files.items():
+            if name not in self.ARTIFACTS or not local_path or not os.path.exists(local_path):
+                continue
+            target_path = os.path.join(entry_dir, name)
+            if not os.path.exists(target_path):
+                clone_or_copy(local_path, target_path)
+            stored.append(name)
+        if not stored:
+            return
+
+        with self.lock:
+            entry = self.entries.pop(key, None) or {'process_id': process_id, 'files': [], 'size': 0}
+            self.total_bytes -= entry['size']
+            entry['files'] = sorted(set(entry['files']) | set(stored))
+            entry['size'] = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in entry['files'])
+            entry['last_access'] = time.time()
+            self.entries[key] = entry
+            self.total_bytes += entry['size']
+            self.evict_locked()
+            self.save_index_locked()
+
+    def materialize(self, cached: dict, dest_dir: str) -> dict:
+        """
+        将缓存结果放到下载目录（优先reflink，不支持时复制），已存在的文件不覆盖
+        Args:
+            cached: get() 返回的缓存条目
+            dest_dir: 目标目录
+        Returns:
+            dict: 结果文件名 -> 目标路径
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        result = {}
+        for name, cached_path in cached['files'].items():
+            dest_path = os.path.join(dest_dir, name)
+            if not os.path.exists(dest_path):
+                clone_or_copy(cached_path, dest_path)
+            result[name] = dest_path
+        return result
+
+    def entry_dir(self, key: str) -> str:
+        """缓存条目所在目录"""
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def evict_locked(self):
+        """超过容量上限时淘汰最久未使用的条目"""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry['size']
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            logger.info(f"结果缓存淘汰条目: {key} ({entry['size']} 字节)")
+
+    def log_stats(self, hit: bool):
+        """在日志中输出命中/未命中计数"""
+        total = self.hits + self.misses
+        logger.info(f"结果缓存{'命中' if hit else '未命中'} (命中 {self.hits} / 未命中 {self.misses}, 命中率 {self.hits * 100 / total:.1f}%)")
+
+    def load_index(self):
+        """加载缓存索引"""
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index_data = json.load(f)
+                entries = sorted(index_data.get('entries', {}).items(), key=lambda item: item[1].get('last_access', 0))
+                for key, entry in entries:
+                    if os.path.isdir(self.entry_dir(key)):
+                        self.entries[key] = entry
+                        self.total_bytes += entry.get('size', 0)
+                logger.info(f"加载结果缓存索引: {len(self.entries)} 个条目, {self.total_bytes} 字节")
+        except Exception as e:
+            logger.error(f"加载结果缓存索引失败: {str(e)}")
+
+    def save_index_locked(self):
+        """保存缓存索引（先写临时文件再替换）"""
+        try:
+            tmp_file = self.index_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            logger.error(f"保存结果缓存索引失败: {str(e)}")
+
+_cache = None
+_cache_checked = False
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """
+    获取进程内共享的结果缓存，未启用时返回 None。
+    缓存键包含模型版本，未配置 ANOMALY_MODEL_VERSION 时无法在服务器更新模型后使旧结果失效，因此不启用缓存
+    Returns:
+        ResultCache: 结果缓存
+    """
+    global _cache, _cache_checked
+    with _cache_lock:
+        if not _cache_checked:
+            _cache_checked = True
+            load_dotenv()
+            if os.getenv('RESULT_CACHE_ENABLED', 'false').lower() not in ('1', 'true', 'yes'):
+                return None
+            model_version = os.getenv('ANOMALY_MODEL_VERSION', '').strip()
+            if not model_version:
+                logger.warning("已设置 RESULT_CACHE_ENABLED 但未配置 ANOMALY_MODEL_VERSION，结果缓存不启用")
+                return None
+            _cache = ResultCache(
+                cache_dir=os.getenv('RESULT_CACHE_DIR', 'temp/result_cache'),
+                max_bytes=int(os.getenv('RESULT_CACHE_MAX_MB', 2048)) * 1024 * 1024,
+                model_version=model_version,
+            )
+        return _cache
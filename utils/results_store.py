@@ -0,0 +1,299 @@
+from dotenv import load_dotenv
+import os
+import sys
+import json
+import sqlite3
+import logging
+import datetime
+import threading
+
+from utils.result_cache import compute_file_hash
+from utils.checkpoint_journal import read_checkpoint
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    process_id TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    image_dir TEXT,
+    image_name TEXT,
+    content_hash TEXT,
+    anomaly_level TEXT,
+    analog_voltage REAL,
+    source TEXT,
+    processed_at TEXT,
+    upload_seconds REAL,
+    execute_seconds REAL,
+    fetch_seconds REAL,
+    total_seconds REAL,
+    prediction_path TEXT,
+    heat_map_path TEXT,
+    json_path TEXT,
+    result_json TEXT,
+    UNIQUE (process_id, image_path)
+);
+CREATE INDEX IF NOT EXISTS idx_results_processed_at ON results (processed_at);
+CREATE INDEX IF NOT EXISTS idx_results_level_time ON results (anomaly_level, processed_at);
+CREATE INDEX IF NOT EXISTS idx_results_image_path ON results (image_path);
+CREATE INDEX IF NOT EXISTS idx_results_dir_time ON results (image_dir, processed_at);
+CREATE INDEX IF NOT EXISTS idx_results_content_hash ON results (content_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ('process_id', 'image_path', 'image_dir', 'image_name', 'content_hash', 'anomaly_level', 'analog_voltage',
+           'source', 'processed_at', 'upload_seconds', 'execute_seconds', 'fetch_seconds', 'total_seconds',
+           'prediction_path', 'heat_map_path', 'json_path', 'result_json')
+
+def to_float(value):
+    """模拟电压等数值字段转为浮点数，无法转换时返回 None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class ResultsStore:
+    """
+    所有已处理图片的结果库（嵌入式 SQLite）。
+    每得到一个结果写入一行：图片路径、内容哈希、处理ID、异常级别、模拟电压、各阶段耗时和本地结果文件路径，
+    并在时间、异常级别和路径上建立索引，按条件查询时不再需要逐个打开 result.json 和检查点文件。
+    """
+    def __init__(self, db_path: str = "temp/results.db"):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        # 多个处理线程共用一个连接，由锁串行化
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def record(self, image_path: str, process_id: str, json_path: str, prediction_path: str = '',
+               heat_map_path: str = '', content_hash: str = None, source: str = '', timings: dict = None,
+               processed_at: str = None):
+        """
+        记录一张图片的结果
+        Args:
+            image_path: 本地图片路径
+            process_id: 处理ID
+            json_path: 本地 result.json 路径
+            prediction_path: 本地预测图路径（批处理模式下可能为空）
+            heat_map_path: 本地热力图路径（批处理模式下可能为空）
+            content_hash: 图片内容哈希，未提供时计算
+            source: 结果来源（single / online_batch / import）
+            timings: 各阶段耗时（秒），键为 upload / execute / fetch / total
+            processed_at: 处理时间（ISO格式），默认为当前时间
+        """
+        result_data = {}
+        if json_path and os.path.exists(json_path):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                result_data = json.load(f)
+        if content_hash is None and os.path.exists(image_path):
+            content_hash = compute_file_hash(image_path)
+        timings = timings or {}
+        row = {
+            'process_id': process_id,
+            'image_path': os.path.abspath(image_path),
+            'image_dir': os.path.dirname(os.path.abspath(image_path)),
+            'image_name': os.path.basename(image_path),
+            'content_hash': content_hash,
+            'anomaly_level': result_data.get('anomaly_level'),
+            'analog_voltage': to_float(result_data.get('analog_voltage')),
+            'source': source,
+            'processed_at': processed_at or datetime.datetime.now().isoformat(),
+            'upload_seconds': timings.get('upload'),
+            'execute_seconds': timings.get('execute'),
+            'fetch_seconds': timings.get('fetch'),
+            'total_seconds': timings.get('total'),
+            'prediction_path': prediction_path or None,
+            'heat_map_path': heat_map_path or None,
+            'json_path': json_path or None,
+            'result_json': json.dumps(result_data, ensure_ascii=False) if result_data else None,
+        }
+        self.insert_rows([row])
+
+    def insert_rows(self, rows: list):
+        """批量写入（相同处理ID和图片路径的记录被替换）"""
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        with self.lock:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                [tuple(row.get(column) for column in COLUMNS) for row in rows])
+            self.conn.commit()
+
+    def query(self, anomaly_levels: list = None, since: str = None, until: str = None,
+              image_dir: str = None, limit: int = None) -> list:
+        """
+        按条件查询结果
+        Args:
+            anomaly_levels: 异常级别列表，例如 ['很可能异常']
+            since: 起始时间（ISO格式，含）
+            until: 结束时间（ISO格式，不含）
+            image_dir: 图片所在文件夹（例如某条产线的监控文件夹）
+            limit: 最多返回条数
+        Returns:
+            list: 按处理时间排序的 sqlite3.Row 列表
+        """
+        conditions, params = [], []
+        if anomaly_levels:
+            conditions.append(f"anomaly_level IN ({', '.join('?' for _ in anomaly_levels)})")
+            params.extend(anomaly_levels)
+        if since:
+            conditions.append("processed_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("processed_at < ?")
+            params.append(until)
+        if image_dir:
+            conditions.append("image_dir = ?")
+            params.append(os.path.abspath(image_dir))
+        sql = "SELECT * FROM results"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY processed_at"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def get_meta(self, key: str) -> str:
+        """读取元数据"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def set_meta(self, key: str, value: str):
+        """写入元数据"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.conn.commit()
+
+    def import_existing(self, download_dir: str = "download/anomaly_detection",
+                        checkpoint_dir: str = "temp/batch_processing_checkpoint",
+                        anomalies_dir: str = "temp/consecutive_anomalies", force: bool = False) -> int:
+        """
+        一次性导入已有的结果目录、检查点和连续异常记录
+        Args:
+            download_dir: 结果下载目录（<处理ID>/result.json）
+            checkpoint_dir: 检查点目录
+            anomalies_dir: 连续异常记录目录
+            force: 已导入过时是否重新导入
+        Returns:
+            int: 导入的记录数
+        """
+        if not force and self.get_meta('imported_at'):
+            logger.info("已有结果已导入过，跳过")
+            return 0
+
+        # 检查点和连续异常记录提供 处理ID -> (图片路径, 处理时间)
+        image_info = {}
+        for directory in (checkpoint_dir, anomalies_dir):
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith('.json'):
+                    continue
+                try:
+                    for item in read_checkpoint(os.path.join(directory, filename)).get('processed_images', []):
+                        process_id = item.get('process_id')
+                        if process_id and process_id != 'unknown':
+                            image_info[process_id] = (item.get('file_path'), item.get('processed_time'))
+                except Exception as e:
+                    logger.warning(f"读取记录失败 {filename}: {str(e)}")
+
+        imported = 0
+        rows = []
+        if os.path.isdir(download_dir):
+            with os.scandir(download_dir) as iterator:
+                for entry in iterator:
+                    json_path = os.path.join(entry.path, 'result.json')
+                    if not entry.is_dir() or not os.path.exists(json_path):
+                        continue
+                    try:
+                        rows.append(self.build_import_row(entry.name, entry.path, json_path, image_info))
+                    except Exception as e:
+                        logger.warning(f"导入结果失败 {entry.name}: {str(e)}")
+                    if len(rows) >= 500:
+                        self.insert_rows(rows)
+                        imported += len(rows)
+                        logger.info(f"已导入 {imported} 条结果")
+                        rows = []
+        if rows:
+            self.insert_rows(rows)
+            imported += len(rows)
+        self.set_meta('imported_at', datetime.datetime.now().isoformat())
+        logger.info(f"已有结果导入完成，共 {imported} 条")
+        return imported
+
+    def build_import_row(self, process_id: str, result_dir: str, json_path: str, image_info: dict) -> dict:
+        """由结果目录生成一行导入记录；检查点中没有该处理ID时使用结果目录中的原图"""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            result_data = json.load(f)
+        image_path, processed_at = image_info.get(process_id, (None, None))
+        local_image = None
+        for filename in os.listdir(result_dir):
+            if filename not in ('prediction.png', 'heat_map.png') and \
+                    os.path.splitext(filename.lower())[1] in ('.png', '.jpg', '.jpeg'):
+                local_image = os.path.join(result_dir, filename)
+                break
+        image_path = image_path or local_image or result_dir
+        if not processed_at or processed_at == 'unknown':
+            processed_at = datetime.datetime.fromtimestamp(os.path.getmtime(json_path)).isoformat()
+        prediction_path = os.path.join(result_dir, 'prediction.png')
+        heat_map_path = os.path.join(result_dir, 'heat_map.png')
+        return {
+            'process_id': process_id,
+            'image_path': os.path.abspath(image_path),
+            'image_dir': os.path.dirname(os.path.abspath(image_path)),
+            'image_name': os.path.basename(image_path),
+            'content_hash': compute_file_hash(local_image) if local_image else None,
+            'anomaly_level': result_data.get('anomaly_level'),
+            'analog_voltage': to_float(result_data.get('analog_voltage')),
+            'source': 'import',
+            'processed_at': processed_at,
+            'prediction_path': prediction_path if os.path.exists(prediction_path) else None,
+            'heat_map_path': heat_map_path if os.path.exists(heat_map_path) else None,
+            'json_path': json_path,
+            'result_json': json.dumps(result_data, ensure_ascii=False),
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+_results_store = None
+_results_store_lock = threading.Lock()
+
+def get_results_store() -> ResultsStore:
+    """
+    获取进程内共享的结果库，未启用时返回 None
+    Returns:
+        ResultsStore: 结果库
+    """
+    global _results_store
+    with _results_store_lock:
+        if _results_store is None:
+            load_dotenv()
+            if os.getenv('RESULTS_STORE_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+                return None
+            _results_store = ResultsStore(os.getenv('RESULTS_STORE_PATH', 'temp/results.db'))
+        return _results_store
+
+if __name__ == "__main__":
+    # 一次性导入已有结果：python -m utils.results_store [--force]
+    logging.basicConfig(level=logging.INFO)
+    store = get_results_store()
+    if store is None:
+        print("结果库未启用（RESULTS_STORE_ENABLED=false）")
+        sys.exit(1)
+    count = store.import_existing(force='--force' in sys.argv)
+    print(f"导入 {count} 条结果到 {store.db_path}")
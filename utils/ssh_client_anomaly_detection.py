@@ -1,7 +1,15 @@
 from utils.file_namer import FileNamer
+from utils.ssh_connection_pool import get_connection_pool
+from utils.transfer_profiles import get_transfer_profile
+from utils.image_transform import get_upload_transform
+from utils.tiled_inference import get_tiled_inference
+from utils.remote_state_index import get_remote_state_index
+from utils.remote_worker import get_remote_worker, deploy_worker_script, REMOTE_WORKER_SCRIPT_NAME
+from utils.result_cache import get_result_cache, compute_file_hash
 from dotenv import load_dotenv
 import os
-import paramiko
+import json
+import posixpath
 import time
 import logging
 import shutil
@@ -24,24 +32,26 @@ class SSHClient:
         self.conda_env_name = os.getenv('CONDA_ENV_NAME_ANOMALY_DETECTION')
         self.local_download_dir = "download/anomaly_detection"
         self.batch_process = batch_process
+        self.transfer_profile = get_transfer_profile()  # SFTP传输配置（SSH_TRANSFER_PROFILE）
+        self.upload_transform = get_upload_transform()  # 上传前无损重新编码/缩放（UPLOAD_TRANSFORM_ENABLED）
+        self.tiled_inference = get_tiled_inference()  # 超长图片分块推理（ANOMALY_TILED_MODE）
+        # 常驻推理进程模式：每条连接启动一个远程进程，通过stdin/stdout流式提交任务
+        self.use_persistent_worker = os.getenv('ANOMALY_PERSISTENT_WORKER', 'false').lower() in ('1', 'true', 'yes')
+        self.worker_command = os.getenv('ANOMALY_WORKER_COMMAND') or \
+            f"bash -c 'cd {self.remote_base_path} && {self.conda_executable} run --no-capture-output -n {self.conda_env_name} python3 -u inference_worker.py'"
+        # 本地结果缓存：lookup_cached_result 命中前记录缓存键，下载结果后写入缓存
+        self.result_cache = get_result_cache()
+        self.cache_key = None
+        self.content_hash = None  # 图片内容哈希（查询缓存时计算，写入结果库时复用）
+        self.gpu_id = None  # 在线批处理任务槽位绑定的GPU（CUDA_VISIBLE_DEVICES），为 None 时不指定
 
     def connect(self):
-        """建立SSH连接"""
+        """从连接池借用SSH连接，并获得本线程专属的SFTP通道"""
         try:
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # 添加超时设置
-            self.ssh.connect(
-                self.host,
-                self.port,
-                self.username,
-                self.password,
-                timeout=30,  # 连接超时30秒
-                banner_timeout=30,  # 横幅超时30秒
-                auth_timeout=30     # 认证超时30秒
-            )
-            self.sftp = self.ssh.open_sftp()
+            self.lease = get_connection_pool().acquire(self.host, self.port, self.username, self.password,
+                                                      profile=self.transfer_profile)
+            self.ssh = self.lease.ssh
+            self.sftp = self.lease.sftp
             logger.info("成功连接到服务器")
         except Exception as e:
             logger.error(f"连接服务器失败: {str(e)}")
@@ -49,26 +59,22 @@ class SSHClient:
             
     
     def close(self):
-        """关闭SSH连接"""
+        """将SSH连接归还连接池（连接保持打开以供复用）"""
         try:
-            if hasattr(self, 'sftp') and self.sftp:
-                self.sftp.close()
-                logger.info("SFTP连接已关闭")
-                self.sftp = None  # 标记为已关闭
+            if getattr(self, 'lease', None):
+                self.lease.release()
+                logger.info("SSH连接已归还连接池")
         except Exception as e:
-            logger.error(f"关闭SFTP连接时出错: {str(e)}")
-        
-        try:
-            if hasattr(self, 'ssh') and self.ssh:
-                self.ssh.close()
-                logger.info("SSH连接已关闭")
-                self.ssh = None  # 标记为已关闭
-        except Exception as e:
-            logger.error(f"关闭SSH连接时出错: {str(e)}")
+            logger.error(f"归还SSH连接时出错: {str(e)}")
+        finally:
+            self.lease = None
+            self.sftp = None  # 标记为已关闭
+            self.ssh = None
 
     def transfer_single_image_file(self, file_path: str) -> str:
         """
         将指定的单张图片文件传输到远程服务器，并以 process_id.{文件后缀} 进行保存。
+        启用上传预处理时，先在调用线程中重新编码/缩放，上传的是处理后的文件。
 
         Args:
             file_path (str): 本地图片文件的完整路径。
@@ -79,8 +85,12 @@ class SSHClient:
             logging.error(f"本地文件路径 {file_path} 无效或不是一个文件。")
             return None
 
+        # 上传前预处理（未启用时返回原路径）
+        image_type = self.image_type_judge(file_path) if self.upload_transform.enabled else None
+        upload_path = self.upload_transform.prepare(file_path, image_type)
+
         # 获取文件的后缀名
-        file_extension = os.path.splitext(file_path)[-1]
+        file_extension = os.path.splitext(upload_path)[-1]
         
         # 拼接远程文件的完整路径
         # 使用 os.path.join 确保路径拼接的正确性，然后替换为URL风格的斜杠'/'
@@ -90,7 +100,7 @@ class SSHClient:
 
         try:
             # 执行上传操作
-            self.sftp.put(file_path, remote_file_path)
+            self.transfer_profile.put(self.sftp, upload_path, remote_file_path)
             logging.info(f"成功传输文件: {file_path} -> {remote_file_path}")
             
             return remote_file_path
@@ -99,6 +109,8 @@ class SSHClient:
             # 如果在传输过程中发生任何其他错误（如连接断开、权限不足等）
             logging.error(f"文件传输过程中发生错误: {e}")
             return None
+        finally:
+            self.upload_transform.cleanup(file_path, upload_path)
         
     def download_result(self, image_path: str) -> tuple[str, str, str]:
         """
@@ -153,12 +165,12 @@ class SSHClient:
 
             # 下载结果文件
             if not self.batch_process:
-                self.sftp.get(remotepath=remote_result_pre_image, localpath=local_result_pre_image)
-                self.sftp.get(remotepath=remote_result_heat_map, localpath=local_result_heat_map)
+                self.transfer_profile.get(self.sftp, remote_result_pre_image, local_result_pre_image)
+                self.transfer_profile.get(self.sftp, remote_result_heat_map, local_result_heat_map)
                 logger.info(f"成功下载结果文件: {local_result_pre_image}")
                 logger.info(f"成功下载结果文件: {local_result_heat_map}") # 修复：原代码这里没有判断
 
-            self.sftp.get(remotepath=remote_result_json, localpath=local_result_json)
+            self.transfer_profile.get(self.sftp, remote_result_json, local_result_json)
             logger.info(f"成功下载结果文件: {local_result_json}")
 
         except Exception as e:
@@ -174,9 +186,65 @@ class SSHClient:
             logger.error(f"本地文件路径: {local_result_json}")
             raise e
 
+        self.store_cached_result(local_result_pre_image, local_result_heat_map, local_result_json)
+
         # 无论是否批处理，都返回完整的路径元组,如果是批处理模式，图片路径为空字符串
         return local_result_pre_image, local_result_heat_map, local_result_json
 
+    def lookup_cached_result(self, image_path: str, script_name: str) -> tuple[str, str, str]:
+        """
+        按图片内容哈希查询本地结果缓存，命中时将结果放到下载目录并沿用产生该结果的处理ID
+        Args:
+            image_path: 本地图片路径
+            script_name: 推理脚本名称
+        Returns:
+            tuple[str, str, str]: 命中时返回 (本地预测图路径, 本地热力图路径, 本地JSON文件路径)，未命中返回 None
+        """
+        if self.result_cache is None:
+            return None
+        try:
+            self.content_hash = compute_file_hash(image_path)
+            self.cache_key = self.result_cache.make_key(self.content_hash, script_name)
+            cached = self.result_cache.get(self.cache_key, need_images=not self.batch_process)
+            if cached is None:
+                return None
+
+            # 沿用原处理ID，后续按处理ID下载预测图/热力图时仍能找到远程结果
+            self.process_id = cached['process_id']
+            self.remote_result_dir_path = os.path.join(self.remote_base_path, 'output', self.process_id).replace('\\', '/')
+            local_result_dir = os.path.join(self.local_download_dir, self.process_id)
+            files = self.result_cache.materialize(cached, local_result_dir)
+            image_filename = os.path.basename(image_path)
+            if not os.path.exists(os.path.join(local_result_dir, image_filename)):
+                shutil.copy(image_path, os.path.join(local_result_dir, image_filename))
+            logger.info(f"命中结果缓存，跳过远程推理: {image_path} -> {local_result_dir}")
+
+            if self.batch_process:
+                return '', '', files['result.json']
+            return files['prediction.png'], files['heat_map.png'], files['result.json']
+        except Exception as e:
+            logger.error(f"查询结果缓存失败: {str(e)}")
+            return None
+
+    def store_cached_result(self, local_result_pre_image: str, local_result_heat_map: str, local_result_json: str):
+        """
+        将下载到的结果写入本地结果缓存（需先调用 lookup_cached_result 得到缓存键）
+        Args:
+            local_result_pre_image: 本地预测图路径，批处理模式下为空字符串
+            local_result_heat_map: 本地热力图路径，批处理模式下为空字符串
+            local_result_json: 本地JSON文件路径
+        """
+        if self.result_cache is None or self.cache_key is None:
+            return
+        try:
+            self.result_cache.put(self.cache_key, self.process_id, {
+                'prediction.png': local_result_pre_image,
+                'heat_map.png': local_result_heat_map,
+                'result.json': local_result_json
+            })
+        except Exception as e:
+            logger.error(f"写入结果缓存失败: {str(e)}")
+
     def process_images(self, image_path: str)-> tuple[str, str]:
         """
         处理图片
@@ -185,6 +253,18 @@ class SSHClient:
         Returns:
             tuple[str, str, str]: (本地预测图路径, 本地热力图路径)
         """
+        # 判断图片类型并选择相应的脚本
+        script_name = self.select_script(image_path)
+
+        # 相同内容的图片已处理过时直接返回缓存结果，不连接服务器
+        cached_result = self.lookup_cached_result(image_path, script_name)
+        if cached_result is not None:
+            return cached_result
+
+        # 超长图片分块并行推理
+        if self.use_tiled_mode(script_name):
+            return self.process_tiled(image_path)
+
         try:
             # 连接服务器
             self.connect()
@@ -192,35 +272,8 @@ class SSHClient:
             # 上传图片
             remote_target_dir = self.transfer_single_image_file(image_path)
 
-            # 判断图片类型并选择相应的脚本
-            image_type = self.image_type_judge(image_path)
-            if image_type == "square":
-                script_name = "api.py"
-            elif image_type == "very long":
-                script_name = "api_v2_http_batch.py"
-            else:
-                script_name = "api_v3_http.py"
-            logger.info(f"图片类型判断: {image_type}, 使用脚本: {script_name}")
-
-            # 执行Python命令,首先进入工作目录并激活conda环境
-            cmd = f'''bash -c 'cd {self.remote_base_path} && \
-{self.conda_executable} run -n {self.conda_env_name} python3 {script_name} --file_path {remote_target_dir} --process_id {self.process_id}
-' '''
-            stdin, stdout, stderr = self.ssh.exec_command(cmd)
-            
-            # 获取输出
-            result = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
-            
-            logger.info(f"远程处理命令输出: {result}")
-            if error:
-                logger.warning(f"远程处理命令异常: {error}")
-            
-            # 检查命令执行状态
-            exit_status = stdout.channel.recv_exit_status()
-            if exit_status != 0:
-                logger.error(f"远程处理命令执行失败，退出状态: {exit_status}")
-                raise Exception(f"远程处理失败，退出状态: {exit_status}")
+            # 执行远程推理
+            self.run_remote_script(script_name, remote_target_dir)
                 
             # 等待处理完成
             if not self.wait_for_processing_complete():
@@ -237,6 +290,216 @@ class SSHClient:
         finally:
             self.close()
 
+    def use_tiled_mode(self, script_name: str) -> bool:
+        """是否对该图片使用分块推理（仅超长图片）"""
+        return self.tiled_inference is not None and script_name == "api_v2_http_batch.py"
+
+    def process_tiled(self, image_path: str) -> tuple[str, str, str]:
+        """
+        分块处理超长图片：各分块由独立的客户端经连接池并行推理，结果拼接后写入本处理ID的结果目录
+        Args:
+            image_path: 本地图片路径
+        Returns:
+            tuple[str, str, str]: (本地预测图路径, 本地热力图路径, 本地JSON文件路径)，批处理模式下图片路径为空字符串
+        """
+        local_result_dir = os.path.join(self.local_download_dir, self.process_id)
+        local_result_pre_image, local_result_heat_map, local_result_json = \
+            self.tiled_inference.process(image_path, self.process_id, local_result_dir, SSHClient)
+        self.store_cached_result(local_result_pre_image, local_result_heat_map, local_result_json)
+        if self.batch_process:
+            return '', '', local_result_json
+        return local_result_pre_image, local_result_heat_map, local_result_json
+
+    def process_tile(self, tile_path: str, script_name: str) -> tuple[str, str, str]:
+        """
+        处理一个分块：上传、远程推理并下载预测图、热力图和JSON
+        Args:
+            tile_path: 本地分块图片路径
+            script_name: 推理脚本名称
+        Returns:
+            tuple[str, str, str]: (本地预测图路径, 本地热力图路径, 本地JSON文件路径)
+        """
+        self.connect()
+        try:
+            remote_target_dir = self.transfer_single_image_file(tile_path)
+            if remote_target_dir is None:
+                raise Exception(f"分块上传失败: {tile_path}")
+            self.run_remote_script(script_name, remote_target_dir)
+            if not self.wait_for_processing_complete():
+                raise Exception("处理超时")
+            return self.download_result(image_path=tile_path)
+        finally:
+            self.close()
+
+    def upload_image(self, image_path: str) -> str:
+        """
+        上传阶段：借用连接上传图片后立即归还，供流水线各阶段独立调度
+        Args:
+            image_path: 本地图片路径
+        Returns:
+            str: 远程图片路径
+        """
+        self.connect()
+        try:
+            remote_target_dir = self.transfer_single_image_file(image_path)
+            if remote_target_dir is None:
+                raise Exception(f"图片上传失败: {image_path}")
+            return remote_target_dir
+        finally:
+            self.close()
+
+    def execute_remote(self, image_path: str, remote_target_dir: str):
+        """
+        远程执行阶段：选择推理脚本并在远程执行
+        Args:
+            image_path: 本地图片路径
+            remote_target_dir: 远程图片路径
+        """
+        self.connect()
+        try:
+            script_name = self.select_script(image_path)
+            self.run_remote_script(script_name, remote_target_dir)
+        finally:
+            self.close()
+
+    def execute_manifest(self, manifest: list) -> dict:
+        """
+        微批处理远程执行阶段：一次远程调用处理清单中的多张图片
+        Args:
+            manifest: [{"script": 推理脚本, "file_path": 远程图片路径, "process_id": 处理ID}, ...]
+        Returns:
+            dict: process_id -> 错误信息，成功的图片为空字符串
+        """
+        self.connect()
+        try:
+            results = self.run_remote_manifest(manifest)
+        finally:
+            self.close()
+        return {result['process_id']: '' if result.get('ok') else (result.get('error') or "远程推理失败")
+                for result in results}
+
+    def fetch_result(self, image_path: str) -> tuple[str, str, str]:
+        """
+        结果获取阶段：等待远程结果生成并下载
+        Args:
+            image_path: 本地图片路径
+        Returns:
+            tuple[str, str, str]: (本地预测图路径, 本地热力图路径, 本地JSON文件路径)
+        """
+        self.connect()
+        try:
+            if not self.wait_for_processing_complete():
+                raise Exception("处理超时")
+            return self.download_result(image_path=image_path)
+        finally:
+            self.close()
+
+    def select_script(self, image_path: str) -> str:
+        """
+        根据图片类型选择远程推理脚本
+        Args:
+            image_path: 本地图片路径
+        Returns:
+            str: 推理脚本名称
+        """
+        image_type = self.image_type_judge(image_path)
+        if image_type == "square":
+            script_name = "api.py"
+        elif image_type == "very long":
+            script_name = "api_v2_http_batch.py"
+        else:
+            script_name = "api_v3_http.py"
+        logger.info(f"图片类型判断: {image_type}, 使用脚本: {script_name}")
+        return script_name
+
+    def run_remote_script(self, script_name: str, remote_target_dir: str):
+        """
+        在远程服务器上执行推理脚本，常驻进程模式下提交给该连接上的常驻进程
+        Args:
+            script_name: 推理脚本名称
+            remote_target_dir: 远程图片路径
+        """
+        if self.use_persistent_worker:
+            worker = get_remote_worker(self.lease, self.with_gpu(self.worker_command), self.remote_base_path)
+            worker.submit(script_name, remote_target_dir, self.process_id)
+            return
+
+        # 执行Python命令,首先进入工作目录并激活conda环境
+        cmd = self.with_gpu(f'''bash -c 'cd {self.remote_base_path} && \
+{self.conda_executable} run -n {self.conda_env_name} python3 {script_name} --file_path {remote_target_dir} --process_id {self.process_id}
+' ''')
+        stdin, stdout, stderr = self.ssh.exec_command(cmd)
+        
+        # 获取输出
+        result = stdout.read().decode().strip()
+        error = stderr.read().decode().strip()
+        
+        logger.info(f"远程处理命令输出: {result}")
+        if error:
+            logger.warning(f"远程处理命令异常: {error}")
+        
+        # 检查命令执行状态
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            logger.error(f"远程处理命令执行失败，退出状态: {exit_status}")
+            raise Exception(f"远程处理失败，退出状态: {exit_status}")
+
+    def with_gpu(self, command: str) -> str:
+        """绑定了GPU时在远程命令前设置 CUDA_VISIBLE_DEVICES（不同GPU的常驻进程按命令区分）"""
+        if self.gpu_id is None:
+            return command
+        return f"CUDA_VISIBLE_DEVICES={self.gpu_id} {command}"
+
+    def run_remote_manifest(self, manifest: list) -> list:
+        """
+        以一次远程调用执行清单：常驻进程模式下直接提交清单任务，
+        否则上传清单文件并以 inference_worker.py --manifest 单次执行
+        Args:
+            manifest: [{"script", "file_path", "process_id"}, ...]
+        Returns:
+            list: 每张图片的结果 [{"process_id", "ok", "error"}, ...]
+        """
+        if self.use_persistent_worker:
+            worker = get_remote_worker(self.lease, self.with_gpu(self.worker_command), self.remote_base_path)
+            return worker.submit_manifest(manifest)
+
+        deploy_worker_script(self.sftp, self.remote_base_path)
+        remote_manifest_path = os.path.join(self.remote_image_path, f"manifest_{self.process_id}.json").replace('\\', '/')
+        with self.sftp.open(remote_manifest_path, 'w') as f:
+            f.write(json.dumps(manifest, ensure_ascii=False))
+        logger.info(f"已上传推理清单 ({len(manifest)} 张): {remote_manifest_path}")
+
+        try:
+            cmd = self.with_gpu(f'''bash -c 'cd {self.remote_base_path} && \
+{self.conda_executable} run -n {self.conda_env_name} python3 {REMOTE_WORKER_SCRIPT_NAME} --manifest {remote_manifest_path}
+' ''')
+            stdin, stdout, stderr = self.ssh.exec_command(cmd)
+            output = stdout.read().decode().strip()
+            error = stderr.read().decode().strip()
+            if error:
+                logger.warning(f"远程清单推理异常输出: {error[-2000:]}")
+
+            exit_status = stdout.channel.recv_exit_status()
+            if exit_status != 0:
+                logger.error(f"远程清单推理执行失败，退出状态: {exit_status}")
+                raise Exception(f"远程处理失败，退出状态: {exit_status}")
+
+            # 结果在最后一行JSON中，之前可能混有推理脚本的输出
+            for line in reversed(output.splitlines()):
+                try:
+                    response = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(response, dict) and 'results' in response:
+                    logger.info(f"远程清单推理完成 ({len(manifest)} 张)，耗时 {response.get('elapsed')} 秒")
+                    return response['results']
+            raise Exception("远程清单推理没有返回结果")
+        finally:
+            try:
+                self.sftp.remove(remote_manifest_path)
+            except IOError:
+                pass
+
     def wait_for_processing_complete(self,max_wait_time: int = 60) -> bool:
         """
         等待远程处理完成
@@ -246,6 +509,7 @@ class SSHClient:
             bool: 是否处理完成
         """
         start_time = time.time()
+        state_index = get_remote_state_index(self.host, self.port, posixpath.dirname(self.remote_result_dir_path))
         
         while True:
             try:
@@ -254,9 +518,8 @@ class SSHClient:
                     logger.error("等待处理完成超时")
                     return False
                     
-                # 检查远程文件是否存在
-                stdin, stdout, stderr = self.ssh.exec_command(f"ls {self.remote_result_dir_path}")
-                if stderr.read().decode().strip():  # 如果有错误输出，说明文件不存在
+                # 只stat本图片的结果文件夹（不列出整个output/），就绪后记入共享的远程状态索引
+                if not state_index.is_ready(self.sftp, self.process_id):
                     logger.info("正在等待处理完成...")
                     time.sleep(3)  # 等待3秒后重试
                     continue
@@ -322,6 +585,8 @@ class SSHBatchDownload(SSHClient):
         self.conda_executable = os.getenv('CONDA_EXECUTABLE_ANOMALY_DETECTION')
         self.conda_env_name = os.getenv('CONDA_ENV_NAME_ANOMALY_DETECTION')
         self.local_download_dir = "download/anomaly_detection"
+        # 批量下载可单独使用大窗口、高预读的传输配置，未设置时与其他传输相同
+        self.transfer_profile = get_transfer_profile(os.getenv('SSH_TRANSFER_PROFILE_BATCH_DOWNLOAD'))
 
     def download_results_batch(self,process_ids_list):
         """
@@ -340,10 +605,10 @@ class SSHBatchDownload(SSHClient):
             # 日志输出
             logger.info(f"准备下载文件: {remote_result_pre_image} -> {local_result_pre_image}")
             logger.info(f"准备下载文件: {remote_result_heat_map} -> {local_result_heat_map}")
-            self.sftp.get(remotepath=remote_result_pre_image, localpath=local_result_pre_image)
+            self.transfer_profile.get(self.sftp, remote_result_pre_image, local_result_pre_image)
             try:
                 logger.info(f"下载进度: {i+1}/{len(process_ids_list)}")
-                self.sftp.get(remotepath=remote_result_heat_map, localpath=local_result_heat_map)
+                self.transfer_profile.get(self.sftp, remote_result_heat_map, local_result_heat_map)
                 logger.info(f"成功下载结果文件: {local_result_pre_image}")
                 logger.info(f"成功下载结果文件: {local_result_heat_map}")
             except Exception as e:
@@ -378,12 +643,16 @@ class SSHBatchDownload(SSHClient):
         # 远程结果文件路径
         remote_result_pre_image = os.path.join(self.remote_result_dir_path,process_id,f"{process_id}.png").replace('\\', '/')
         remote_result_heat_map = os.path.join(self.remote_result_dir_path,process_id,f"{process_id}_heatmap.png").replace('\\', '/')
+        # 结果缓存命中时文件已在本地，无需重复下载
+        if os.path.exists(local_result_pre_image) and os.path.exists(local_result_heat_map):
+            logger.info(f"预测图和热力图已存在于本地: {local_result_dir}")
+            return local_result_pre_image, local_result_heat_map
         # 日志输出
         logger.info(f"准备下载文件: {remote_result_pre_image} -> {local_result_pre_image}")
         logger.info(f"准备下载文件: {remote_result_heat_map} -> {local_result_heat_map}")
-        self.sftp.get(remotepath=remote_result_pre_image, localpath=local_result_pre_image)
+        self.transfer_profile.get(self.sftp, remote_result_pre_image, local_result_pre_image)
         try:
-            self.sftp.get(remotepath=remote_result_heat_map, localpath=local_result_heat_map)
+            self.transfer_profile.get(self.sftp, remote_result_heat_map, local_result_heat_map)
             logger.info(f"成功下载结果文件: {local_result_pre_image}")
             logger.info(f"成功下载结果文件: {local_result_heat_map}")
         except Exception as e:
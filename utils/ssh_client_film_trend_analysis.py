@@ -1,10 +1,17 @@
 from utils.file_namer import FileNamer
+from utils.ssh_connection_pool import get_connection_pool
+from utils.transfer_profiles import get_transfer_profile
+from utils.image_transform import get_upload_transform
+from utils.file_archiver import archive_files, unique_file_names
 from dotenv import load_dotenv
 import os
-import paramiko
 import time
 import logging
 import shutil
+import queue
+import collections
+import posixpath
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -23,24 +30,17 @@ class SSHClient:
         self.conda_executable = os.getenv('CONDA_EXECUTABLE_TREND_ANALYSIS')
         self.conda_env_name = os.getenv('CONDA_ENV_NAME_TREND_ANALYSIS')
         self.local_download_dir = "download/trend_analysis"
+        self.upload_concurrency = int(os.getenv('TREND_UPLOAD_CONCURRENCY', 4))  # 并行上传的SFTP通道数
+        self.transfer_profile = get_transfer_profile()  # SFTP传输配置（SSH_TRANSFER_PROFILE）
+        self.upload_transform = get_upload_transform()  # 上传前无损重新编码（UPLOAD_TRANSFORM_ENABLED）
 
     def connect(self):
-        """建立SSH连接"""
+        """从连接池借用SSH连接，并获得本线程专属的SFTP通道"""
         try:
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # 添加超时设置
-            self.ssh.connect(
-                self.host,
-                self.port,
-                self.username,
-                self.password,
-                timeout=30,  # 连接超时30秒
-                banner_timeout=30,  # 横幅超时30秒
-                auth_timeout=30     # 认证超时30秒
-            )
-            self.sftp = self.ssh.open_sftp()
+            self.lease = get_connection_pool().acquire(self.host, self.port, self.username, self.password,
+                                                      profile=self.transfer_profile)
+            self.ssh = self.lease.ssh
+            self.sftp = self.lease.sftp
             logger.info("成功连接到服务器")
         except Exception as e:
             logger.error(f"连接服务器失败: {str(e)}")
@@ -48,29 +48,27 @@ class SSHClient:
             
     
     def close(self):
-        """关闭SSH连接"""
-        try:
-            if hasattr(self, 'sftp') and self.sftp:
-                self.sftp.close()
-                logger.info("SFTP连接已关闭")
-                self.sftp = None  # 标记为已关闭
-        except Exception as e:
-            logger.error(f"关闭SFTP连接时出错: {str(e)}")
-        
+        """将SSH连接归还连接池（连接保持打开以供复用）"""
         try:
-            if hasattr(self, 'ssh') and self.ssh:
-                self.ssh.close()
-                logger.info("SSH连接已关闭")
-                self.ssh = None  # 标记为已关闭
+            if getattr(self, 'lease', None):
+                self.lease.release()
+                logger.info("SSH连接已归还连接池")
         except Exception as e:
-            logger.error(f"关闭SSH连接时出错: {str(e)}")
+            logger.error(f"归还SSH连接时出错: {str(e)}")
+        finally:
+            self.lease = None
+            self.sftp = None  # 标记为已关闭
+            self.ssh = None
 
-    def transfer_images_from_directory(self, dir_path: str) -> str:
+    def transfer_images_from_directory(self, dir_path: str, concurrency: int = None, progress_callback=None) -> str:
         """
         将指定本地文件夹下的所有文件传输到远程服务器以process_id命名的子文件夹中。
+        文件先并行上传到临时文件夹，全部成功后再整体重命名为目标文件夹；任一文件失败则清理临时文件夹，整组上传失败。
 
         Args:
             dir_path (str): 本地存放图片的文件夹路径。
+            concurrency (int): 并行上传的SFTP通道数，默认读取 TREND_UPLOAD_CONCURRENCY。
+            progress_callback: 每个文件上传完成后的回调 progress_callback(已完成数, 总数, 文件名)。
         Returns:
             str: 成功上传后，远程文件夹的完整路径。如果传输失败，则返回 None。
         """
@@ -79,56 +77,164 @@ class SSHClient:
         remote_target_dir = os.path.join(self.remote_image_path).replace('\\', '/')
         logger.info(f"目标远程文件夹路径: {remote_target_dir}")
 
+        # 步骤 2: 遍历本地文件夹，收集需要上传的图片(文件)
+        logger.info(f"正在检查本地文件夹: {dir_path}")
+        logger.info(f"文件夹是否存在: {os.path.exists(dir_path)}")
+        logger.info(f"是否为目录: {os.path.isdir(dir_path)}")
+
+        try:
+            files_to_transfer = []
+            for filename in os.listdir(dir_path):
+                local_file_path = os.path.join(dir_path, filename)
+                # 确保我们只上传文件，跳过任何子文件夹
+                if os.path.isfile(local_file_path):
+                    files_to_transfer.append((local_file_path, filename))
+                else:
+                    logger.warning(f"跳过子目录: {local_file_path}")
+        except Exception as e:
+            logger.error(f"读取本地文件夹失败: {e}")
+            return None
+
+        return self.transfer_files(files_to_transfer, remote_target_dir, concurrency, progress_callback)
+
+    def transfer_files(self, files_to_transfer, remote_target_dir: str, concurrency: int = None, progress_callback=None) -> str:
+        """
+        通过多个SFTP通道并行上传一组文件，整组原子提交
+        Args:
+            files_to_transfer: [(本地文件路径, 远程文件名), ...]
+            remote_target_dir: 远程目标文件夹
+            concurrency: 并行上传的SFTP通道数
+            progress_callback: 进度回调 progress_callback(已完成数, 总数, 文件名)
+        Returns:
+            str: 成功上传后，远程文件夹的完整路径。如果传输失败，则返回 None。
+        """
+        if concurrency is None:
+            concurrency = self.upload_concurrency
+        concurrency = max(1, min(concurrency, len(files_to_transfer) or 1))
+
+        # 先上传到同级的临时文件夹，全部成功后再重命名，避免远程看到不完整的图片组
+        remote_parent_dir, remote_dir_name = posixpath.split(remote_target_dir)
+        staging_dir = posixpath.join(remote_parent_dir, f".{remote_dir_name}.partial")
+
         try:
-            # 步骤 2: 在远程服务器上创建以 process_id 命名的文件夹
-            # 使用 try-except 块来处理文件夹已经存在的情况
             try:
-                self.sftp.mkdir(remote_target_dir)
-                logger.info(f"成功创建远程文件夹: {remote_target_dir}")
+                self.sftp.mkdir(staging_dir)
+                logger.info(f"成功创建远程临时文件夹: {staging_dir}")
             except IOError as e:
                 # 如果文件夹已存在，sftp.mkdir会抛出IOError异常，我们可以忽略它并继续
-                logger.warning(f"创建远程文件夹失败: {remote_target_dir},错误信息: {e}")
+                logger.warning(f"创建远程文件夹失败: {staging_dir},错误信息: {e}")
 
-            # 步骤 3: 遍历本地文件夹并将所有图片(文件)传输到远程文件夹
-            logger.info(f"正在检查本地文件夹: {dir_path}")
-            logger.info(f"文件夹是否存在: {os.path.exists(dir_path)}")
-            logger.info(f"是否为目录: {os.path.isdir(dir_path)}")
-            
-            files_to_transfer = os.listdir(dir_path)
             if not files_to_transfer:
-                logger.warning(f"本地文件夹 {dir_path} 为空，没有文件需要传输。")
-                return remote_target_dir
+                logger.warning("没有文件需要传输。")
+            else:
+                logger.info(f"找到 {len(files_to_transfer)} 个文件，使用 {concurrency} 个SFTP通道并行传输...")
 
-            logger.info(f"在 {dir_path} 中找到 {len(files_to_transfer)} 个项目，准备开始传输...")
+            total = len(files_to_transfer)
+            pending = queue.Queue()
+            for item in files_to_transfer:
+                pending.put(item)
+            failed = threading.Event()
+            errors = []
+            uploaded = []  # 已上传到临时文件夹的远程文件，失败时用于清理
+            counter_lock = threading.Lock()
+            completed = [0]
+            # 重新编码会改写后缀，同名不同后缀的文件（a.bmp 与 a.tif）需保留原后缀（a.bmp.png）以免互相覆盖
+            stem_counts = collections.Counter(os.path.splitext(name)[0] for _, name in files_to_transfer)
+            claimed_names = set(name for _, name in files_to_transfer)
 
-            transferred_count = 0
-            for filename in files_to_transfer:
-                local_file_path = os.path.join(dir_path, filename)
-                
-                # 确保我们只上传文件，跳过任何子文件夹
-                if os.path.isfile(local_file_path):
-                    remote_file_path = os.path.join(remote_target_dir, filename).replace('\\', '/')
-                    
-                    # 执行上传操作
-                    self.sftp.put(local_file_path, remote_file_path)
-                    transferred_count += 1
+            def upload_worker(sftp):
+                while not failed.is_set():
+                    try:
+                        local_file_path, remote_name = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    # 上传前在上传线程中无损重新编码，文件后缀随输出格式改变（趋势预测不缩放）
+                    upload_path = self.upload_transform.prepare(local_file_path)
+                    if upload_path != local_file_path:
+                        stem, ext = os.path.splitext(remote_name)
+                        new_ext = os.path.splitext(upload_path)[1]
+                        if new_ext.lower() != ext.lower():
+                            base = remote_name if stem_counts[stem] > 1 else stem
+                            with counter_lock:
+                                candidate, index = base + new_ext, 1
+                                while candidate in claimed_names:
+                                    candidate = f"{base}_{index}{new_ext}"
+                                    index += 1
+                                claimed_names.add(candidate)
+                            remote_name = candidate
+                    remote_file_path = posixpath.join(staging_dir, remote_name)
+                    try:
+                        # 执行上传操作
+                        self.transfer_profile.put(sftp, upload_path, remote_file_path)
+                    except Exception as e:
+                        errors.append(f"{local_file_path}: {e}")
+                        failed.set()
+                        return
+                    finally:
+                        self.upload_transform.cleanup(local_file_path, upload_path)
+                    with counter_lock:
+                        uploaded.append(remote_file_path)
+                        completed[0] += 1
+                        done = completed[0]
                     logger.info(f"  - 成功: {local_file_path} -> {remote_file_path}")
-                else:
-                    logger.warning(f"跳过子目录: {local_file_path}")
+                    if progress_callback:
+                        progress_callback(done, total, os.path.basename(local_file_path))
+
+            def pooled_worker():
+                # 额外的上传线程各自从连接池借用连接，拿到独立的SFTP通道
+                try:
+                    with get_connection_pool().acquire(self.host, self.port, self.username, self.password,
+                                                      profile=self.transfer_profile) as lease:
+                        upload_worker(lease.sftp)
+                except Exception as e:
+                    errors.append(str(e))
+                    failed.set()
+
+            threads = [threading.Thread(target=pooled_worker, daemon=True) for _ in range(concurrency - 1)]
+            for thread in threads:
+                thread.start()
+            try:
+                upload_worker(self.sftp)  # 当前线程使用自己的SFTP通道
+            except Exception as e:
+                errors.append(str(e))
+                failed.set()
+            finally:
+                # 无论当前线程是否出错都要等其他上传线程结束，避免清理临时文件夹时仍有文件在上传
+                for thread in threads:
+                    thread.join()
+
+            if failed.is_set():
+                raise Exception("; ".join(errors))
+
+            # 全部成功，整体重命名为目标文件夹
+            self.sftp.rename(staging_dir, remote_target_dir)
+            logger.info(f"传输完成！共 {len(uploaded)} 个文件成功上传到 {remote_target_dir}")
 
-            logger.info(f"传输完成！共 {transferred_count} 个文件成功上传到 {remote_target_dir}")
-            
             return remote_target_dir
 
         except Exception as e:
             # 如果在传输过程中发生任何其他错误（如连接断开、权限不足等）
-            # 记录错误并返回 None
+            # 清理临时文件夹，记录错误并返回 None
             logger.error(f"文件传输过程中发生错误: {e}")
+            self.remove_remote_staging(staging_dir)
             return None
+
+    def remove_remote_staging(self, staging_dir: str):
+        """删除上传失败后残留的远程临时文件夹"""
+        try:
+            for filename in self.sftp.listdir(staging_dir):
+                self.sftp.remove(posixpath.join(staging_dir, filename))
+            self.sftp.rmdir(staging_dir)
+            logger.info(f"已清理远程临时文件夹: {staging_dir}")
+        except Exception as e:
+            logger.warning(f"清理远程临时文件夹失败: {staging_dir},错误信息: {e}")
         
-    def download_result(self,dir_path:str) -> str:
+    def download_result(self,dir_path:str = None, named_files = None) -> str:
         """
-        从服务器下载结果文件
+        从服务器下载结果文件，并将原图归档到结果目录
+        Args:
+            dir_path: 原图文件夹路径（按文件夹提交时）
+            named_files: [(原图路径, 文件名), ...]（直接按原始路径提交时），优先链接归档，不支持时后台复制
         Returns:
             str: 本地结果文件路径
         """
@@ -150,14 +256,19 @@ class SSHClient:
 
         # 下载结果可视化文件
         try:
-            # 复制原图文件夹到结果目录
-            shutil.copytree(dir_path, os.path.join(local_result_dir, 'original_images'), dirs_exist_ok=True)
-            logger.info(f"成功复制原图文件夹到结果目录: {os.path.join(local_result_dir, 'original_images')}")
-            self.sftp.get(remotepath=remote_result, localpath=local_result_file)
-            self.sftp.get(remotepath=remote_result_json, localpath=local_result_json)
+            self.transfer_profile.get(self.sftp, remote_result, local_result_file)
+            self.transfer_profile.get(self.sftp, remote_result_json, local_result_json)
             logger.info(f"成功下载结果文件: {local_result_file}")
             logger.info(f"成功下载结果文件: {local_result_json}")
 
+            # 归档原图到结果目录
+            original_images_dir = os.path.join(local_result_dir, 'original_images')
+            if named_files is not None:
+                archive_files(named_files, original_images_dir)
+            elif dir_path:
+                shutil.copytree(dir_path, original_images_dir, dirs_exist_ok=True)
+                logger.info(f"成功复制原图文件夹到结果目录: {original_images_dir}")
+
         except Exception as e:
             logger.error(f"下载结果失败: {e}")
             logger.error(f"远程文件路径: {remote_result}")
@@ -168,11 +279,13 @@ class SSHClient:
 
         return local_result_file, local_result_json
 
-    def process_images(self, dir_path: str):
+    def process_images(self, dir_path: str = None, progress_callback=None, image_paths=None):
         """
         处理图片
         Args:
             dir_path: 图片文件夹路径
+            progress_callback: 上传进度回调 progress_callback(已完成数, 总数, 文件名)
+            image_paths: 图片路径列表，提供时直接从原始路径上传，无需先复制到临时文件夹
         Returns:
             str: 本地结果文件路径
         """
@@ -181,7 +294,14 @@ class SSHClient:
             self.connect()
 
             # 上传图片
-            remote_target_dir = self.transfer_images_from_directory(dir_path)
+            named_files = None
+            if image_paths is not None:
+                named_files = unique_file_names(image_paths)
+                remote_target_dir = self.transfer_files(named_files, self.remote_image_path, progress_callback=progress_callback)
+            else:
+                remote_target_dir = self.transfer_images_from_directory(dir_path, progress_callback=progress_callback)
+            if remote_target_dir is None:
+                raise Exception("图片上传失败")
 
             # 执行Python命令,首先进入工作目录并激活conda环境
             cmd = f'''bash -c 'cd {self.remote_base_path} && \
@@ -209,7 +329,7 @@ class SSHClient:
                 raise Exception("处理超时")
             else:
                 # 下载结果文件
-                pred_file_path, local_result_json = self.download_result(dir_path=dir_path)
+                pred_file_path, local_result_json = self.download_result(dir_path=dir_path, named_files=named_files)
                 
                 return pred_file_path, local_result_json
         except Exception as e:
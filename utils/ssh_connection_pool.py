@@ -0,0 +1,333 @@
+from dotenv import load_dotenv
+import os
+from utils.transfer_profiles import get_transfer_profile
+import time
+import logging
+import threading
+import atexit
+
+logger = logging.getLogger(__name__)
+
+class PooledConnection:
+    """连接池中的一条SSH长连接，可同时借给多个线程，每个借用者独占一个SFTP通道"""
+    def __init__(self, key, ssh, profile):
+        self.key = key
+        self.ssh = ssh
+        self.profile = profile  # 建立连接时使用的传输配置
+        self.created_time = time.time()
+        self.last_used = time.time()
+        self.last_checked = time.time()
+        self.borrowers = 0  # 当前借用者数量
+        self.idle_sftp = []  # 已归还、可复用的SFTP通道
+        self.broken = False  # 使用过程中发现连接异常时标记
+        self.attachments = {}  # 绑定在该连接上的对象（如远程常驻进程），随连接一起关闭
+        self.attachment_lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        """检查底层传输是否仍处于活动状态"""
+        if self.broken:
+            return False
+        transport = self.ssh.get_transport()
+        return bool(transport and transport.is_active() and transport.is_authenticated())
+
+    def probe(self) -> bool:
+        """发送SSH_MSG_IGNORE探测连接是否可用，用于长时间未检查的连接"""
+        try:
+            self.ssh.get_transport().send_ignore()
+            self.last_checked = time.time()
+            return True
+        except Exception as e:
+            logger.warning(f"SSH连接健康检查失败 {self.key[0]}:{self.key[1]}: {str(e)}")
+            self.broken = True
+            return False
+
+    def close(self):
+        """关闭连接及其所有空闲SFTP通道和附属对象"""
+        for attachment in self.attachments.values():
+            try:
+                attachment.close()
+            except Exception:
+                pass
+        self.attachments = {}
+        for sftp in self.idle_sftp:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        self.idle_sftp = []
+        try:
+            self.ssh.close()
+        except Exception as e:
+            logger.error(f"关闭SSH连接时出错: {str(e)}")
+
+class SSHLease:
+    """一次连接借用：持有共享的SSH连接以及借用线程专属的SFTP通道"""
+    def __init__(self, pool, connection, sftp):
+        self.pool = pool
+        self.connection = connection
+        self.ssh = connection.ssh
+        self.profile = connection.profile
+        self.sftp = sftp
+        self.released = False
+
+    def mark_broken(self):
+        """标记连接已损坏，归还时将被关闭并在下次借用时重连"""
+        self.connection.broken = True
+
+    def release(self):
+        """归还连接到连接池"""
+        if not self.released:
+            self.released = True
+            self.pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+class SSHConnectionPool:
+    """
+    线程安全的SSH/SFTP连接池。
+
+    - 按 (host, port, username, 传输配置) 分组，每组最多 max_size_per_host 条连接；
+    - 一条连接最多同时借给 max_sessions_per_connection 个线程，每个借用者拿到自己的SFTP通道；
+    - 启用传输层keepalive，长时间未检查的连接在借出前会做健康检查，失效后自动重连；
+    - 空闲超过 idle_timeout 秒的连接会被关闭。
+    """
+    def __init__(self, max_size_per_host: int = 4, max_sessions_per_connection: int = 4,
+                 keepalive_interval: int = 30, health_check_interval: int = 60,
+                 idle_timeout: int = 600, acquire_timeout: int = 120, connect_retries: int = 3):
+        self.max_size_per_host = max(1, max_size_per_host)
+        self.max_sessions_per_connection = max(1, max_sessions_per_connection)
+        self.keepalive_interval = keepalive_interval
+        self.health_check_interval = health_check_interval
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.connect_retries = max(1, connect_retries)
+        self._cond = threading.Condition()
+        self._connections = {}  # key -> list[PooledConnection]
+        self._connecting = {}   # key -> 正在建立中的连接数
+
+    def acquire(self, host: str, port: int, username: str, password: str, timeout: float = None,
+                profile=None) -> SSHLease:
+        """
+        借用一条连接
+        Args:
+            host: 服务器地址
+            port: 端口
+            username: 用户名
+            password: 密码
+            timeout: 等待可用连接的最长时间（秒），默认使用 acquire_timeout
+            profile: 传输配置（TransferProfile），默认读取 SSH_TRANSFER_PROFILE
+        Returns:
+            SSHLease: 连接借用对象，使用完毕后必须调用 release()
+        """
+        if profile is None:
+            profile = get_transfer_profile()
+        key = (host, port, username, profile.name)
+        deadline = time.time() + (timeout if timeout is not None else self.acquire_timeout)
+
+        while True:
+            connection = self._reserve(key, deadline)
+            if connection is None:
+                # 未能复用已有连接，新建一条
+                connection = self._create_reserved(key, password, profile)
+
+            # 长时间未检查的连接先做健康检查
+            if time.time() - connection.last_checked > self.health_check_interval and not connection.probe():
+                self._discard(connection)
+                continue
+
+            try:
+                sftp = self._take_sftp(connection)
+            except Exception as e:
+                logger.warning(f"打开SFTP通道失败，准备重连: {str(e)}")
+                connection.broken = True
+                self._discard(connection)
+                if time.time() > deadline:
+                    raise
+                continue
+
+            return SSHLease(self, connection, sftp)
+
+    def release(self, lease: SSHLease):
+        """归还借用的连接，SFTP通道留给下一个借用者复用"""
+        connection = lease.connection
+        with self._cond:
+            connection.borrowers -= 1
+            connection.last_used = time.time()
+
+            sftp = lease.sftp
+            if sftp is not None:
+                channel = sftp.get_channel()
+                if connection.is_alive() and channel is not None and not channel.closed \
+                        and len(connection.idle_sftp) < self.max_sessions_per_connection:
+                    connection.idle_sftp.append(sftp)
+                else:
+                    try:
+                        sftp.close()
+                    except Exception:
+                        pass
+
+            if not connection.is_alive():
+                self._remove_locked(connection)
+            self._cond.notify_all()
+
+    def close_all(self):
+        """关闭连接池中的所有连接"""
+        with self._cond:
+            connections = [c for conns in self._connections.values() for c in conns]
+            self._connections = {}
+            self._cond.notify_all()
+        for connection in connections:
+            connection.close()
+        if connections:
+            logger.info(f"连接池已关闭 {len(connections)} 条SSH连接")
+
+    def stats(self) -> dict:
+        """返回各主机的连接数和借用数"""
+        with self._cond:
+            return {
+                f"{key[2]}@{key[0]}:{key[1]} ({key[3]})": {
+                    'connections': len(conns),
+                    'borrowers': sum(c.borrowers for c in conns)
+                }
+                for key, conns in self._connections.items()
+            }
+
+    def _reserve(self, key, deadline):
+        """
+        在锁内挑选可复用的连接并占用一个借用名额。
+        返回 None 表示调用方需要新建连接（名额已预留）。
+        """
+        with self._cond:
+            while True:
+                self._prune_locked(key)
+                connections = self._connections.get(key, [])
+                candidates = [c for c in connections
+                              if c.is_alive() and c.borrowers < self.max_sessions_per_connection]
+                if candidates:
+                    connection = min(candidates, key=lambda c: c.borrowers)
+                    connection.borrowers += 1
+                    return connection
+
+                if len(connections) + self._connecting.get(key, 0) < self.max_size_per_host:
+                    self._connecting[key] = self._connecting.get(key, 0) + 1
+                    return None
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception(f"等待SSH连接超时: {key[0]}:{key[1]} 的连接已全部占用")
+                self._cond.wait(min(remaining, 1.0))
+
+    def _create_reserved(self, key, password, profile):
+        """建立新连接并加入连接池，失败时按退避策略重试"""
+        try:
+            last_error = None
+            for attempt in range(1, self.connect_retries + 1):
+                try:
+                    ssh = self._open_ssh(key, password, profile)
+                    break
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"建立SSH连接失败 (第{attempt}/{self.connect_retries}次): {str(e)}")
+                    if attempt < self.connect_retries:
+                        time.sleep(min(2 ** (attempt - 1), 5))
+            else:
+                raise last_error
+        except Exception:
+            with self._cond:
+                self._connecting[key] -= 1
+                self._cond.notify_all()
+            raise
+
+        connection = PooledConnection(key, ssh, profile)
+        connection.borrowers = 1
+        with self._cond:
+            self._connecting[key] -= 1
+            self._connections.setdefault(key, []).append(connection)
+            total = len(self._connections[key])
+        logger.info(f"连接池新建SSH连接 {key[0]}:{key[1]} (传输配置 {profile.name}, 当前 {total}/{self.max_size_per_host})")
+        return connection
+
+    def _open_ssh(self, key, password, profile):
+        """建立一条SSH连接，窗口、包大小、加密算法和压缩按传输配置设置"""
+        # paramiko（及cryptography）在第一次建立连接时才导入，界面和守护进程启动时不加载
+        import paramiko
+        host, port, username = key[:3]
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(
+            host,
+            port,
+            username,
+            password,
+            timeout=30,  # 连接超时30秒
+            banner_timeout=30,  # 横幅超时30秒
+            auth_timeout=30,    # 认证超时30秒
+            **profile.connect_kwargs()
+        )
+        if self.keepalive_interval > 0:
+            ssh.get_transport().set_keepalive(self.keepalive_interval)
+        return ssh
+
+    def _take_sftp(self, connection):
+        """取出一个空闲SFTP通道，没有则新开一个"""
+        with self._cond:
+            while connection.idle_sftp:
+                sftp = connection.idle_sftp.pop()
+                channel = sftp.get_channel()
+                if channel is not None and not channel.closed:
+                    return sftp
+        return connection.ssh.open_sftp()
+
+    def _discard(self, connection):
+        """放弃一条已借出但不可用的连接"""
+        with self._cond:
+            connection.borrowers -= 1
+            connection.broken = True
+            self._remove_locked(connection)
+            self._cond.notify_all()
+
+    def _remove_locked(self, connection):
+        """从连接池移除连接，无人借用时立即关闭"""
+        connections = self._connections.get(connection.key, [])
+        if connection in connections:
+            connections.remove(connection)
+            logger.info(f"连接池移除失效SSH连接 {connection.key[0]}:{connection.key[1]}")
+        if connection.borrowers <= 0:
+            connection.close()
+
+    def _prune_locked(self, key):
+        """清理失效连接和空闲过久的连接"""
+        now = time.time()
+        for connection in list(self._connections.get(key, [])):
+            if connection.borrowers > 0:
+                continue
+            if not connection.is_alive() or now - connection.last_used > self.idle_timeout:
+                self._connections[key].remove(connection)
+                connection.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_connection_pool() -> SSHConnectionPool:
+    """
+    获取进程内共享的连接池，参数从环境变量读取
+    Returns:
+        SSHConnectionPool: 全局连接池
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            load_dotenv()
+            _pool = SSHConnectionPool(
+                max_size_per_host=int(os.getenv('SSH_POOL_MAX_SIZE_PER_HOST', 4)),
+                max_sessions_per_connection=int(os.getenv('SSH_POOL_MAX_SESSIONS_PER_CONNECTION', 4)),
+                keepalive_interval=int(os.getenv('SSH_POOL_KEEPALIVE_INTERVAL', 30)),
+                health_check_interval=int(os.getenv('SSH_POOL_HEALTH_CHECK_INTERVAL', 60)),
+                idle_timeout=int(os.getenv('SSH_POOL_IDLE_TIMEOUT', 600)),
+            )
+            atexit.register(_pool.close_all)
+        return _pool
@@ -0,0 +1,89 @@
+import sys
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+class StartupProfiler:
+    """
+    界面启动耗时分析（--profile-startup）：
+    包装 __import__ 记录主线程中首次导入各模块的耗时（含其依赖，按嵌套层级缩进），
+    并记录主窗口、各标签页等构建阶段的耗时，启动完成后输出到标准输出。
+    """
+    def __init__(self, max_depth: int = 2, min_ms: float = 1.0):
+        """
+        Args:
+            max_depth: 输出的最大导入嵌套层级（0为启动代码直接导入的模块）
+            min_ms: 低于该耗时（毫秒）的导入不输出
+        """
+        self.enabled = False
+        self.max_depth = max_depth
+        self.min_ms = min_ms
+        self.start_time = time.perf_counter()
+        self.imports = []  # (开始顺序, 层级, 模块名, 耗时秒)
+        self.phases = []  # (阶段名, 耗时秒)
+        self.depth = 0
+        self.reported = False
+        self.original_import = None
+        self.main_thread = threading.get_ident()
+
+    def enable(self):
+        """开始记录导入耗时，需在导入PyQt和各界面模块之前调用"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules or threading.get_ident() != self.main_thread:
+            return self.original_import(name, globals, locals, fromlist, level)
+        index = len(self.imports)
+        self.imports.append(None)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.depth -= 1
+            self.imports[index] = (self.depth, name, time.perf_counter() - start)
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个构建阶段的耗时；启动报告输出之后的阶段（例如首次切换标签页）单独输出"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases.append((name, elapsed))
+            if self.reported:
+                print(f"[startup] {name}: {elapsed * 1000:.1f} ms", flush=True)
+
+    def report(self):
+        """输出启动耗时：导入明细、各构建阶段和总耗时"""
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        builtins.__import__ = self.original_import
+        total = time.perf_counter() - self.start_time
+        lines = ["[startup] 导入耗时:"]
+        for item in self.imports:
+            if item is None:
+                continue
+            depth, name, elapsed = item
+            if depth <= self.max_depth and elapsed * 1000 >= self.min_ms:
+                lines.append(f"[startup]   {'  ' * depth}{name}: {elapsed * 1000:.1f} ms")
+        import_total = sum(elapsed for depth, name, elapsed in filter(None, self.imports) if depth == 0)
+        lines.append(f"[startup] 导入合计: {import_total * 1000:.1f} ms")
+        lines.append("[startup] 构建耗时:")
+        for name, elapsed in self.phases:
+            lines.append(f"[startup]   {name}: {elapsed * 1000:.1f} ms")
+        lines.append(f"[startup] 启动到事件循环总耗时: {total * 1000:.1f} ms")
+        print('\n'.join(lines), flush=True)
+
+startup_profiler = StartupProfiler()
@@ -0,0 +1,244 @@
+from dotenv import load_dotenv
+import os
+import json
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 异常级别从轻到重，合并分块结果时取最严重的级别
+ANOMALY_LEVEL_ORDER = ['正常', '低异常可能性', '中等异常可能性', '很可能异常']
+
+def compute_tiles(width: int, tile_width: int, overlap: int) -> list:
+    """
+    沿宽度方向计算相互重叠的分块区间
+    Args:
+        width: 图片宽度
+        tile_width: 分块宽度
+        overlap: 相邻分块的重叠宽度
+    Returns:
+        list: [(x0, x1), ...]，最后一块与图片右边缘对齐
+    """
+    if width <= tile_width:
+        return [(0, width)]
+    stride = max(1, tile_width - overlap)
+    starts = list(range(0, width - tile_width, stride))
+    starts.append(width - tile_width)
+    return [(x0, x0 + tile_width) for x0 in starts]
+
+def blend_weights(tiles: list, index: int):
+    """
+    分块的融合权重：与相邻分块重叠的部分线性过渡，其余部分为1
+    Args:
+        tiles: compute_tiles 的结果
+        index: 分块序号
+    Returns:
+        numpy.ndarray: 长度为分块宽度的一维权重
+    """
+    import numpy as np
+    x0, x1 = tiles[index]
+    weights = np.ones(x1 - x0, dtype=np.float32)
+    if index > 0:
+        left_overlap = tiles[index - 1][1] - x0
+        if left_overlap > 0:
+            weights[:left_overlap] = np.linspace(0, 1, left_overlap + 2, dtype=np.float32)[1:-1]
+    if index < len(tiles) - 1:
+        right_overlap = x1 - tiles[index + 1][0]
+        if right_overlap > 0:
+            weights[-right_overlap:] = np.minimum(
+                weights[-right_overlap:], np.linspace(1, 0, right_overlap + 2, dtype=np.float32)[1:-1])
+    return weights
+
+def stitch_tiles(tile_image_paths: list, tiles: list, full_size: tuple, output_path: str):
+    """
+    将各分块的结果图按重叠区加权平均拼接为整图。
+    按分块边界把整图切成若干竖条逐条写入 uint8 整图：只有一块覆盖的竖条直接拷贝，
+    重叠竖条才按权重做浮点融合，内存中同时只保留覆盖当前竖条的分块，
+    不再为整图分配 float32 累加缓冲（31901x1000 RGBA 时约 510 MB）。
+    Args:
+        tile_image_paths: 各分块结果图路径，与 tiles 一一对应
+        tiles: 分块区间（按 x0 升序，compute_tiles 的结果）
+        full_size: 原图尺寸 (宽, 高)
+        output_path: 拼接结果保存路径
+    """
+    import numpy as np
+    from PIL import Image
+    width, height = full_size
+    with Image.open(tile_image_paths[0]) as first_image:
+        mode = 'RGBA' if first_image.mode in ('RGBA', 'LA', 'P') else 'RGB'
+    stitched = Image.new(mode, (width, height))
+
+    def load_tile(index):
+        x0, x1 = tiles[index]
+        with Image.open(tile_image_paths[index]) as tile_image:
+            tile_image = tile_image.convert(mode)
+            # 远程结果图尺寸可能与分块不同，先还原到分块尺寸
+            if tile_image.size != (x1 - x0, height):
+                tile_image = tile_image.resize((x1 - x0, height), Image.Resampling.BILINEAR)
+            return np.asarray(tile_image, dtype=np.uint8)
+
+    edges = sorted({edge for tile in tiles for edge in tile if 0 <= edge <= width})
+    loaded = {}  # 分块序号 -> (uint8 数组, 融合权重)
+    next_index = 0
+    for a, b in zip(edges, edges[1:]):
+        while next_index < len(tiles) and tiles[next_index][0] < b:
+            loaded[next_index] = (load_tile(next_index), blend_weights(tiles, next_index))
+            next_index += 1
+        for index in [index for index in loaded if tiles[index][1] <= a]:
+            del loaded[index]
+        covering = [index for index in loaded if tiles[index][0] <= a and tiles[index][1] >= b]
+        if not covering:
+            continue
+        if len(covering) == 1:
+            x0 = tiles[covering[0]][0]
+            band = loaded[covering[0]][0][:, a - x0:b - x0]
+        else:
+            accumulator = None
+            weight_sum = np.zeros(b - a, dtype=np.float32)
+            for index in covering:
+                x0 = tiles[index][0]
+                tile_array, weights = loaded[index]
+                band_weights = weights[a - x0:b - x0]
+                contribution = tile_array[:, a - x0:b - x0].astype(np.float32) * band_weights[None, :, None]
+                accumulator = contribution if accumulator is None else accumulator + contribution
+                weight_sum += band_weights
+            accumulator /= np.maximum(weight_sum, 1e-6)[None, :, None]
+            band = np.clip(accumulator + 0.5, 0, 255).astype(np.uint8)
+        stitched.paste(Image.fromarray(np.ascontiguousarray(band), mode), (a, 0))
+    stitched.save(output_path)
+
+# 异常分值字段：同级别的分块之间按分值择优
+ANOMALY_SCORE_FIELDS = ('anomaly_score', 'score')
+
+def merge_tile_results(tile_results: list, tiles: list) -> dict:
+    """
+    合并各分块的JSON结果：取异常级别最严重（同级别时异常分值最高）的分块作为代表，
+    整图的级别、分值、电压等字段都取自该分块，不对各字段分别取最大值
+    （避免把不同分块的数值拼成一个并不存在的结果），各分块的明细附在 tiles 中
+    Args:
+        tile_results: 各分块的JSON数据
+        tiles: 分块区间
+    Returns:
+        dict: 合并后的结果
+    """
+    def anomaly_score(data):
+        for key in ANOMALY_SCORE_FIELDS:
+            value = data.get(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+        return None
+
+    def severity(data):
+        level = data.get('anomaly_level', '')
+        rank = ANOMALY_LEVEL_ORDER.index(level) if level in ANOMALY_LEVEL_ORDER else -1
+        score = anomaly_score(data)
+        return rank, float('-inf') if score is None else score
+
+    merged = dict(max(tile_results, key=severity))
+    merged['tiled'] = True
+    merged['tiles'] = [
+        {'x0': x0, 'x1': x1, 'anomaly_level': data.get('anomaly_level', ''),
+         'anomaly_score': anomaly_score(data), 'analog_voltage': data.get('analog_voltage')}
+        for (x0, x1), data in zip(tiles, tile_results)
+    ]
+    return merged
+
+class TiledInference:
+    """
+    超长图片（31901x1000）分块推理：本地切成相互重叠的分块，经连接池（可分布到多台主机）并行提交，
+    再将各分块的预测图、热力图拼接为整图，并合并各分块的 result.json。
+    """
+    def __init__(self, tile_width: int = 4000, overlap: int = 256, concurrency: int = 4,
+                 script_name: str = "api_v3_http.py", hosts: list = None, work_dir: str = "temp/tiles"):
+        self.tile_width = tile_width
+        self.overlap = overlap
+        self.concurrency = max(1, concurrency)
+        self.script_name = script_name
+        self.hosts = hosts or []  # [(host, port), ...]，为空时全部使用默认主机
+        self.work_dir = work_dir
+
+    def process(self, image_path: str, process_id: str, local_result_dir: str, client_factory) -> tuple[str, str, str]:
+        """
+        分块处理一张图片
+        Args:
+            image_path: 本地图片路径
+            process_id: 整图的处理ID
+            local_result_dir: 整图结果目录
+            client_factory: 创建分块SSH客户端的函数（每个分块一个新的处理ID）
+        Returns:
+            tuple[str, str, str]: (本地预测图路径, 本地热力图路径, 本地JSON文件路径)
+        """
+        from PIL import Image
+        tile_dir = os.path.join(self.work_dir, process_id)
+        os.makedirs(tile_dir, exist_ok=True)
+        try:
+            with Image.open(image_path) as img:
+                full_size = img.size
+                tiles = compute_tiles(full_size[0], self.tile_width, self.overlap)
+                tile_paths = []
+                for index, (x0, x1) in enumerate(tiles):
+                    tile_path = os.path.join(tile_dir, f"tile_{index:03d}.png")
+                    img.crop((x0, 0, x1, full_size[1])).save(tile_path, compress_level=1)
+                    tile_paths.append(tile_path)
+            logger.info(f"分块推理 {os.path.basename(image_path)}: {len(tiles)} 块 (宽 {self.tile_width}, 重叠 {self.overlap})，并发 {self.concurrency}")
+
+            lock = threading.Lock()
+            completed = [0]
+
+            def run_tile(index):
+                client = client_factory()
+                client.local_download_dir = tile_dir
+                if self.hosts:
+                    client.host, client.port = self.hosts[index % len(self.hosts)]
+                result = client.process_tile(tile_paths[index], self.script_name)
+                with lock:
+                    completed[0] += 1
+                    logger.info(f"分块推理进度: {completed[0]}/{len(tiles)}")
+                return result
+
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(tiles))) as executor:
+                tile_outputs = list(executor.map(run_tile, range(len(tiles))))
+
+            os.makedirs(local_result_dir, exist_ok=True)
+            local_result_pre_image = os.path.join(local_result_dir, 'prediction.png')
+            local_result_heat_map = os.path.join(local_result_dir, 'heat_map.png')
+            local_result_json = os.path.join(local_result_dir, 'result.json')
+
+            stitch_tiles([output[0] for output in tile_outputs], tiles, full_size, local_result_pre_image)
+            stitch_tiles([output[1] for output in tile_outputs], tiles, full_size, local_result_heat_map)
+            tile_results = []
+            for output in tile_outputs:
+                with open(output[2], 'r', encoding='utf-8') as f:
+                    tile_results.append(json.load(f))
+            with open(local_result_json, 'w', encoding='utf-8') as f:
+                json.dump(merge_tile_results(tile_results, tiles), f, ensure_ascii=False, indent=2)
+            shutil.copy(image_path, os.path.join(local_result_dir, os.path.basename(image_path)))
+            logger.info(f"分块结果拼接完成: {local_result_dir}")
+            return local_result_pre_image, local_result_heat_map, local_result_json
+        finally:
+            shutil.rmtree(tile_dir, ignore_errors=True)
+
+def get_tiled_inference() -> TiledInference:
+    """
+    按 .env 配置创建分块推理，未启用时返回 None
+    Returns:
+        TiledInference: 分块推理
+    """
+    load_dotenv()
+    if os.getenv('ANOMALY_TILED_MODE', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    hosts = []
+    for item in os.getenv('ANOMALY_TILED_HOSTS', '').split(','):
+        item = item.strip()
+        if item:
+            host, _, port = item.partition(':')
+            hosts.append((host, int(port or 22)))
+    return TiledInference(
+        tile_width=int(os.getenv('ANOMALY_TILE_WIDTH', 4000)),
+        overlap=int(os.getenv('ANOMALY_TILE_OVERLAP', 256)),
+        concurrency=int(os.getenv('ANOMALY_TILE_CONCURRENCY', 4)),
+        script_name=os.getenv('ANOMALY_TILE_SCRIPT', 'api_v3_http.py'),
+        hosts=hosts,
+    )
@@ -0,0 +1,134 @@
+from dotenv import load_dotenv
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TransferProfile:
+    """
+    SFTP传输参数组合：SSH通道窗口和最大包大小、上传流水线写、下载预读、加密算法偏好和传输层压缩。
+    连接参数（窗口、包大小、加密算法、压缩）在建立连接时生效，put/get 参数在每次传输时生效。
+    """
+    def __init__(self, name: str, window_size: int, max_packet_size: int, pipelined_put: bool = True,
+                 confirm_put: bool = True, prefetch_get: bool = True, max_concurrent_prefetch_requests: int = None,
+                 ciphers: tuple = (), compress: bool = False):
+        self.name = name
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.pipelined_put = pipelined_put  # 上传时不等待每个写请求的确认
+        self.confirm_put = confirm_put  # 上传完成后stat核对文件大小（多一次往返）
+        self.prefetch_get = prefetch_get  # 下载时预先发出读请求
+        self.max_concurrent_prefetch_requests = max_concurrent_prefetch_requests  # 预读并发请求上限，None为不限制
+        self.ciphers = tuple(ciphers)  # 加密算法偏好顺序，空表示使用paramiko默认顺序
+        self.compress = compress  # 传输层压缩（PNG本身已压缩，通常只在慢速链路传JSON时有益）
+
+    def connect_kwargs(self) -> dict:
+        """传给 paramiko.SSHClient.connect 的额外参数"""
+        return {'compress': self.compress, 'transport_factory': self.create_transport}
+
+    def create_transport(self, sock, **kwargs):
+        """按配置创建 paramiko.Transport：设置默认窗口、包大小和加密算法偏好"""
+        import paramiko
+        transport = paramiko.Transport(
+            sock,
+            default_window_size=self.window_size,
+            default_max_packet_size=self.max_packet_size,
+            **kwargs
+        )
+        if self.ciphers:
+            security_options = transport.get_security_options()
+            available = security_options.ciphers
+            preferred = [cipher for cipher in self.ciphers if cipher in available]
+            if preferred:
+                security_options.ciphers = tuple(preferred) + tuple(c for c in available if c not in preferred)
+        return transport
+
+    def put(self, sftp, localpath: str, remotepath: str, callback=None):
+        """按配置上传文件"""
+        file_size = os.stat(localpath).st_size
+        with open(localpath, 'rb') as local_file:
+            with sftp.file(remotepath, 'wb') as remote_file:
+                remote_file.set_pipelined(self.pipelined_put)
+                transferred = 0
+                while True:
+                    data = local_file.read(32768)
+                    if not data:
+                        break
+                    remote_file.write(data)
+                    transferred += len(data)
+                    if callback is not None:
+                        callback(transferred, file_size)
+        if self.confirm_put:
+            remote_size = sftp.stat(remotepath).st_size
+            if remote_size != file_size:
+                raise IOError(f"上传文件大小不一致 {remote_size} != {file_size}")
+
+    def get(self, sftp, remotepath: str, localpath: str, callback=None):
+        """按配置下载文件"""
+        sftp.get(
+            remotepath,
+            localpath,
+            callback=callback,
+            prefetch=self.prefetch_get,
+            max_concurrent_prefetch_requests=self.max_concurrent_prefetch_requests
+        )
+
+# 内置传输配置
+# default: paramiko默认参数（2MB窗口、32KB包）
+# lan:     局域网，低延迟，优先选择开销小的AES-GCM
+# wan:     广域网，高延迟，放大窗口并限制预读并发避免拥塞
+# bulk:    大批量下载，最大窗口和预读并发
+TRANSFER_PROFILES = {
+    'default': TransferProfile('default', window_size=2 * 1024 * 1024, max_packet_size=32768,
+                               pipelined_put=True, confirm_put=True, prefetch_get=True),
+    'lan': TransferProfile('lan', window_size=4 * 1024 * 1024, max_packet_size=32768,
+                           pipelined_put=True, confirm_put=True, prefetch_get=True,
+                           ciphers=('aes128-gcm@openssh.com', 'aes128-ctr')),
+    'wan': TransferProfile('wan', window_size=16 * 1024 * 1024, max_packet_size=32768,
+                           pipelined_put=True, confirm_put=True, prefetch_get=True,
+                           max_concurrent_prefetch_requests=64,
+                           ciphers=('aes128-gcm@openssh.com', 'aes128-ctr', 'aes256-gcm@openssh.com')),
+    'bulk': TransferProfile('bulk', window_size=64 * 1024 * 1024, max_packet_size=32768,
+                            pipelined_put=True, confirm_put=False, prefetch_get=True,
+                            max_concurrent_prefetch_requests=128,
+                            ciphers=('aes128-gcm@openssh.com', 'aes128-ctr')),
+}
+
+def get_transfer_profile(name: str = None) -> TransferProfile:
+    """
+    获取传输配置，名称默认读取 SSH_TRANSFER_PROFILE，并应用 .env 中的单项覆盖
+    Args:
+        name: 配置名称（default/lan/wan/bulk）
+    Returns:
+        TransferProfile: 传输配置
+    """
+    load_dotenv()
+    name = (name or os.getenv('SSH_TRANSFER_PROFILE', 'default')).lower()
+    base = TRANSFER_PROFILES.get(name)
+    if base is None:
+        logger.warning(f"未知的传输配置 {name}，使用 default")
+        base = TRANSFER_PROFILES['default']
+
+    window_size = os.getenv('SSH_TRANSFER_WINDOW_SIZE')
+    max_packet_size = os.getenv('SSH_TRANSFER_MAX_PACKET_SIZE')
+    prefetch_requests = os.getenv('SSH_TRANSFER_PREFETCH_REQUESTS')
+    ciphers = os.getenv('SSH_TRANSFER_CIPHERS')
+    compress = os.getenv('SSH_TRANSFER_COMPRESS')
+    if not any((window_size, max_packet_size, prefetch_requests, ciphers, compress)):
+        return base
+
+    # 有单项覆盖时生成新的配置，名称中带上覆盖值，使连接池按不同参数区分连接
+    profile = TransferProfile(
+        base.name,
+        window_size=int(window_size) if window_size else base.window_size,
+        max_packet_size=int(max_packet_size) if max_packet_size else base.max_packet_size,
+        pipelined_put=base.pipelined_put,
+        confirm_put=base.confirm_put,
+        prefetch_get=base.prefetch_get,
+        max_concurrent_prefetch_requests=int(prefetch_requests) if prefetch_requests else base.max_concurrent_prefetch_requests,
+        ciphers=tuple(c.strip() for c in ciphers.split(',') if c.strip()) if ciphers else base.ciphers,
+        compress=compress.lower() in ('1', 'true', 'yes') if compress else base.compress,
+    )
+    profile.name = (f"{base.name}:{profile.window_size}:{profile.max_packet_size}:{profile.max_concurrent_prefetch_requests}:"
+                    f"{','.join(profile.ciphers)}:{profile.compress}")
+    return profile
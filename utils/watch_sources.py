@@ -0,0 +1,233 @@
+from utils.directory_index import DirectoryIndex
+from utils.folder_watcher import InotifyWatcher
+from utils.checkpoint_journal import open_checkpoint_journal
+from utils.anomaly_rules import create_rule_engine
+from dotenv import load_dotenv
+import os
+import re
+import json
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SOURCE_SEPARATOR = '__'  # 多文件夹时检查点命名为 <时间戳>__<文件夹名>.json
+
+class WatchSource:
+    """
+    一个监控文件夹及其独立状态：检查点、增量索引、inotify监控、连续异常规则和待处理队列。
+    优先级高的文件夹优先处理，同一优先级内按权重分配远程处理能力。
+    """
+    def __init__(self, directory: str, name: str = None, weight: float = 1.0, priority: int = 0):
+        """
+        Args:
+            directory: 监控文件夹
+            name: 文件夹名称（用于日志和检查点文件名），默认取文件夹名
+            weight: 同一优先级内的处理权重
+            priority: 优先级，数值大的优先
+        """
+        self.directory = directory
+        self.name = name or re.sub(r'[^\w\-]+', '_', os.path.basename(os.path.normpath(directory))) or 'source'
+        self.weight = max(float(weight), 0.001)
+        self.priority = int(priority)
+        self.processed_images = {}  # 图片路径 -> 处理信息
+        self.failed_images = set()  # 处理失败、下一轮扫描时重试的图片
+        self.pending = deque()  # 已发现、等待调度的图片
+        self.queued = set()  # pending 中的图片，用于去重
+        self.checkpoint_journal = None
+        self.directory_index = None
+        self.scan_cursor = 0
+        self.watcher = None
+        self.last_scan_time = 0
+        self.start_tag = 0.0  # 加权公平调度中队首图片的虚拟开始时间
+        self.anomaly_rules = None
+
+    def open(self, checkpoint_file: str = None, use_inotify: bool = True,
+             anomalies_dir: str = "temp/consecutive_anomalies"):
+        """
+        加载检查点、创建连续异常规则，并尽量启用inotify监控
+        Args:
+            checkpoint_file: 本文件夹的检查点快照路径，为 None 时不保存检查点
+            use_inotify: 是否尝试inotify事件驱动监控
+            anomalies_dir: 连续异常记录保存目录
+        """
+        if checkpoint_file:
+            try:
+                self.checkpoint_journal = open_checkpoint_journal(checkpoint_file)
+                self.processed_images = self.checkpoint_journal.processed_images
+                logger.info(f"[{self.name}] 加载检查点，已处理 {len(self.processed_images)} 张图片")
+            except Exception as e:
+                logger.error(f"[{self.name}] 加载检查点失败: {str(e)}")
+        self.anomaly_rules = create_rule_engine(self.directory, anomalies_dir, self.name)
+        if use_inotify and os.path.isdir(self.directory):
+            watcher = InotifyWatcher(self.directory)
+            if watcher.start():
+                self.watcher = watcher
+        if self.watcher is None:
+            logger.info(f"[{self.name}] 使用轮询方式监控文件夹: {self.directory}")
+
+    def scan_due(self, polling_interval: float, rescan_interval: float) -> bool:
+        """是否需要全量（增量索引）扫描：轮询模式按轮询间隔，inotify模式只在启动、事件溢出和定期兜底时扫描"""
+        return self.seconds_until_scan(polling_interval, rescan_interval) <= 0
+
+    def seconds_until_scan(self, polling_interval: float, rescan_interval: float) -> float:
+        """距离下一次全量扫描的秒数（已到期时为0）"""
+        if self.watcher is not None and self.watcher.overflowed:
+            return 0.0
+        interval = polling_interval if self.watcher is None else rescan_interval
+        if self.directory_index is not None and self.directory_index.unsettled:
+            # 扫描时仍在写入的图片（例如监控启动前开始写入、收不到inotify事件）在稳定后尽快重新扫描
+            interval = min(interval, self.directory_index.settle_time)
+        return max(0.0, self.last_scan_time + interval - time.time())
+
+    def fileno(self):
+        """inotify监控的文件描述符，可用于 select 等待新事件；轮询模式返回 None"""
+        return self.watcher.fd if self.watcher is not None else None
+
+    def scan(self) -> list:
+        """
+        增量扫描：返回上次扫描之后新增的图片（首次扫描返回全部，按创建时间排序），
+        以及上一轮处理失败、需要重试的图片
+        """
+        self.last_scan_time = time.time()
+        if self.watcher is not None:
+            self.watcher.overflowed = False
+        try:
+            if not os.path.exists(self.directory):
+                logger.warning(f"监控文件夹不存在: {self.directory}")
+                return []
+            if self.directory_index is None:
+                self.directory_index = DirectoryIndex(self.directory)
+                self.scan_cursor = 0
+            self.directory_index.refresh()
+            image_files, self.scan_cursor = self.directory_index.entries_since(self.scan_cursor)
+
+            retry_images = [img for img in self.failed_images if os.path.exists(img)]
+            self.failed_images.clear()
+            return retry_images + image_files
+        except Exception as e:
+            logger.error(f"[{self.name}] 扫描图片失败: {str(e)}")
+            return []
+
+    def read_events(self) -> list:
+        """读取已到达的inotify事件（不等待），监控失效时退回轮询"""
+        if self.watcher is None:
+            return []
+        paths = self.watcher.read_events(0)
+        if self.watcher.fd is None:
+            logger.warning(f"[{self.name}] inotify监控已失效，退回轮询")
+            self.watcher = None
+            # 失效前后可能漏掉事件，立即补一次扫描
+            self.last_scan_time = 0
+        return paths
+
+    def record_processed(self, image_info: dict):
+        """记录一张已处理的图片并向检查点日志追加一行"""
+        self.processed_images[image_info['file_path']] = image_info
+        if self.checkpoint_journal is None:
+            return
+        try:
+            self.checkpoint_journal.append(image_info)
+        except Exception as e:
+            logger.error(f"[{self.name}] 更新检查点失败: {str(e)}")
+
+    def close(self):
+        """停止监控，保存索引并压缩检查点"""
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        if self.directory_index is not None:
+            self.directory_index.close()
+        if self.checkpoint_journal is not None:
+            self.checkpoint_journal.close()
+
+class WeightedFairScheduler:
+    """
+    多个监控文件夹之间的调度：先按优先级，同一优先级内按开始时间公平排队（队首虚拟开始时间最小者优先，
+    每取出一张图片该文件夹的虚拟时间前进 1/权重），
+    权重为2的文件夹在积压时得到权重为1的文件夹两倍的处理份额，空闲文件夹不会积攒额度。
+    """
+    def __init__(self, sources: list):
+        self.sources = sources
+        self.virtual_time = 0.0
+
+    def enqueue(self, source: WatchSource, image_paths: list) -> list:
+        """
+        将新发现的图片放入文件夹的待处理队列
+        Returns:
+            list: 实际入队的图片（已在队列中的跳过）
+        """
+        added = [path for path in image_paths if path not in source.queued]
+        if added and not source.pending:
+            # 从空闲变为积压：从当前虚拟时间开始，不补发空闲期间的份额
+            source.start_tag = max(self.virtual_time, source.start_tag)
+        source.pending.extend(added)
+        source.queued.update(added)
+        return added
+
+    def has_pending(self) -> bool:
+        return any(source.pending for source in self.sources)
+
+    def next(self):
+        """
+        取出下一张应处理的图片
+        Returns:
+            tuple: (WatchSource, 图片路径)，没有待处理图片时返回 None
+        """
+        backlogged = [source for source in self.sources if source.pending]
+        if not backlogged:
+            return None
+        top_priority = max(source.priority for source in backlogged)
+        source = min((source for source in backlogged if source.priority == top_priority),
+                     key=lambda source: source.start_tag)
+        self.virtual_time = source.start_tag
+        source.start_tag += 1.0 / source.weight
+        image_path = source.pending.popleft()
+        source.queued.discard(image_path)
+        return source, image_path
+
+def source_checkpoint_file(checkpoint_file: str, source: WatchSource, multiple: bool) -> str:
+    """
+    由本次批处理选择的检查点得到各文件夹的检查点：只有一个文件夹时就是该文件本身（与原格式一致），
+    多个文件夹时为 <时间戳>__<文件夹名>.json
+    """
+    if not checkpoint_file or not multiple:
+        return checkpoint_file
+    base, ext = os.path.splitext(checkpoint_file)
+    return f"{base.split(SOURCE_SEPARATOR)[0]}{SOURCE_SEPARATOR}{source.name}{ext}"
+
+def checkpoint_session(filename: str) -> str:
+    """检查点文件所属的批处理会话（<时间戳>.json）"""
+    base, ext = os.path.splitext(filename)
+    return base.split(SOURCE_SEPARATOR)[0] + ext
+
+def load_watch_sources() -> list:
+    """
+    按 .env 配置创建监控文件夹列表：
+    ONLINE_PROCESSING_AD_DIRS 为JSON列表，元素为路径或 {"dir", "name", "weight", "priority"}；
+    未配置时使用单个 ONLINE_PROCESSING_AD_DIR
+    Returns:
+        list: WatchSource 列表
+    """
+    load_dotenv()
+    sources_env = os.getenv('ONLINE_PROCESSING_AD_DIRS', '')
+    if sources_env:
+        sources = []
+        for spec in json.loads(sources_env):
+            if isinstance(spec, str):
+                spec = {'dir': spec}
+            sources.append(WatchSource(spec['dir'], spec.get('name'), spec.get('weight', 1.0), spec.get('priority', 0)))
+    else:
+        processing_dir = os.getenv('ONLINE_PROCESSING_AD_DIR')
+        sources = [WatchSource(processing_dir)] if processing_dir else []
+
+    # 名称重复时加序号，保证各文件夹的检查点文件互不覆盖
+    seen = {}
+    for source in sources:
+        if source.name in seen:
+            seen[source.name] += 1
+            source.name = f"{source.name}_{seen[source.name]}"
+        else:
+            seen[source.name] = 1
+    return sources